@@ -0,0 +1,69 @@
+"""
+PingDiff batch statistics benchmark
+
+Times the per-result statistics (statistics.mean + calculate_jitter, as
+_build_result does them) against batch_stats with and without NumPy.
+
+Usage: python benchmarks/bench_batch_stats.py [series ...]
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from batch_stats import HAS_NUMPY, batch_stats  # noqa: E402
+from ping_tester import calculate_jitter  # noqa: E402
+
+SIZES = (1_000, 100_000)
+PINGS = 10
+
+
+def make_series(count: int, pings: int = PINGS, seed: int = 1):
+    """Ragged RTT series with some loss, like a large scan."""
+    rng = random.Random(seed)
+    series, sent = [], []
+    for _ in range(count):
+        base = rng.uniform(5, 250)
+        series.append([base + rng.expovariate(0.5) for _ in range(pings) if rng.random() > 0.05])
+        sent.append(pings)
+    return series, sent
+
+
+def per_result(series, sent):
+    out = []
+    for times, total in zip(series, sent):
+        if times:
+            ordered = sorted(times)
+            out.append((statistics.mean(times), min(times), max(times),
+                        calculate_jitter(times), ordered[len(ordered) // 2],
+                        (total - len(times)) / total * 100))
+    return out
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print(f"{'Series':>8}  {'Per result':>11}  {'Batch':>9}  {'NumPy':>9}  {'Speedup':>8}")
+    for size in sizes:
+        series, sent = make_series(size)
+        base = timed(per_result, series, sent)
+        python = timed(batch_stats, series, sent, use_numpy=False)
+        line = f"{size:>8}  {base:>10.3f}s  {python:>8.3f}s"
+        if HAS_NUMPY:
+            vector = timed(batch_stats, series, sent, use_numpy=True)
+            line += f"  {vector:>8.3f}s  {base / vector:>7.1f}x"
+        else:
+            line += f"  {'n/a':>9}  {base / python:>7.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,123 @@
+"""
+PingDiff history store benchmark
+
+Bulk-loads ROWS measurements spread over DAYS days into a fresh history
+database, adds RUNS runs of SERVERS results one transaction each (as the
+CLI writes them), then times the common queries from raw rows, the first
+rollup, and the same queries again once they read the rollup tiers. A few
+thousand rows are also written one transaction per row for comparison.
+
+Usage: python benchmarks/bench_history_store.py [rows]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from history_store import HistoryStore, _pack_sketch  # noqa: E402
+from quantile_sketch import DDSketch  # noqa: E402
+
+ROWS = 1_000_000
+DAYS = 30
+SERVERS = 100
+GAMES = ("overwatch-2", "valorant", "counter-strike-2", "apex-legends")
+BULK = 10_000
+RUNS = 1_000
+UNBATCHED = 5_000
+
+
+def make_sketches(rng: random.Random, count: int = 250):
+    """Packed reply sketches of 10 pings each, reused across rows"""
+    sketches = []
+    for _ in range(count):
+        sketch = DDSketch()
+        base = rng.uniform(5, 250)
+        for _ in range(10):
+            sketch.add(base + rng.uniform(-3, 9))
+        sketches.append((base, _pack_sketch(sketch)))
+    return sketches
+
+
+def make_run(rng: random.Random, sketches, at: float):
+    """One run's rows for SERVERS servers spread over GAMES"""
+    rows = []
+    for i in range(SERVERS):
+        ping, sketch = rng.choice(sketches)
+        rows.append((GAMES[i % len(GAMES)], f"server-{i}", at, f"Location {i}", "EU", "192.0.2.1",
+                     ping, ping - 3, ping + 9, ping, ping + 6, ping + 8, rng.uniform(0, 5),
+                     0.0, 10, 10, None, "cli", sketch))
+    return rows
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def run_queries(store: HistoryStore, end_at: float) -> None:
+    week = end_at - 7 * 86400
+    month = end_at - DAYS * 86400
+    for label, fn in (
+        ("summary, one game, last week", lambda: store.summary(game=GAMES[0], since=week)),
+        ("summary, one server, last week",
+         lambda: store.summary(game=GAMES[0], server_id="server-0", since=week)),
+        ("summary, one game, last month", lambda: store.summary(game=GAMES[0], since=month)),
+        ("summary, one server, last month",
+         lambda: store.summary(game=GAMES[0], server_id="server-0", since=month)),
+        ("hourly series, one server, month",
+         lambda: store.series(3600, game=GAMES[0], server_id="server-0", since=month)),
+        ("range, one server, last week",
+         lambda: store.query(game=GAMES[0], server_id="server-0", since=week)),
+        ("latest, all servers", lambda: store.latest()),
+    ):
+        elapsed, result = timed(fn)
+        print(f"  {label:<34} {elapsed * 1000:>8.1f}ms  ({len(result)} rows)")
+
+
+def main(rows: int):
+    rng = random.Random(1)
+    sketches = make_sketches(rng)
+    runs = rows // SERVERS
+    step = DAYS * 86400 / (runs + RUNS)
+    start_at = 1_700_000_000.0
+    batches = [make_run(rng, sketches, start_at + n * step) for n in range(runs)]
+    end_at = start_at + (runs + RUNS) * step
+    with tempfile.TemporaryDirectory() as tmp:
+        with HistoryStore(os.path.join(tmp, "history.db"), clock=lambda: end_at) as store:
+            flat = [row for batch in batches for row in batch]
+            elapsed, _ = timed(lambda: [store.insert(flat[i:i + BULK])
+                                        for i in range(0, len(flat), BULK)])
+            print(f"Bulk insert of {len(flat):,} rows over {DAYS} days in batches of {BULK:,}: "
+                  f"{elapsed:.2f}s ({len(flat) / elapsed:,.0f} rows/s)")
+
+            more = [make_run(rng, sketches, start_at + (runs + n) * step) for n in range(RUNS)]
+            elapsed, _ = timed(lambda: [store.insert(batch) for batch in more])
+            print(f"{RUNS:,} more runs of {SERVERS} servers, one transaction each: "
+                  f"{elapsed / RUNS * 1000:.2f}ms per run")
+
+            print("Raw rows only:")
+            run_queries(store, end_at)
+
+            elapsed, written = timed(store.rollup)
+            print(f"First rollup: {written:,} rollup rows in {elapsed:.2f}s, "
+                  f"{len(store):,} raw rows kept")
+            store.insert(make_run(rng, sketches, end_at))
+            end_at += 3600
+            elapsed, written = timed(store.rollup)
+            print(f"Incremental rollup an hour later: {written:,} rows in {elapsed * 1000:.1f}ms")
+
+            print("With rollups:")
+            run_queries(store, end_at)
+
+        with HistoryStore(os.path.join(tmp, "unbatched.db")) as store:
+            elapsed, _ = timed(lambda: [store.insert([row]) for row in flat[:UNBATCHED]])
+            print(f"One transaction per row: {UNBATCHED / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
@@ -0,0 +1,98 @@
+"""
+PingDiff probe log benchmark
+
+Appends RECORDS probes to a fresh probe log (rotating through segments)
+and compares the rate with one history-style SQLite row insert per probe,
+then reads the log back as ProbeRecords and as NumPy views, with a
+second process-style reader following the writer.
+
+Usage: python benchmarks/bench_probe_log.py [records]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from probe_log import ProbeLog, ProbeLogReader, HAS_NUMPY  # noqa: E402
+
+RECORDS = 2_000_000
+TARGETS = 200
+SEGMENT_BYTES = 16 * 1024 * 1024
+SQLITE_ROWS = 100_000
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(records: int):
+    rng = random.Random(1)
+    rtts = [None if rng.random() < 0.02 else rng.uniform(5, 250) for _ in range(4096)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "probe_log")
+        with ProbeLog(path, segment_bytes=SEGMENT_BYTES, max_segments=1000) as log:
+            ids = [log.target(f"10.0.{i // 256}.{i % 256}") for i in range(TARGETS)]
+
+            def write():
+                append = log.append
+                for n in range(records):
+                    append(ids[n % TARGETS], n // TARGETS, rtts[n & 4095])
+
+            elapsed, _ = timed(write)
+            print(f"Appended {records:,} probes: {elapsed:.2f}s ({records / elapsed:,.0f} probes/s, "
+                  f"{elapsed / records * 1e6:.2f}us each)")
+
+            with ProbeLogReader(path) as reader:
+                segments = reader.segments()
+                print(f"  {len(segments)} segments of {SEGMENT_BYTES // (1024 * 1024)} MiB")
+
+                elapsed, count = timed(lambda: sum(1 for _ in reader.records()))
+                print(f"Read as ProbeRecords: {elapsed:.2f}s ({count / elapsed:,.0f} records/s)")
+
+                if HAS_NUMPY:
+                    def scan():
+                        replies = total = 0
+                        for segment in segments:
+                            view = reader.array(segment)
+                            replied = view["flags"] == 0
+                            replies += int(replied.sum())
+                            total += int(view["rtt_us"][replied].sum())
+                        return total / replies
+
+                    elapsed, mean = timed(scan)
+                    print(f"Mean RTT over NumPy views: {elapsed * 1000:.1f}ms "
+                          f"({count / elapsed:,.0f} records/s, {mean / 1000:.1f}ms)")
+
+                # A reader following the live segment while more probes arrive
+                log.append(ids[0], 0, 1.0)
+                live = reader.segments()[-1]
+                before = reader.count(live)
+                for n in range(1000):
+                    log.append(ids[0], n, 1.0)
+                print(f"Live reader sees {reader.count(live) - before} new records without reopening")
+
+        db = sqlite3.connect(os.path.join(tmp, "rows.db"), isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE probes (at INTEGER, target INTEGER, seq INTEGER, rtt_us INTEGER, "
+                   "flags INTEGER)")
+
+        def insert_rows():
+            for n in range(SQLITE_ROWS):
+                db.execute("INSERT INTO probes VALUES (?, ?, ?, ?, ?)",
+                           (time.time_ns(), n % TARGETS, n // TARGETS, 12345, 0))
+
+        elapsed, _ = timed(insert_rows)
+        print(f"SQLite, one autocommitted row per probe: {SQLITE_ROWS / elapsed:,.0f} probes/s")
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RECORDS)
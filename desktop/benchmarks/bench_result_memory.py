@@ -0,0 +1,67 @@
+"""
+PingDiff result memory benchmark
+
+Bytes per PingResult (traced by tracemalloc) as test_all_servers builds
+them now against the previous layout: a plain dataclass with a list of
+floats that also carried its RunningStats accumulator. A slotted result
+keeps either raw_times or, with retain_raw=False, the accumulator; both
+are shown.
+
+Usage: python benchmarks/bench_result_memory.py [pings ...]
+"""
+
+import dataclasses
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ping_tester import PingResult  # noqa: E402
+from running_stats import RunningStats  # noqa: E402
+
+RESULTS = 10_000
+PINGS = (10, 100)
+
+# The layout PingResult had before it was slotted: same fields, __dict__, list
+ListPingResult = dataclasses.make_dataclass(
+    "ListPingResult", [(f.name, f.type, f) for f in dataclasses.fields(PingResult)])
+
+
+def build(cls, pings: int, with_raw: bool, with_stats: bool, seed: int = 1):
+    rng = random.Random(seed)
+    results = []
+    for i in range(RESULTS):
+        # Fresh float objects, as parsed from ping output or a socket
+        times = [rng.uniform(5, 250) for _ in range(pings)]
+        results.append(cls(
+            f"server-{i}", "Frankfurt", "192.0.2.1", 50.0, 5.0, 250.0, 3.0, 0.0,
+            pings, pings, times if with_raw else [], region="EU", backend="icmp-raw",
+            ping_p50=48.0, ping_p95=230.0, ping_p99=248.0,
+            stats=RunningStats.from_times(times) if with_stats else None))
+    return results
+
+
+def bytes_per_result(cls, pings: int, with_raw: bool, with_stats: bool) -> float:
+    tracemalloc.start()
+    results = build(cls, pings, with_raw, with_stats)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return used / RESULTS
+
+
+def main(pings):
+    print(f"{RESULTS} results; List keeps raw_times and stats, Slotted one of them")
+    print(f"{'Pings':>6}  {'List':>9}  {'Raw':>9}  {'Saved':>6}  {'Stats':>9}  {'Saved':>6}")
+    for count in pings:
+        before = bytes_per_result(ListPingResult, count, True, True)
+        raw = bytes_per_result(PingResult, count, True, False)
+        stats = bytes_per_result(PingResult, count, False, True)
+        print(f"{count:>6}  {before:>8.0f}B  {raw:>8.0f}B  {1 - raw / before:>6.0%}  "
+              f"{stats:>8.0f}B  {1 - stats / before:>6.0%}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or PINGS)
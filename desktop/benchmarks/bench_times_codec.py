@@ -0,0 +1,109 @@
+"""
+PingDiff raw_times encoding benchmark
+
+Compares a submission's raw_times as JSON float arrays (the current
+format) with times_codec's compact encoding: payload size, plain and
+gzipped as the uploader sends batches, and encode/decode time, for runs
+of a few ping counts. Reply times are unrounded, as the native backend
+measures them.
+
+Usage: python benchmarks/bench_times_codec.py [runs]
+"""
+
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from times_codec import decode_times, encode_times, pack_result  # noqa: E402
+
+RUNS = 2000
+SERVERS = 10
+PING_COUNTS = (10, 50, 100)
+LOSS = 0.02
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def make_results(rng: random.Random, pings: int):
+    results = []
+    for server in range(SERVERS):
+        base = rng.uniform(10, 150)
+        times = [rng.gauss(base, 2.5) for _ in range(pings) if rng.random() >= LOSS]
+        results.append({
+            "server_id": f"server-{server}",
+            "server_location": f"Location {server}",
+            "ping_avg": sum(times) / len(times),
+            "ping_min": min(times),
+            "ping_max": max(times),
+            "jitter": 2.5,
+            "packet_loss": 100 * (1 - len(times) / pings),
+            "raw_times": [max(t, 0.0) for t in times],
+        })
+    return results
+
+
+def main(runs: int):
+    rng = random.Random(1)
+    for pings in PING_COUNTS:
+        payloads = [{"game": "overwatch-2", "results": make_results(rng, pings)}
+                    for _ in range(max(1, runs // 100))]
+        series = [r["raw_times"] for p in payloads for r in p["results"]]
+        replies = sum(len(times) for times in series)
+
+        json_body = json.dumps({"runs": payloads}, separators=(",", ":")).encode()
+        packed_body = json.dumps({"runs": [{**p, "results": [pack_result(r) for r in p["results"]]}
+                                           for p in payloads]},
+                                 separators=(",", ":")).encode()
+        json_times = sum(len(json.dumps(times, separators=(",", ":"))) for times in series)
+        packed_times = sum(len(encode_times(times)) for times in series)
+
+        print(f"{pings} pings per server, {len(series)} results:")
+        print(f"  raw_times alone: JSON {json_times / replies:.1f} bytes/reply, "
+              f"packed {packed_times / replies:.1f} bytes/reply "
+              f"({json_times / packed_times:.1f}x smaller)")
+        print(f"  whole batch: JSON {len(json_body):,} bytes ({len(gzip.compress(json_body)):,} gzipped), "
+              f"packed {len(packed_body):,} bytes ({len(gzip.compress(packed_body)):,} gzipped)")
+
+        repeat = max(1, runs // len(series))
+
+        def encode_json():
+            for _ in range(repeat):
+                for times in series:
+                    json.dumps(times)
+
+        def encode_packed():
+            for _ in range(repeat):
+                for times in series:
+                    encode_times(times)
+
+        encoded_json = [json.dumps(times) for times in series]
+        encoded_packed = [encode_times(times) for times in series]
+
+        def decode_json():
+            for _ in range(repeat):
+                for text in encoded_json:
+                    json.loads(text)
+
+        def decode_packed():
+            for _ in range(repeat):
+                for text in encoded_packed:
+                    decode_times(text)
+
+        count = repeat * len(series)
+        for label, fn in (("encode JSON", encode_json), ("encode packed", encode_packed),
+                          ("decode JSON", decode_json), ("decode packed", decode_packed)):
+            elapsed, _ = timed(fn)
+            print(f"  {label:<14} {elapsed / count * 1e6:7.1f}us per result")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS)
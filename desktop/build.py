@@ -44,6 +44,18 @@ def build(onefile=False, version=None):
         # Add all source files
         f"--add-data={os.path.join(SRC_DIR, 'config.py')};.",
         f"--add-data={os.path.join(SRC_DIR, 'ping_tester.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'icmp_probe.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'circuit_breaker.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'pacer.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'watch_session.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'running_stats.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'quantile_sketch.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'batch_stats.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'result_cache.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'history_store.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'probe_log.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'upload_queue.py')};.",
+        f"--add-data={os.path.join(SRC_DIR, 'times_codec.py')};.",
         f"--add-data={os.path.join(SRC_DIR, 'api_client.py')};.",
         f"--add-data={os.path.join(SRC_DIR, 'gui.py')};.",
         # Hidden imports
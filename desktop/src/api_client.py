@@ -6,30 +6,21 @@ Handles communication with the PingDiff server, ISP detection, and settings
 import requests
 import hashlib
 import json
-import os
 import logging
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 
-from config import API_BASE_URL, API_ENDPOINTS, DEFAULT_SERVERS, APP_VERSION
+from config import API_BASE_URL, API_ENDPOINTS, DEFAULT_SERVERS, APP_VERSION, get_app_data_dir
+from result_cache import DEFAULT_MAX_AGE
+from upload_queue import UploadQueue, UploadStats, Uploader
 
 # Fixed salt for IP hashing (not secret, just for consistency)
 IP_HASH_SALT = "pingdiff-v1-2024"
 
 
-def get_app_data_dir() -> Path:
-    """Get the application data directory"""
-    if os.name == 'nt':  # Windows
-        app_data = os.environ.get('APPDATA', os.path.expanduser('~'))
-        app_dir = Path(app_data) / 'PingDiff'
-    else:  # Linux/Mac
-        app_dir = Path.home() / '.pingdiff'
-
-    app_dir.mkdir(parents=True, exist_ok=True)
-    return app_dir
-
-
 def setup_logging() -> logging.Logger:
     """Set up file and console logging"""
     app_dir = get_app_data_dir()
@@ -79,6 +70,12 @@ class Settings:
         "share_results": True,
         "default_region": "EU",
         "ping_count": 10,
+        "ping_interval_ms": None,
+        "time_budget": None,
+        "race_mode": False,
+        "top_k": None,
+        "cache_max_age": DEFAULT_MAX_AGE,
+        "compact_uploads": False,
         "first_run": True
     }
 
@@ -133,6 +130,60 @@ class Settings:
     def default_region(self, value: str):
         self.set("default_region", value)
 
+    @property
+    def ping_interval_ms(self) -> Optional[float]:
+        """Milliseconds between pings to a server (None = standard 1 second)"""
+        return self._settings.get("ping_interval_ms")
+
+    @ping_interval_ms.setter
+    def ping_interval_ms(self, value: Optional[float]):
+        self.set("ping_interval_ms", value)
+
+    @property
+    def time_budget(self) -> Optional[float]:
+        """Maximum seconds for a whole test (None = no limit)"""
+        return self._settings.get("time_budget")
+
+    @time_budget.setter
+    def time_budget(self, value: Optional[float]):
+        self.set("time_budget", value)
+
+    @property
+    def race_mode(self) -> bool:
+        """Stop pinging servers that are clearly slower than the best one"""
+        return self._settings.get("race_mode", False)
+
+    @race_mode.setter
+    def race_mode(self, value: bool):
+        self.set("race_mode", value)
+
+    @property
+    def top_k(self) -> Optional[int]:
+        """Two-phase test: measure only this many best servers in depth (None = all)"""
+        return self._settings.get("top_k")
+
+    @top_k.setter
+    def top_k(self, value: Optional[int]):
+        self.set("top_k", value)
+
+    @property
+    def cache_max_age(self) -> float:
+        """Seconds a server's last result is reused instead of pinging it again (0 = always ping)"""
+        return self._settings.get("cache_max_age", DEFAULT_MAX_AGE)
+
+    @cache_max_age.setter
+    def cache_max_age(self, value: float):
+        self.set("cache_max_age", value)
+
+    @property
+    def compact_uploads(self) -> bool:
+        """Send raw_times in the compact times_codec encoding when the server accepts it"""
+        return self._settings.get("compact_uploads", False)
+
+    @compact_uploads.setter
+    def compact_uploads(self, value: bool):
+        self.set("compact_uploads", value)
+
 
 class APIClient:
     """Client for PingDiff API and external services"""
@@ -147,6 +198,9 @@ class APIClient:
         self._user_id = None
         self._config_path = get_app_data_dir() / 'config.json'
         self.settings = settings or Settings()
+        self.uploader: Optional[Uploader] = None
+        self._uploader_lock = threading.Lock()
+        self._user_token: Optional[str] = None  # kept in memory only, never queued to disk
 
     def _load_config(self) -> Dict:
         """Load local config file"""
@@ -254,10 +308,41 @@ class APIClient:
         logger.info("Using default servers as fallback")
         return DEFAULT_SERVERS.get(game_slug, {})
 
+    def start_uploads(self, on_uploaded: Optional[Callable[[Dict], None]] = None) -> Uploader:
+        """
+        Start the background uploader, which also sends anything left in
+        the queue by an earlier session. on_uploaded(run) is called from
+        its thread with the server's answer for each delivered run
+        (id, url, count). Opens the queue database, so call it off the UI
+        thread.
+        """
+        with self._uploader_lock:
+            if self.uploader is None:
+                self.uploader = Uploader(UploadQueue(), self._post_results,
+                                         enabled=lambda: self.settings.share_results,
+                                         compact=lambda: self.settings.compact_uploads)
+                self.uploader.start()
+            if on_uploaded:
+                self.uploader.on_uploaded = on_uploaded
+            return self.uploader
+
+    def upload_stats(self) -> UploadStats:
+        """Queue depth and latency of result uploads."""
+        if self.uploader is None:
+            return UploadStats()
+        return self.uploader.stats
+
     def submit_results(self, results: List[Dict], isp_info: Dict,
                        game_slug: str = "overwatch-2",
                        user_token: Optional[str] = None) -> Dict:
-        """Submit test results to the API (if sharing is enabled)"""
+        """
+        Queue test results for upload (if sharing is enabled). The run is
+        stored on disk and sent by the background uploader, batched with
+        other runs, so nothing is lost to timeouts, network errors or
+        rate limits. With settings.compact_uploads, raw_times are sent in
+        the compact encoding once the server says it takes it (see
+        upload_queue.Uploader), and as JSON arrays otherwise.
+        """
 
         # Check if sharing is enabled
         if not self.settings.share_results:
@@ -268,7 +353,7 @@ class APIClient:
                 "sharing_disabled": True
             }
 
-        logger.info(f"Submitting {len(results)} results to API...")
+        logger.info(f"Queueing {len(results)} results for upload...")
 
         payload = {
             "game": game_slug,
@@ -278,50 +363,43 @@ class APIClient:
             "city": isp_info.get("city", "Unknown"),
             "ip_hash": isp_info.get("ip_hash", ""),
             "client_version": APP_VERSION,
-            "anonymous_id": self.get_user_id()
+            "anonymous_id": self.get_user_id(),
+            "tested_at": time.time()
         }
 
-        headers = {}
         if user_token:
-            headers["Authorization"] = f"Bearer {user_token}"
+            self._user_token = user_token
+
+        try:
+            uploader = self.start_uploads()
+            uploader.submit(payload)
+        except Exception as e:
+            logger.error(f"Error queueing results: {e}")
+            return {"success": False, "error": str(e)}
+        return {"success": True, "queued": True, "queue_depth": uploader.stats.queued}
 
+    def _post_results(self, body: bytes, headers: Dict[str, str]) -> Tuple[int, Dict, Optional[float]]:
+        """POST an encoded batch for the uploader (see upload_queue.Sender)."""
+        headers = dict(headers)
+        if self._user_token:
+            headers["Authorization"] = f"Bearer {self._user_token}"
         try:
             response = self.session.post(
                 f"{self.base_url}{API_ENDPOINTS['results']}",
-                json=payload,
+                data=body,
                 headers=headers,
                 timeout=15
             )
-
-            if response.status_code in [200, 201]:
-                data = response.json()
-                logger.info(f"Results submitted successfully: {data.get('id')}")
-                return {
-                    "success": True,
-                    "result_id": data.get("id"),
-                    "dashboard_url": data.get("url", "/dashboard")
-                }
-            elif response.status_code == 429:
-                logger.warning("Rate limit exceeded")
-                return {
-                    "success": False,
-                    "error": "Rate limit exceeded. Please try again later."
-                }
-            else:
-                logger.warning(f"Server returned {response.status_code}")
-                return {
-                    "success": False,
-                    "error": f"Server returned {response.status_code}"
-                }
-        except requests.Timeout:
-            logger.warning("Timeout submitting results")
-            return {"success": False, "error": "Request timed out"}
         except requests.RequestException as e:
-            logger.warning(f"Network error submitting results: {e}")
-            return {"success": False, "error": "Network error"}
-        except Exception as e:
-            logger.error(f"Unexpected error submitting results: {e}")
-            return {"success": False, "error": str(e)}
+            raise ConnectionError(str(e)) from e
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        retry_after = response.headers.get("Retry-After", "")
+        return (response.status_code, data if isinstance(data, dict) else {},
+                float(retry_after) if retry_after.isdigit() else None)
 
     def get_recommendations(self, isp: str, region: str,
                            game_slug: str = "overwatch-2") -> Dict:
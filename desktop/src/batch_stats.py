@@ -0,0 +1,182 @@
+"""
+PingDiff Batch Statistics
+Ping statistics for thousands of RTT series at once, vectorized with NumPy when installed
+"""
+
+import itertools
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path below is used instead
+    np = None
+
+HAS_NUMPY = np is not None
+
+# Percentiles reported for every series
+QUANTILES = (0.5, 0.95, 0.99)
+# The NumPy path sorts series as rows of a padded matrix when that is at
+# most this many times larger than the replies themselves (one long series
+# among many short ones falls back to one sort of the flat array)
+PAD_LIMIT = 4
+
+
+@dataclass
+class BatchStats:
+    """Statistics for a batch of RTT series, one list entry per series, in input order"""
+    count: List[int] = field(default_factory=list)  # replies
+    sent: List[int] = field(default_factory=list)
+    mean: List[float] = field(default_factory=list)
+    min: List[float] = field(default_factory=list)
+    max: List[float] = field(default_factory=list)
+    jitter: List[float] = field(default_factory=list)
+    packet_loss: List[float] = field(default_factory=list)
+    # quantiles[k][i] is QUANTILES[k] of series i
+    quantiles: List[List[float]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+
+def batch_stats(series: Sequence[Sequence[float]], sent: Optional[Sequence[int]] = None,
+                quantiles: Sequence[float] = QUANTILES,
+                use_numpy: Optional[bool] = None) -> BatchStats:
+    """
+    Compute mean/min/max/jitter/percentiles/loss for a ragged set of RTT series.
+
+    Jitter is the mean absolute difference between consecutive replies
+    (calculate_jitter, unrounded). Percentiles are exact and use the lower
+    sample value (no interpolation). Series without replies get zeros and
+    100% loss.
+
+    Args:
+        series: RTTs in ms per series (replies only, in order)
+        sent: Probes sent per series (default: the number of replies)
+        quantiles: Quantiles (0 to 1) to report
+        use_numpy: Force the NumPy (True) or pure-Python (False) path;
+            NumPy is used whenever it is installed by default
+
+    Raises:
+        ValueError if sent does not have one entry per series
+    """
+    if sent is not None and len(sent) != len(series):
+        raise ValueError("sent must have one entry per series")
+    if use_numpy is None:
+        use_numpy = HAS_NUMPY
+    elif use_numpy and not HAS_NUMPY:
+        raise ImportError("NumPy is not installed")
+    if use_numpy:
+        return _batch_numpy(series, sent, quantiles)
+    return _batch_python(series, sent, quantiles)
+
+
+def results_stats(results: Sequence, quantiles: Sequence[float] = QUANTILES,
+                  use_numpy: Optional[bool] = None) -> BatchStats:
+    """batch_stats over the raw_times of PingResults (results need raw_times retained)."""
+    return batch_stats([r.raw_times for r in results], [r.total_pings for r in results],
+                       quantiles, use_numpy)
+
+
+def _loss(received: int, sent: int) -> float:
+    return ((sent - received) / sent) * 100 if sent else 100.0
+
+
+def _batch_python(series: Sequence[Sequence[float]], sent: Optional[Sequence[int]],
+                  quantiles: Sequence[float]) -> BatchStats:
+    """One pass per series plus a sort for the percentiles."""
+    out = BatchStats(quantiles=[[] for _ in quantiles])
+    for i, times in enumerate(series):
+        n = len(times)
+        total = sent[i] if sent is not None else n
+        out.count.append(n)
+        out.sent.append(total)
+        out.packet_loss.append(_loss(n, total))
+        if not n:
+            for column in (out.mean, out.min, out.max, out.jitter):
+                column.append(0.0)
+            for column in out.quantiles:
+                column.append(0.0)
+            continue
+
+        total_rtt = 0.0
+        low = high = prev = times[0]
+        diff_sum = 0.0
+        for rtt in times:
+            total_rtt += rtt
+            if rtt < low:
+                low = rtt
+            elif rtt > high:
+                high = rtt
+            diff_sum += abs(rtt - prev)
+            prev = rtt
+        out.mean.append(total_rtt / n)
+        out.min.append(low)
+        out.max.append(high)
+        out.jitter.append(diff_sum / (n - 1) if n > 1 else 0.0)
+        ordered = sorted(times)
+        for column, q in zip(out.quantiles, quantiles):
+            column.append(ordered[math.floor(q * (n - 1))])
+    return out
+
+
+def _batch_numpy(series: Sequence[Sequence[float]], sent: Optional[Sequence[int]],
+                 quantiles: Sequence[float]) -> BatchStats:
+    """
+    All series flattened into one array with a series id per value, so every
+    statistic is a handful of whole-array operations instead of a Python loop.
+    """
+    m = len(series)
+    counts = np.fromiter(map(len, series), dtype=np.int64, count=m)
+    values = np.fromiter(itertools.chain.from_iterable(series), dtype=np.float64,
+                         count=int(counts.sum()))
+    totals = counts if sent is None else np.asarray(sent, dtype=np.int64)
+    ids = np.repeat(np.arange(m), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if m else counts
+    has = counts > 0
+    safe = np.maximum(counts, 1)
+
+    mean = np.bincount(ids, weights=values, minlength=m) / safe
+    low = np.zeros(m)
+    high = np.zeros(m)
+    if values.size:
+        low[has] = np.minimum.reduceat(values, starts[has])
+        high[has] = np.maximum.reduceat(values, starts[has])
+
+    # Consecutive differences that stay within one series
+    same = ids[1:] == ids[:-1]
+    diffs = np.abs(np.diff(values))[same]
+    diff_sum = np.bincount(ids[1:][same], weights=diffs, minlength=m)
+    jitter = np.where(counts > 1, diff_sum / np.maximum(counts - 1, 1), 0.0)
+
+    # Every series sorted within its own slice of `ordered`, at row_starts
+    width = int(counts.max()) if m else 0
+    if m * width <= PAD_LIMIT * values.size:
+        padded = np.full((m, width), np.inf)
+        padded[ids, np.arange(values.size) - starts[ids]] = values
+        padded.sort(axis=1)
+        ordered = padded.ravel()
+        row_starts = np.arange(m) * width
+    else:
+        ordered = values[np.lexsort((values, ids))]
+        row_starts = starts
+    quantile_columns = []
+    for q in quantiles:
+        picked = np.zeros(m)
+        if values.size:
+            offsets = np.floor(q * (counts[has] - 1)).astype(np.int64)
+            picked[has] = ordered[row_starts[has] + offsets]
+        quantile_columns.append(picked.tolist())
+
+    loss = np.where(totals > 0, (totals - counts) / np.maximum(totals, 1) * 100, 100.0)
+    return BatchStats(
+        count=counts.tolist(),
+        sent=totals.tolist(),
+        mean=mean.tolist(),
+        min=low.tolist(),
+        max=high.tolist(),
+        jitter=jitter.tolist(),
+        packet_loss=loss.tolist(),
+        quantiles=quantile_columns,
+    )
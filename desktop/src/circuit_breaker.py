@@ -0,0 +1,91 @@
+"""
+PingDiff Circuit Breaker
+Remembers servers that stopped answering so repeat runs skip them for a while
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from config import get_app_data_dir
+
+logger = logging.getLogger('PingDiff')
+
+# Seconds a dead server is skipped after its first failed test;
+# doubles with every further failure up to MAX_BACKOFF
+BASE_BACKOFF = 60
+MAX_BACKOFF = 6 * 60 * 60
+
+
+class CircuitBreaker:
+    """
+    Per-IP circuit breaker persisted between runs.
+
+    A server whose test gets no reply at all is skipped for BASE_BACKOFF
+    seconds, doubling with every further failed test up to MAX_BACKOFF.
+    Once its backoff runs out it is tested again, and a single reply
+    closes the breaker.
+    """
+
+    def __init__(self, path: Optional[Path] = None, base_backoff: float = BASE_BACKOFF,
+                 max_backoff: float = MAX_BACKOFF, clock: Callable[[], float] = time.time):
+        self._path = Path(path) if path else get_app_data_dir() / 'dead_servers.json'
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+        self._entries: Dict[str, Dict] = self._load()
+        self._dirty = False
+
+    def _load(self) -> Dict[str, Dict]:
+        """Load breaker state from file"""
+        if self._path.exists():
+            try:
+                with open(self._path, 'r') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+            except Exception as e:
+                logger.warning(f"Error loading circuit breaker state: {e}")
+        return {}
+
+    def save(self) -> None:
+        """Save breaker state to file if anything changed"""
+        if not self._dirty:
+            return
+        try:
+            with open(self._path, 'w') as f:
+                json.dump(self._entries, f, indent=2)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Error saving circuit breaker state: {e}")
+
+    def retry_in(self, ip: str) -> float:
+        """Seconds until a server may be tested again (0 if it may be tested now)"""
+        entry = self._entries.get(ip)
+        if not entry:
+            return 0.0
+        return max(0.0, entry["retry_at"] - self._clock())
+
+    def allow(self, ip: str) -> bool:
+        """Whether a server should be tested in this run"""
+        return self.retry_in(ip) == 0
+
+    def failures(self, ip: str) -> int:
+        """Failed tests in a row for a server"""
+        return self._entries.get(ip, {}).get("failures", 0)
+
+    def record(self, ip: str, reachable: bool) -> None:
+        """Record the outcome of testing a server."""
+        if reachable:
+            if self._entries.pop(ip, None) is not None:
+                logger.info(f"Server {ip} is answering again")
+                self._dirty = True
+            return
+
+        failures = self.failures(ip) + 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+        self._entries[ip] = {"failures": failures, "retry_at": self._clock() + backoff}
+        self._dirty = True
+        logger.info(f"Server {ip} unreachable ({failures}x), skipping for {backoff:.0f}s")
@@ -7,6 +7,9 @@ Usage:
     python main.py --cli --json --best
     python main.py --cli --output results.json
     python main.py --cli --output results.csv --region NA
+    python main.py --cli --interval-ms 50 --budget 2
+    python main.py --cli --history 7 --region EU
+    python main.py --cli --watch --probe-log
     python main.py --list-games
     python main.py --version
 """
@@ -16,13 +19,27 @@ import csv
 import io
 import json
 import os
+import sqlite3
 import sys
 import time
 from datetime import datetime
 from typing import List, Optional
 
 from config import APP_VERSION, GAMES, DEFAULT_SERVERS, REGIONS, REGION_NAMES
-from ping_tester import test_all_servers, get_best_server, get_connection_quality, PingResult
+from circuit_breaker import CircuitBreaker
+from result_cache import ResultCache
+from history_store import HistoryStore, SOURCE_CLI, SOURCE_WATCH
+from pacer import get_pacer
+from probe_log import ProbeLog
+from watch_session import WatchSession, WATCH_WARMUP, window_label
+from ping_tester import (
+    test_all_servers, get_connection_quality, get_ping_backend, as_result_set, group_targets,
+    PingResult, ProbeEvent, ResultSet, DEDUPE_IP, DEDUPE_PREFIX, SweepStats, MAX_CONSECUTIVE_LOSSES, MAX_CONCURRENT_PINGS, SCREEN_COUNT,
+    PING_INTERVAL,
+)
+
+# --game value that tests every game in one sweep
+ALL_GAMES = "all"
 
 
 # ANSI color codes
@@ -92,22 +109,24 @@ def format_loss(value: float) -> str:
         return colorize(f"{value:.1f}%", Colors.RED)
 
 
-def sort_results(results: List[PingResult], sort_by: str) -> List[PingResult]:
+def sort_results(results: List[PingResult], sort_by: str) -> ResultSet:
     """Sort results by the specified column."""
-    sort_keys = {
-        "ping": lambda r: (r.packet_loss >= 100, r.ping_avg),
-        "jitter": lambda r: (r.packet_loss >= 100, r.jitter),
-        "loss": lambda r: (r.packet_loss >= 100, r.packet_loss),
-        "location": lambda r: (r.packet_loss >= 100, r.server_location.lower()),
-        "region": lambda r: (r.packet_loss >= 100, r.region, r.ping_avg),
-    }
-    key = sort_keys.get(sort_by, sort_keys["ping"])
-    return sorted(results, key=key)
+    return as_result_set(results).sorted(sort_by)
 
 
-def filter_by_max_ping(results: List[PingResult], max_ping: float) -> List[PingResult]:
+def filter_by_max_ping(results: List[PingResult], max_ping: float) -> ResultSet:
     """Remove servers exceeding the max ping threshold (unreachable servers always excluded)."""
-    return [r for r in results if r.packet_loss < 100 and r.ping_avg <= max_ping]
+    return as_result_set(results).within(max_ping)
+
+
+def game_short(slug: str) -> str:
+    """Short game name for a slug (the slug itself if unknown)."""
+    return GAMES.get(slug, {}).get("short", slug)
+
+
+def spans_games(results: List[PingResult]) -> bool:
+    """Whether results come from more than one game (--game all)."""
+    return len({r.game for r in results}) > 1
 
 
 def print_table(results: List[PingResult], sort_by: str = "ping") -> None:
@@ -118,28 +137,38 @@ def print_table(results: List[PingResult], sort_by: str = "ping") -> None:
 
     # Sort results
     results = sort_results(results, sort_by)
+    with_game = spans_games(results)
 
     # Column widths
-    header = f"{'Server':<20} {'Region':<8} {'Avg':>7} {'Min':>7} {'Max':>7} {'Jitter':>7} {'Loss':>7} {'Quality':<10}"
-    separator = "-" * 75
+    header = (f"{'Server':<20} {'Region':<8} {'Avg':>7} {'Min':>7} {'Max':>7} "
+              f"{'P50':>7} {'P95':>7} {'P99':>7} {'Jitter':>7} {'Loss':>7} {'Quality':<10}")
+    separator = "-" * 99
+    if with_game:
+        header = f"{'Game':<6} " + header
+        separator += "-" * 7
 
     print()
     print(colorize(header, Colors.BOLD))
     print(colorize(separator, Colors.DIM))
 
-    for r in results:
-        quality = get_connection_quality(r)
+    for r, quality in zip(results, results.quality):
         qcolor = quality_color(quality)
+        game = f"{game_short(r.game):<6} " if with_game else ""
 
         if r.packet_loss >= 100:
-            line = f"{r.server_location:<20} {r.region:<8} {'---':>7} {'---':>7} {'---':>7} {'---':>7} {'100%':>7} {colorize('Timeout', Colors.RED):<10}"
+            line = (f"{game}{r.server_location:<20} {r.region:<8} " + f"{'---':>7} " * 7 +
+                    f"{'100%':>7} {colorize('Timeout', Colors.RED):<10}")
         else:
             line = (
+                f"{game}"
                 f"{r.server_location:<20} "
                 f"{r.region:<8} "
                 f"{format_ping(r.ping_avg):>17} "
                 f"{format_ping(r.ping_min):>17} "
                 f"{format_ping(r.ping_max):>17} "
+                f"{format_ping(r.ping_p50):>17} "
+                f"{format_ping(r.ping_p95):>17} "
+                f"{format_ping(r.ping_p99):>17} "
                 f"{format_ping(r.jitter):>17} "
                 f"{format_loss(r.packet_loss):>17} "
                 f"{colorize(quality, qcolor):<10}"
@@ -152,7 +181,7 @@ def print_table(results: List[PingResult], sort_by: str = "ping") -> None:
 
 def print_best(results: List[PingResult]) -> None:
     """Print only the best server."""
-    best = get_best_server(results)
+    best = as_result_set(results).best()
     if not best:
         print("No reachable servers found.")
         return
@@ -162,6 +191,8 @@ def print_best(results: List[PingResult]) -> None:
     print(colorize("Best Server", Colors.BOLD))
     print(colorize("-" * 40, Colors.DIM))
     print(f"  Server:      {best.server_location} ({best.region})")
+    if spans_games(results):
+        print(f"  Game:        {GAMES.get(best.game, {}).get('name', best.game)}")
     print(f"  Ping:        {best.ping_avg:.0f}ms (min {best.ping_min:.0f}, max {best.ping_max:.0f})")
     print(f"  Jitter:      {best.jitter:.1f}ms")
     print(f"  Packet Loss: {best.packet_loss:.1f}%")
@@ -169,30 +200,51 @@ def print_best(results: List[PingResult]) -> None:
     print()
 
 
+def print_recommended(results: List[PingResult]) -> None:
+    """Print the one-line best server summary shown under the table."""
+    best = as_result_set(results).best()
+    if best:
+        quality = get_connection_quality(best)
+        where = f"{best.region}, {game_short(best.game)}" if spans_games(results) else best.region
+        print(f"  Recommended: {colorize(best.server_location, Colors.CYAN)} ({where}) — "
+              f"{colorize(f'{best.ping_avg:.0f}ms', quality_color(quality))} "
+              f"[{colorize(quality, quality_color(quality))}]")
+        print()
+
+
 def results_to_json(results: List[PingResult], best_only: bool = False) -> str:
     """Convert results to JSON string."""
+    results = as_result_set(results)
     if best_only:
-        best = get_best_server(results)
+        best = results.best()
         if not best:
             return json.dumps({"error": "No reachable servers"}, indent=2)
-        results = [best]
+        results = ResultSet([best])
 
     data = []
-    for r in results:
+    for r, quality in zip(results, results.quality):
         data.append({
             "server": r.server_location,
             "server_id": r.server_id,
+            "game": r.game,
             "region": r.region,
             "ip": r.ip_address,
             "ping_avg": r.ping_avg,
             "ping_min": r.ping_min,
             "ping_max": r.ping_max,
+            "ping_p50": r.ping_p50,
+            "ping_p95": r.ping_p95,
+            "ping_p99": r.ping_p99,
             "jitter": r.jitter,
             "packet_loss": r.packet_loss,
-            "quality": get_connection_quality(r),
+            "quality": quality,
             "successful_pings": r.successful_pings,
             "total_pings": r.total_pings,
             "error": r.error,
+            "backend": r.backend,
+            "phase": r.phase,
+            "eliminated": r.eliminated,
+            "age": r.age,
         })
 
     return json.dumps(data, indent=2)
@@ -200,45 +252,75 @@ def results_to_json(results: List[PingResult], best_only: bool = False) -> str:
 
 def results_to_csv(results: List[PingResult], best_only: bool = False) -> str:
     """Convert results to CSV string."""
+    results = as_result_set(results)
     if best_only:
-        best = get_best_server(results)
+        best = results.best()
         if not best:
             return ""
-        results = [best]
+        results = ResultSet([best])
 
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow([
         "server", "region", "ip", "ping_avg", "ping_min", "ping_max",
-        "jitter", "packet_loss", "quality", "successful_pings", "total_pings",
+        "ping_p50", "ping_p95", "ping_p99", "jitter", "packet_loss", "quality", "successful_pings", "total_pings",
+        "backend", "phase", "game", "age",
     ])
-    for r in results:
+    for r, quality in zip(results, results.quality):
         writer.writerow([
             r.server_location, r.region, r.ip_address,
             f"{r.ping_avg:.2f}", f"{r.ping_min:.2f}", f"{r.ping_max:.2f}",
+            f"{r.ping_p50:.2f}", f"{r.ping_p95:.2f}", f"{r.ping_p99:.2f}",
             f"{r.jitter:.2f}", f"{r.packet_loss:.2f}",
-            get_connection_quality(r), r.successful_pings, r.total_pings,
+            quality, r.successful_pings, r.total_pings,
+            r.backend, r.phase, r.game, f"{r.age:.1f}",
         ])
     return output.getvalue().rstrip("\n")
 
 
-def progress_callback(completed: int, total: int, result: PingResult) -> None:
-    """Show progress during testing."""
-    if total == 0:
-        return
+def render_progress(completed: int, total: int, status: str) -> None:
+    """Redraw the progress bar line."""
     bar_width = 30
     filled = int(bar_width * completed / total)
     bar = "█" * filled + "░" * (bar_width - filled)
 
-    status = f"{result.server_location}: {result.ping_avg:.0f}ms" if result.ping_avg > 0 else f"{result.server_location}: timeout"
-
     sys.stdout.write(f"\r  [{bar}] {completed}/{total} — {status:<30}")
     sys.stdout.flush()
 
+
+def progress_callback(completed: int, total: int, result: PingResult) -> None:
+    """Show progress during testing."""
+    if total == 0:
+        return
+
+    status = f"{result.server_location}: {result.ping_avg:.0f}ms" if result.ping_avg > 0 else f"{result.server_location}: timeout"
+    render_progress(completed, total, status)
+
     if completed == total:
         sys.stdout.write("\n")
 
 
+class LiveProgress:
+    """Progress display that also updates on every individual probe reply."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+
+    def on_result(self, completed: int, total: int, result: PingResult) -> None:
+        self.completed = completed
+        progress_callback(completed, total, result)
+
+    def on_probe(self, event: ProbeEvent) -> None:
+        if self.total == 0 or self.completed == self.total:
+            return
+        if event.rtt is None:
+            status = f"{event.server_location}: lost #{event.seq + 1}"
+        else:
+            status = f"{event.server_location}: {event.rtt:.0f}ms #{event.seq + 1}"
+        render_progress(self.completed, self.total, status)
+
+
 def list_games() -> None:
     """Print available games."""
     print()
@@ -249,7 +331,7 @@ def list_games() -> None:
         server_count = sum(len(v) for v in DEFAULT_SERVERS.get(slug, {}).values())
         print(f"  {info['short']:<6} {info['name']:<22} {server_count:>3} servers  [{', '.join(regions)}]")
     print()
-    print(f"Use: --game <slug>  (e.g. --game {list(GAMES.keys())[0]})")
+    print(f"Use: --game <slug>  (e.g. --game {list(GAMES.keys())[0]}), or --game {ALL_GAMES} for every game")
     print()
 
 
@@ -289,6 +371,9 @@ def build_parser() -> argparse.ArgumentParser:
                "  pingdiff --cli --output results.csv --region NA\n"
                "  pingdiff --cli --sort jitter --region EU\n"
                "  pingdiff --cli --max-ping 80 --region NA\n"
+               "  pingdiff --cli --interval-ms 50 --budget 2\n"
+               "  pingdiff --cli --max-age 120\n"
+               "  pingdiff --cli --history 7 --region EU\n"
                "  pingdiff --list-games\n",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
@@ -296,7 +381,8 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--cli", action="store_true",
                         help="Run in CLI mode (no GUI)")
     parser.add_argument("--game", type=str, default="overwatch-2",
-                        help="Game slug to test (default: overwatch-2)")
+                        help=f"Game slug to test, or '{ALL_GAMES}' for every game in one sweep "
+                             "(default: overwatch-2)")
     parser.add_argument("--region", type=str, default=None,
                         choices=["EU", "NA", "ASIA", "SA", "ME"],
                         help="Filter by region")
@@ -318,43 +404,223 @@ def build_parser() -> argparse.ArgumentParser:
                         help="Save results to FILE (format auto-detected from .json/.csv extension, "
                              "or uses --json/--csv flag if set)")
     parser.add_argument("--watch", action="store_true",
-                        help="Continuously ping servers and refresh results (use --interval to set seconds, default 30)")
+                        help="Continuously ping servers and show rolling 30s/5m/1h results "
+                             "(use --interval to set the refresh, default 30s)")
     parser.add_argument("--interval", type=int, default=30,
-                        help="Seconds between updates in watch mode (default: 30)")
+                        help="Seconds between display refreshes in watch mode (default: 30)")
     parser.add_argument("--sort", type=str, default="ping",
-                        choices=["ping", "jitter", "loss", "location", "region"],
+                        choices=["ping", "p95", "jitter", "loss", "location", "region"],
                         help="Sort results by column (default: ping)")
     parser.add_argument("--max-ping", type=float, default=None, metavar="MS",
                         help="Hide servers with avg ping above this threshold (ms)")
+    parser.add_argument("--interval-ms", type=float, default=None, metavar="MS",
+                        help="Milliseconds between pings to a server, e.g. 20-200 for a burst test "
+                             "(default: 1000)")
+    parser.add_argument("--budget", type=float, default=None, metavar="SECONDS",
+                        help="Maximum seconds for the whole test; unanswered pings count as lost")
+    parser.add_argument("--server-budget", type=float, default=None, metavar="SECONDS",
+                        help="Maximum seconds spent on any one server")
+    parser.add_argument("--max-losses", type=int, default=MAX_CONSECUTIVE_LOSSES, metavar="N",
+                        help="Give up on a server after N lost pings with no reply "
+                             f"(default: {MAX_CONSECUTIVE_LOSSES}, 0 to always send every ping)")
+    parser.add_argument("--retest-dead", action="store_true",
+                        help="Test servers that were unreachable in recent runs instead of skipping them")
+    parser.add_argument("--top-k", type=int, default=None, metavar="K",
+                        help="Two-phase test: quick-screen every server, then measure only the K best "
+                             "with the full --count")
+    parser.add_argument("--screen-count", type=int, default=SCREEN_COUNT, metavar="N",
+                        help=f"Pings per server in the --top-k screening pass (default: {SCREEN_COUNT})")
+    parser.add_argument("--race", action="store_true",
+                        help="Stop pinging servers once they are clearly slower than the best one "
+                             "(always on with --best)")
+    parser.add_argument("--rate", type=float, default=None, metavar="PPS",
+                        help="Maximum pings per second across all servers (default: no limit)")
+    parser.add_argument("--max-concurrency", type=int, default=None, metavar="N",
+                        help="Most system ping processes to run at once; the level adapts to "
+                             f"loss and latency below this (default: {MAX_CONCURRENT_PINGS})")
+    parser.add_argument("--dedupe", type=str, default=DEDUPE_IP,
+                        choices=[DEDUPE_IP, DEDUPE_PREFIX, "off"],
+                        help="Ping servers sharing an address once (ip), also servers sharing a "
+                             "/24 network (prefix), or every server separately (off) (default: ip)")
+    parser.add_argument("--max-age", type=float, default=0, metavar="SECONDS",
+                        help="Reuse results measured within the last SECONDS, by this or an earlier "
+                             "run, and ping only the other servers (default: 0, ping every server)")
+    parser.add_argument("--probe-log", action="store_true",
+                        help="Append every ping to the binary probe log in the app data folder, "
+                             "for analysis tools to read while it is written")
+    parser.add_argument("--history", type=float, default=None, metavar="DAYS",
+                        help="Show per-server averages from the local history of the last DAYS "
+                             "days (for --game and --region) instead of testing")
+    parser.add_argument("--no-history", action="store_true",
+                        help="Do not save this run's results to the local history")
 
     return parser
 
 
+# Flags that shape a one-off test, which watch mode's continuous probing has no use for
+ONE_OFF_FLAGS = (("count", "--count"), ("budget", "--budget"), ("server_budget", "--server-budget"),
+                 ("top_k", "--top-k"), ("race", "--race"))
+
+
+def sweep_options(args: argparse.Namespace) -> dict:
+    """test_all_servers keyword arguments from the pacing and fast-fail flags."""
+    return {
+        "interval_ms": args.interval_ms,
+        "budget": args.budget,
+        "target_budget": args.server_budget,
+        "max_losses": args.max_losses or None,
+        "breaker": None if args.retest_dead else CircuitBreaker(),
+        "race": args.race or args.best,
+        "top_k": args.top_k,
+        "screen_count": args.screen_count,
+        "rate": args.rate,
+        "max_concurrency": args.max_concurrency,
+        "dedupe": dedupe_mode(args),
+        "cache": ResultCache(max_age=args.max_age),
+        "probe_log": ProbeLog() if args.probe_log else None,
+    }
+
+
+def dedupe_mode(args: argparse.Namespace) -> Optional[str]:
+    """The dedupe argument for the --dedupe flag."""
+    return None if args.dedupe == "off" else args.dedupe
+
+
+def print_sweep_stats(stats: SweepStats, args: argparse.Namespace) -> None:
+    """Print how many probes were saved and how many servers ran at once."""
+    if 1 < stats.concurrency < stats.servers:
+        print(colorize(f"  Tested up to {stats.concurrency} servers at once", Colors.DIM))
+        if not stats.probes_saved:
+            print()
+    if not stats.probes_saved:
+        return
+    modes = []
+    if args.top_k:
+        modes.append(f"screened with {args.screen_count}, top {args.top_k} measured with {args.count}")
+    if stats.eliminated:
+        modes.append(f"dropped {stats.eliminated} slower servers early")
+    if stats.shared:
+        modes.append(f"{stats.shared} servers shared another's pings")
+    if stats.cache_hits:
+        modes.append(f"{stats.cache_hits} servers reused recent or concurrent runs' results, "
+                     f"{stats.cache_misses} pinged")
+    summary = "; ".join(modes) or "stopped early"
+    print(colorize(f"  {summary.capitalize()} — sent {stats.probes_sent} of {stats.probes_planned} pings "
+                   f"({stats.probes_saved} saved) in {stats.elapsed:.1f}s", Colors.DIM))
+    print()
+
+
+def save_history(results: List[PingResult], source: str, args: argparse.Namespace) -> None:
+    """Add results to the local history unless --no-history is set."""
+    if args.no_history:
+        return
+    try:
+        with HistoryStore() as history:
+            history.record(results, source)
+            history.rollup_in_background()
+    except sqlite3.Error as e:
+        print(colorize(f"  Could not save results to history: {e}", Colors.YELLOW), file=sys.stderr)
+
+
+def print_history(args: argparse.Namespace) -> int:
+    """Print per-server aggregates from the local history. Returns exit code."""
+    game = None if args.game == ALL_GAMES else args.game
+    since = time.time() - args.history * 86400
+    try:
+        with HistoryStore() as history:
+            summaries = [s for s in history.summary(game=game, since=since)
+                         if not args.region or s.region == args.region]
+    except sqlite3.Error as e:
+        print(f"Error: Could not read history: {e}")
+        return 1
+    if not summaries:
+        print(f"No results saved in the last {args.history:g} days.")
+        return 0
+
+    summaries.sort(key=lambda s: (not s.reachable_runs, s.ping_avg))
+    with_game = len({s.game for s in summaries}) > 1
+    header = (f"{'Server':<20} {'Region':<8} {'Runs':>5} {'Avg':>7} {'Min':>7} {'Max':>7} "
+              f"{'P95':>7} {'Jitter':>7} {'Loss':>7}  {'Last run':<16}")
+    if with_game:
+        header = f"{'Game':<6} " + header
+    print()
+    print(colorize(f"History — last {args.history:g} days", Colors.BOLD))
+    print(colorize(header, Colors.BOLD))
+    print(colorize("-" * len(header), Colors.DIM))
+    for s in summaries:
+        game_cell = f"{game_short(s.game):<6} " if with_game else ""
+        last = datetime.fromtimestamp(s.last).strftime("%Y-%m-%d %H:%M")
+        if not s.reachable_runs:
+            pings = f"{'---':>7} " * 5
+        else:
+            pings = "".join(f"{format_ping(v):>17} " for v in
+                            (s.ping_avg, s.ping_min, s.ping_max, s.ping_p95, s.jitter))
+        print(f"{game_cell}{s.location:<20} {s.region:<8} {s.runs:>5} {pings}"
+              f"{format_loss(s.packet_loss):>17}  {last:<16}")
+    print()
+    return 0
+
+
+def print_window_table(results: List[PingResult], session: WatchSession) -> None:
+    """Print average ping and loss for each server over every rolling window."""
+    columns = [(window_label(w), {(r.game, r.server_id, r.ip_address): r for r in session.snapshot(w)})
+               for w in session.windows]
+    header = f"{'Server':<20} {'Region':<8}" + "".join(f" {label:>14}" for label, _ in columns)
+    print(colorize(header, Colors.BOLD))
+    print(colorize("-" * len(header), Colors.DIM))
+
+    for r in results:
+        cells = []
+        for _, by_key in columns:
+            w = by_key.get((r.game, r.server_id, r.ip_address))
+            if w is None or not w.total_pings:
+                cells.append(f"{'...':>14}")
+            elif w.packet_loss >= 100:
+                cells.append(f"{'timeout':>14}")
+            else:
+                cells.append(f"{w.ping_avg:>6.0f}ms {w.packet_loss:>4.0f}%")
+        print(f"{r.server_location:<20} {r.region:<8} " + " ".join(cells))
+    print()
+
+
 def run_watch(game_info: dict, all_servers: list, args: argparse.Namespace) -> int:
-    """Run continuous ping testing in watch mode. Returns exit code."""
+    """
+    Run continuous ping testing in watch mode. Returns exit code.
+    Servers are pinged non-stop in the background; every --interval seconds
+    the display refreshes from the shortest rolling window.
+    """
+    interval = args.interval_ms / 1000 if args.interval_ms else PING_INTERVAL
+    probe_log = ProbeLog() if args.probe_log else None
+    session = WatchSession(all_servers, interval=interval, rate=args.rate, dedupe=dedupe_mode(args),
+                           probe_log=probe_log)
+    session.start()
     try:
+        # Let the first window fill a little before the first refresh
+        for remaining in range(min(args.interval, WATCH_WARMUP), 0, -1):
+            sys.stdout.write(f"\r  Collecting pings... {remaining}s  [Ctrl+C to stop]  ")
+            sys.stdout.flush()
+            time.sleep(1)
+
         while True:
             os.system("clear" if os.name != "nt" else "cls")
 
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            window = session.windows[0]
             print(colorize(f"PingDiff — {game_info['name']} [Watch Mode]", Colors.BOLD))
-            print(colorize(f"Last update: {now}", Colors.DIM))
-            print()
-
-            results = test_all_servers(all_servers, ping_count=args.count, callback=progress_callback)
+            print(colorize(f"Last update: {now} — last {window_label(window)} via {session.backend}",
+                           Colors.DIM))
 
+            results = ResultSet(r for r in session.snapshot(window) if r.total_pings)
+            # Only the probes since the last refresh, so none is stored twice
+            save_history(session.take_settled(), SOURCE_WATCH, args)
             if args.max_ping is not None:
                 results = filter_by_max_ping(results, args.max_ping)
 
             print_table(results, sort_by=args.sort)
+            if results:
+                print_window_table(sort_results(results, args.sort), session)
 
-            best = get_best_server(results)
-            if best:
-                quality = get_connection_quality(best)
-                print(f"  Recommended: {colorize(best.server_location, Colors.CYAN)} ({best.region}) — "
-                      f"{colorize(f'{best.ping_avg:.0f}ms', quality_color(quality))} "
-                      f"[{colorize(quality, quality_color(quality))}]")
-                print()
+            print_recommended(results)
 
             for remaining in range(args.interval, 0, -1):
                 sys.stdout.write(f"\r  Next update in {remaining}s  [Ctrl+C to stop]  ")
@@ -364,6 +630,26 @@ def run_watch(game_info: dict, all_servers: list, args: argparse.Namespace) -> i
     except KeyboardInterrupt:
         print("\n\n  Watch mode stopped. Goodbye!")
         return 0
+    finally:
+        session.stop()
+        save_history(session.take_settled(), SOURCE_WATCH, args)
+        if probe_log is not None and not session.running:
+            probe_log.close()
+
+
+def collect_servers(games: List[str], region: Optional[str] = None) -> List[dict]:
+    """Server dicts of the given games (optionally one region), tagged with region and game."""
+    all_servers = []
+    for game in games:
+        for server_region, servers in DEFAULT_SERVERS.get(game, {}).items():
+            if region and server_region != region:
+                continue
+            for s in servers:
+                s_copy = dict(s)
+                s_copy["region"] = server_region
+                s_copy["game"] = game
+                all_servers.append(s_copy)
+    return all_servers
 
 
 def run_cli(args: argparse.Namespace) -> int:
@@ -376,34 +662,67 @@ def run_cli(args: argparse.Namespace) -> int:
         list_games()
         return 0
 
-    # Validate game
-    if args.game not in GAMES:
-        print(f"Error: Unknown game '{args.game}'. Use --list-games to see options.")
+    if args.interval_ms is not None and args.interval_ms <= 0:
+        print("Error: --interval-ms must be greater than 0.")
+        return 1
+    if args.budget is not None and args.budget <= 0:
+        print("Error: --budget must be greater than 0.")
+        return 1
+    if args.server_budget is not None and args.server_budget <= 0:
+        print("Error: --server-budget must be greater than 0.")
+        return 1
+    if args.max_losses < 0:
+        print("Error: --max-losses cannot be negative.")
+        return 1
+    if args.top_k is not None and args.top_k < 1:
+        print("Error: --top-k must be at least 1.")
+        return 1
+    if args.screen_count < 1:
+        print("Error: --screen-count must be at least 1.")
+        return 1
+    if args.rate is not None and args.rate <= 0:
+        print("Error: --rate must be greater than 0.")
         return 1
+    if args.max_concurrency is not None and args.max_concurrency < 1:
+        print("Error: --max-concurrency must be at least 1.")
+        return 1
+    if args.max_age < 0:
+        print("Error: --max-age cannot be negative.")
+        return 1
+    if args.history is not None and args.history <= 0:
+        print("Error: --history must be greater than 0.")
+        return 1
+    if args.rate:
+        get_pacer().set_rate(args.rate)
+
+    if args.game == ALL_GAMES:
+        game_info = {"name": "All games", "short": "ALL"}
+        all_servers = collect_servers(sorted(GAMES), args.region)
+        if not all_servers:
+            print(f"Error: No {args.region} servers for any game.")
+            return 1
+    else:
+        # Validate game
+        if args.game not in GAMES:
+            print(f"Error: Unknown game '{args.game}'. Use --list-games to see options.")
+            return 1
 
-    game_info = GAMES[args.game]
-    servers_by_region = DEFAULT_SERVERS.get(args.game, {})
+        game_info = GAMES[args.game]
+        servers_by_region = DEFAULT_SERVERS.get(args.game, {})
 
-    if not servers_by_region:
-        print(f"Error: No servers configured for {game_info['name']}.")
-        return 1
+        if not servers_by_region:
+            print(f"Error: No servers configured for {game_info['name']}.")
+            return 1
 
-    # Filter by region
-    if args.region:
-        if args.region not in servers_by_region:
+        if args.region and args.region not in servers_by_region:
             print(f"Error: No {args.region} servers for {game_info['name']}.")
             available = ", ".join(servers_by_region.keys())
             print(f"Available regions: {available}")
             return 1
-        servers_by_region = {args.region: servers_by_region[args.region]}
+        all_servers = collect_servers([args.game], args.region)
 
-    # Flatten servers and tag with region
-    all_servers = []
-    for region, servers in servers_by_region.items():
-        for s in servers:
-            s_copy = dict(s)
-            s_copy["region"] = region
-            all_servers.append(s_copy)
+    if args.history is not None:
+        return print_history(args)
 
     total = len(all_servers)
     region_label = args.region or "all regions"
@@ -418,6 +737,10 @@ def run_cli(args: argparse.Namespace) -> int:
         if args.output:
             print("Warning: --output is not supported with --watch, ignoring --output.")
             args.output = None
+        defaults = build_parser()
+        for dest, flag in ONE_OFF_FLAGS:
+            if getattr(args, dest) != defaults.get_default(dest):
+                print(f"Warning: {flag} is not supported with --watch, ignoring {flag}.")
         return run_watch(game_info, all_servers, args)
 
     if args.json_output and args.csv_output:
@@ -429,13 +752,28 @@ def run_cli(args: argparse.Namespace) -> int:
     if not machine_output:
         print()
         print(colorize(f"PingDiff v{APP_VERSION}", Colors.BOLD))
-        print(f"Testing {colorize(game_info['name'], Colors.CYAN)} — {total} servers ({region_label})")
-        print(f"Sending {args.count} pings per server...")
+        targets = len(group_targets(all_servers, dedupe_mode(args)))
+        shared = f", {targets} unique addresses" if targets < total else ""
+        print(f"Testing {colorize(game_info['name'], Colors.CYAN)} — {total} servers{shared} ({region_label})")
+        pacing = f" every {args.interval_ms:g}ms" if args.interval_ms else ""
+        if args.budget:
+            pacing += f" within {args.budget:g}s"
+        print(f"Sending {args.count} pings per server{pacing} via {get_ping_backend()}...")
         print()
 
     # Run tests
-    callback = progress_callback if not machine_output else None
-    results = test_all_servers(all_servers, ping_count=args.count, callback=callback)
+    progress = LiveProgress(total) if not machine_output else None
+    stats = SweepStats()
+    options = sweep_options(args)
+    try:
+        results = ResultSet(test_all_servers(all_servers, ping_count=args.count,
+                                             callback=progress.on_result if progress else None,
+                                             on_probe=progress.on_probe if progress else None,
+                                             stats=stats, **options))
+    finally:
+        if options["probe_log"] is not None:
+            options["probe_log"].close()
+    save_history(results, SOURCE_CLI, args)
 
     # Apply --max-ping filter
     if args.max_ping is not None:
@@ -468,16 +806,12 @@ def run_cli(args: argparse.Namespace) -> int:
         print(results_to_csv(results, best_only=args.best))
     elif args.best:
         print_best(results)
+        print_sweep_stats(stats, args)
     else:
         print_table(results, sort_by=args.sort)
 
         # Also show best server summary
-        best = get_best_server(results)
-        if best:
-            quality = get_connection_quality(best)
-            print(f"  Recommended: {colorize(best.server_location, Colors.CYAN)} ({best.region}) — "
-                  f"{colorize(f'{best.ping_avg:.0f}ms', quality_color(quality))} "
-                  f"[{colorize(quality, quality_color(quality))}]")
-            print()
+        print_recommended(results)
+        print_sweep_stats(stats, args)
 
     return 0
@@ -3,6 +3,9 @@ PingDiff Configuration
 Server IPs and API endpoints
 """
 
+import os
+from pathlib import Path
+
 # API Configuration
 API_BASE_URL = "https://pingdiff.com"
 API_ENDPOINTS = {
@@ -18,6 +21,18 @@ APP_VERSION = "1.17.1"
 PING_COUNT = 10  # Number of pings per server
 PING_TIMEOUT = 1  # Seconds
 
+
+def get_app_data_dir() -> Path:
+    """Get the application data directory"""
+    if os.name == 'nt':  # Windows
+        app_data = os.environ.get('APPDATA', os.path.expanduser('~'))
+        app_dir = Path(app_data) / 'PingDiff'
+    else:  # Linux/Mac
+        app_dir = Path.home() / '.pingdiff'
+
+    app_dir.mkdir(parents=True, exist_ok=True)
+    return app_dir
+
 # Apple-inspired UI Colors (macOS dark mode aesthetic)
 COLORS = {
     # Backgrounds
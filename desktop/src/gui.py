@@ -8,12 +8,17 @@ from tkinter import ttk, messagebox
 import threading
 import webbrowser
 import os
-import math
-from typing import List, Optional
+import logging
+import sqlite3
 
-from config import COLORS, REGIONS, REGION_NAMES, APP_VERSION, GAMES
-from ping_tester import test_all_servers, get_best_server, get_connection_quality, PingResult
+from config import COLORS, REGIONS, REGION_NAMES, APP_VERSION, GAMES, PING_COUNT
+from ping_tester import (
+    test_all_servers, get_connection_quality, ResultSet, PHASE_SCREEN,
+)
 from api_client import APIClient, Settings, get_app_data_dir
+from circuit_breaker import CircuitBreaker
+from result_cache import ResultCache
+from history_store import HistoryStore, SOURCE_GUI
 
 
 # Font configuration (SF Pro-like on Windows/Mac)
@@ -292,7 +297,7 @@ class RegionPicker(tk.Frame):
 class ServerResultCard(tk.Frame):
     """Clean result card for each server"""
 
-    def __init__(self, parent, result, is_best=False, **kwargs):
+    def __init__(self, parent, result, is_best=False, quality=None, **kwargs):
         bg = COLORS["card"]
         super().__init__(parent, bg=bg, **kwargs)
 
@@ -336,7 +341,7 @@ class ServerResultCard(tk.Frame):
                     bg=bg, fg=COLORS["error"]).pack(anchor=tk.E)
         else:
             # Ping value
-            quality = get_connection_quality(result)
+            quality = quality or get_connection_quality(result)
             if quality == "Excellent":
                 ping_color = COLORS["success"]
             elif quality == "Good":
@@ -360,11 +365,22 @@ class ServerResultCard(tk.Frame):
             stats_text = f"{result.jitter:.1f}ms jitter"
             if result.packet_loss > 0:
                 stats_text += f" · {result.packet_loss:.0f}% loss"
+            if result.phase == PHASE_SCREEN:
+                stats_text += " · quick test"
+            if result.age:
+                stats_text += f" · {result.age:.0f}s ago"
 
             tk.Label(right, text=stats_text,
                     font=get_font(12),
                     bg=bg, fg=COLORS["text_dim"]).pack(anchor=tk.E)
 
+            # Tail latency
+            if result.successful_pings > 1:
+                tk.Label(right, text=f"p50 {result.ping_p50:.0f} · p95 {result.ping_p95:.0f} · "
+                                     f"p99 {result.ping_p99:.0f} ms",
+                        font=get_font(11),
+                        bg=bg, fg=COLORS["text_muted"]).pack(anchor=tk.E)
+
 
 class PingDiffApp:
     """Main application window"""
@@ -385,9 +401,11 @@ class PingDiffApp:
         # Initialize
         self.settings = Settings()
         self.api = APIClient(self.settings)
+        self.breaker = CircuitBreaker()
+        self.cache = ResultCache()
         self.servers = {}
         self.current_game = "overwatch-2"
-        self.results: List[PingResult] = []
+        self.results: ResultSet = ResultSet()
         self.isp_info = {}
         self.is_testing = False
         self.dashboard_url = None
@@ -684,6 +702,8 @@ class PingDiffApp:
 
     def _on_share_toggle(self):
         self.settings.share_results = self.share_results_var.get()
+        if self.settings.share_results and self.api.uploader:
+            self.api.uploader.kick()  # send anything queued while sharing was off
 
     def _open_data_folder(self, event=None):
         folder = get_app_data_dir()
@@ -744,6 +764,7 @@ class PingDiffApp:
 
     def _load_data(self):
         def load():
+            self.api.start_uploads(on_uploaded=self._on_uploaded)
             self.isp_info = self.api.get_isp_info()
             self.root.after(0, self._update_isp_display)
             self.servers = self.api.get_servers(self.current_game)
@@ -760,7 +781,8 @@ class PingDiffApp:
         self.isp_label.config(text=isp)
         self.location_label.config(text=f"{city}, {country}")
 
-    def _start_test(self):
+    def _start_test(self, retest_dead=False):
+        """Test the selected regions; retest_dead also tests servers the breaker is skipping"""
         if self.is_testing:
             return
 
@@ -791,8 +813,13 @@ class PingDiffApp:
         self.progress_ring.set_progress(0, "Testing", f"Testing {len(all_servers)} servers...")
 
         def run_test():
+            total_probes = len(all_servers) * PING_COUNT
+            state = {"completed": 0, "probes": 0}
+
             def progress_callback(current, total, result):
-                progress = (current / total) * 100
+                state["completed"] = current
+                # Servers given up on early never send all their probes
+                progress = max(state["probes"] / total_probes, current / total) * 100
                 status = f"{current}/{total}"
                 if result.packet_loss < 100:
                     sub = f"Testing {result.server_location}"
@@ -801,7 +828,31 @@ class PingDiffApp:
                 self.root.after(0, lambda: self.progress_ring.set_progress(
                     progress, status, sub))
 
-            self.results = test_all_servers(all_servers, callback=progress_callback)
+            def probe_callback(event):
+                # Advance the ring on every reply instead of every finished server
+                state["probes"] += 1
+                progress = max(state["probes"] / total_probes,
+                               state["completed"] / len(all_servers)) * 100
+                status = f"{state['completed']}/{len(all_servers)}"
+                if event.rtt is None:
+                    sub = f"{event.server_location} · lost"
+                else:
+                    sub = f"{event.server_location} · {event.rtt:.0f}ms"
+                self.root.after(0, lambda: self.progress_ring.set_progress(
+                    progress, status, sub))
+
+            self.cache.max_age = self.settings.cache_max_age
+            self.results = ResultSet(test_all_servers(
+                all_servers, ping_count=PING_COUNT,
+                callback=progress_callback,
+                on_probe=probe_callback,
+                interval_ms=self.settings.ping_interval_ms,
+                budget=self.settings.time_budget,
+                breaker=None if retest_dead else self.breaker,
+                race=self.settings.race_mode,
+                top_k=self.settings.top_k,
+                cache=self.cache))
+            self._save_history()
             self.root.after(0, self._show_results)
 
         thread = threading.Thread(target=run_test, daemon=True)
@@ -812,7 +863,7 @@ class PingDiffApp:
         self.test_button.set_disabled(False)
         self.test_button.set_text("Start Test")
 
-        best = get_best_server(self.results)
+        best = self.results.best()
         if best:
             best_text = f"Best: {best.server_location}"
             if best.region:
@@ -831,44 +882,82 @@ class PingDiffApp:
                     bg=COLORS["bg"], fg=COLORS["text_dim"]).pack(pady=40)
             return
 
-        # Count successful
-        successful = len([r for r in self.results if r.packet_loss < 100])
+        successful = self.results.reachable_count
         self.results_count.config(text=f"{successful}/{len(self.results)} servers")
 
+        # Servers skipped as unreachable in recent runs can be tested anyway
+        skipped = sum(1 for r in self.results
+                      if not r.total_pings and not self.breaker.allow(r.ip_address))
+        if skipped:
+            PillButton(
+                self.results_frame,
+                text=f"Retest {skipped} skipped",
+                command=lambda: self._start_test(retest_dead=True),
+                width=180,
+                height=36,
+                style="secondary"
+            ).pack(pady=(0, 8))
+
         # Sort and display
-        sorted_results = sorted(self.results, key=lambda r: (r.packet_loss >= 100, r.ping_avg))
+        sorted_results = self.results.sorted("ping")
 
         for i, result in enumerate(sorted_results):
             card = ServerResultCard(
                 self.results_frame,
                 result,
-                is_best=(i == 0 and result.packet_loss < 100)
+                is_best=(i == 0 and result.packet_loss < 100),
+                quality=sorted_results.quality[i]
             )
             card.pack(fill=tk.X, pady=(0, 8))
 
         # Submit to API
         self._submit_results()
 
+    def _save_history(self):
+        """Add the latest results to the local history"""
+        try:
+            with HistoryStore() as history:
+                history.record(self.results, SOURCE_GUI, game=self.current_game)
+                history.rollup_in_background()
+        except sqlite3.Error as e:
+            logging.getLogger('PingDiff').warning(f"Error saving history: {e}")
+
     def _submit_results(self):
+        """Queue the results for upload; the uploader sends them in the background"""
+        results_data = [{
+            "server_id": r.server_id,
+            "server_location": r.server_location,
+            "ping_avg": r.ping_avg,
+            "ping_min": r.ping_min,
+            "ping_max": r.ping_max,
+            "jitter": r.jitter,
+            "packet_loss": r.packet_loss,
+            "raw_times": r.raw_times.tolist()
+        } for r in self.results
+            # Cached results were measured (and sent) before; skipped servers were never
+            # probed, and partial ones would skew the community averages
+            if r.total_pings and not r.age and not r.partial]
+        if not results_data:
+            return
+        game = self.current_game
+
         def submit():
-            results_data = [{
-                "server_id": r.server_id,
-                "server_location": r.server_location,
-                "ping_avg": r.ping_avg,
-                "ping_min": r.ping_min,
-                "ping_max": r.ping_max,
-                "jitter": r.jitter,
-                "packet_loss": r.packet_loss,
-                "raw_times": r.raw_times
-            } for r in self.results]
-
-            response = self.api.submit_results(results_data, self.isp_info, self.current_game)
-            if response.get("success"):
-                self.dashboard_url = response.get("dashboard_url")
+            # Writes to the queue database, which may wait on its lock
+            response = self.api.submit_results(results_data, self.isp_info, game)
+            if response.get("queued"):
+                logging.getLogger('PingDiff').info(f"Upload queue depth: {response['queue_depth']}")
 
         thread = threading.Thread(target=submit, daemon=True)
         thread.start()
 
+    def _on_uploaded(self, run):
+        """Called from the upload thread for each delivered run"""
+        if run.get("url"):
+            self.root.after(0, self._set_dashboard_url, run["url"])
+
+    def _set_dashboard_url(self, url):
+        self.dashboard_url = url
+
     def _open_dashboard(self):
         if self.dashboard_url:
             url = self.dashboard_url
@@ -0,0 +1,617 @@
+"""
+PingDiff History Store
+Every run's results kept in a local SQLite time series, rolled up as it ages
+"""
+
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import get_app_data_dir
+from quantile_sketch import DDSketch
+
+logger = logging.getLogger('PingDiff')
+
+# Where results came from
+SOURCE_CLI = "cli"
+SOURCE_WATCH = "watch"
+SOURCE_GUI = "gui"
+
+# Seconds to wait for another process's write lock before giving up
+BUSY_TIMEOUT = 5
+
+# Storage tiers: the per-run rows, then rollups by bucket length in seconds
+TIER_RAW = 0
+TIER_MINUTE = 60
+TIER_HOUR = 3600
+TIER_DAY = 86400
+TIERS = (TIER_MINUTE, TIER_HOUR, TIER_DAY)  # rollup tiers, finest first
+# Days each tier is kept (None = forever). Data is only dropped once it is
+# rolled up into the next tier.
+RETENTION_DAYS = {TIER_RAW: 7, TIER_MINUTE: 30, TIER_HOUR: 365, TIER_DAY: None}
+# Seconds after a minute ends before it is rolled up, for runs stored late
+ROLLUP_DELAY = 120
+
+# Columns of a measurement, in table (and HistoryRow) order
+COLUMNS = ("game", "server_id", "at", "location", "region", "ip", "ping_avg", "ping_min",
+           "ping_max", "ping_p50", "ping_p95", "ping_p99", "jitter", "packet_loss",
+           "successful_pings", "total_pings", "error", "source")
+# Columns insert() takes: a measurement plus its packed reply sketch
+INSERT_COLUMNS = COLUMNS + ("sketch",)
+# Measurement columns a run contributes to a rollup (see _Aggregate.add_run)
+RUN_FIELDS = ("location", "region", "at", "ping_avg", "ping_min", "ping_max", "jitter",
+              "packet_loss", "successful_pings", "sketch")
+# Rollup columns after the key (see _Aggregate.merge)
+ROLLUP_FIELDS = ("location", "region", "runs", "reachable_runs", "ping_sum", "ping_min",
+                 "ping_max", "jitter_sum", "loss_sum", "first", "last", "sketch")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    game TEXT NOT NULL,
+    server_id TEXT NOT NULL,
+    at REAL NOT NULL,
+    location TEXT NOT NULL,
+    region TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    ping_avg REAL NOT NULL,
+    ping_min REAL NOT NULL,
+    ping_max REAL NOT NULL,
+    ping_p50 REAL NOT NULL,
+    ping_p95 REAL NOT NULL,
+    ping_p99 REAL NOT NULL,
+    jitter REAL NOT NULL,
+    packet_loss REAL NOT NULL,
+    successful_pings INTEGER NOT NULL,
+    total_pings INTEGER NOT NULL,
+    error TEXT,
+    source TEXT NOT NULL,
+    sketch TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_by_server ON measurements (game, server_id, at);
+CREATE INDEX IF NOT EXISTS measurements_by_time ON measurements (at);
+CREATE TABLE IF NOT EXISTS rollups (
+    tier INTEGER NOT NULL,
+    bucket REAL NOT NULL,
+    game TEXT NOT NULL,
+    server_id TEXT NOT NULL,
+    location TEXT NOT NULL,
+    region TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    reachable_runs INTEGER NOT NULL,
+    ping_sum REAL NOT NULL,
+    ping_min REAL NOT NULL,
+    ping_max REAL NOT NULL,
+    jitter_sum REAL NOT NULL,
+    loss_sum REAL NOT NULL,
+    first REAL NOT NULL,
+    last REAL NOT NULL,
+    sketch TEXT,
+    PRIMARY KEY (tier, bucket, game, server_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tiers (
+    tier INTEGER PRIMARY KEY,
+    rolled_until REAL,
+    kept_from REAL
+);
+"""
+
+
+@dataclass
+class HistoryRow:
+    """One stored measurement of one server"""
+    game: str
+    server_id: str
+    at: float  # Unix time the run finished
+    location: str
+    region: str
+    ip: str
+    ping_avg: float
+    ping_min: float
+    ping_max: float
+    ping_p50: float
+    ping_p95: float
+    ping_p99: float
+    jitter: float
+    packet_loss: float
+    successful_pings: int
+    total_pings: int
+    error: Optional[str]
+    source: str
+
+
+@dataclass
+class ServerSummary:
+    """A server's measurements over a time range, aggregated"""
+    game: str
+    server_id: str
+    location: str
+    region: str
+    runs: int
+    reachable_runs: int  # runs with at least one reply; the ping columns cover only these
+    ping_avg: float  # mean of the runs' averages
+    ping_min: float
+    ping_max: float
+    # Reply time percentiles over every run, within quantile_sketch.RELATIVE_ACCURACY
+    ping_p50: float
+    ping_p95: float
+    ping_p99: float
+    jitter: float
+    packet_loss: float  # mean over all runs
+    first: float
+    last: float
+    start: Optional[float] = None  # bucket start, for series()
+
+
+class TierState:
+    """How far each tier has been rolled up and pruned"""
+
+    __slots__ = ("rolled_until", "kept_from")
+
+    def __init__(self, rolled_until: Optional[float] = None, kept_from: Optional[float] = None):
+        self.rolled_until = rolled_until  # rollups cover every run before this
+        self.kept_from = kept_from  # anything older has been dropped
+
+
+class HistoryStore:
+    """
+    Results of every run in an SQLite database (WAL mode) in the app data
+    dir, indexed by (game, server_id, time). A run's results go in as one
+    batch; queries filter by game, server and time range.
+
+    As rows age they are rolled up (rollup()) into 1-minute, 1-hour and
+    1-day buckets that keep counts, sums, min/max, loss and a merged
+    quantile sketch, and each tier is dropped after its retention. Range
+    queries read whole buckets of the coarsest tier that fits, and finer
+    tiers or raw rows only for the edges of the range.
+    """
+
+    def __init__(self, path: Optional[Path] = None, clock: Callable[[], float] = time.time,
+                 retention: Optional[Dict[int, Optional[float]]] = None):
+        self._path = Path(path) if path else get_app_data_dir() / 'history.db'
+        self._clock = clock
+        self.retention = {**RETENTION_DAYS, **(retention or {})}
+        self._db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(measurements)')}
+        if columns and 'sketch' not in columns:
+            # Databases from before rollups
+            self._db.execute('ALTER TABLE measurements ADD COLUMN sketch TEXT')
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+
+    def close(self) -> None:
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def record(self, results: Iterable, source: str = SOURCE_CLI, game: str = "",
+               at: Optional[float] = None) -> int:
+        """
+        Store a run's PingResults in one transaction. Results served from
+        the result cache (already stored by the run that measured them),
+        partial ones (see PingResult.partial) and servers that were not
+        probed at all are left out. `game` is used for
+        results without one. Returns the number of rows written.
+        """
+        at = self._clock() if at is None else at
+        rows = [(r.game or game, r.server_id, at, r.server_location, r.region, r.ip_address,
+                 r.ping_avg, r.ping_min, r.ping_max, r.ping_p50, r.ping_p95, r.ping_p99,
+                 r.jitter, r.packet_loss, r.successful_pings, r.total_pings, r.error, source,
+                 _pack_sketch(_reply_sketch(r)))
+                for r in results if r.total_pings and not r.age and not r.partial]
+        return self.insert(rows)
+
+    def insert(self, rows: List[tuple]) -> int:
+        """
+        Store raw rows (tuples in INSERT_COLUMNS order) in one transaction.
+        Each transaction rewrites the index pages of every server it touches,
+        so bulk imports go fastest in batches of thousands of rows.
+        """
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * len(INSERT_COLUMNS))
+        with self._transaction() as db:
+            db.executemany(f'INSERT INTO measurements ({", ".join(INSERT_COLUMNS)}) '
+                           f'VALUES ({placeholders})', rows)
+        return len(rows)
+
+    def query(self, game: Optional[str] = None, server_id: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              limit: Optional[int] = None) -> List[HistoryRow]:
+        """
+        Raw measurements in [since, until), oldest first, optionally for one
+        game or server. Only reaches back as far as raw rows are kept.
+        """
+        where, params = _filters(game, server_id, since, until)
+        sql = f'SELECT {", ".join(COLUMNS)} FROM measurements{where} ORDER BY at'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [HistoryRow(*row) for row in self._db.execute(sql, params)]
+
+    def summary(self, game: Optional[str] = None, server_id: Optional[str] = None,
+                since: Optional[float] = None,
+                until: Optional[float] = None) -> List[ServerSummary]:
+        """
+        Per-server aggregates over [since, until), one per (game, server_id).
+        Where only rollups are left for an end of the range, it is widened
+        to the bucket boundary.
+        """
+        groups = self._aggregate(self._plan(since, until, TIERS), game, server_id)
+        return [aggregate.summary(game_, server) for (game_, server, _), aggregate
+                in sorted(groups.items(), key=lambda item: item[0][:2])]
+
+    def series(self, resolution: float, game: Optional[str] = None,
+               server_id: Optional[str] = None, since: Optional[float] = None,
+               until: Optional[float] = None) -> List[ServerSummary]:
+        """
+        Per-server aggregates in buckets of `resolution` seconds (start set),
+        ordered by server then time, read from the coarsest tier no coarser
+        than the resolution. Resolutions that are multiples of a minute,
+        hour or day line up exactly with the rollups.
+        """
+        tiers = tuple(tier for tier in TIERS if tier <= resolution)
+        groups = self._aggregate(self._plan(since, until, tiers), game, server_id, resolution)
+        return [aggregate.summary(game_, server, start) for (game_, server, start), aggregate
+                in sorted(groups.items())]
+
+    def latest(self, game: Optional[str] = None) -> List[HistoryRow]:
+        """The most recent raw measurement of every server, optionally for one game."""
+        where, params = _filters(game, None, None, None)
+        sql = f"""
+            SELECT {", ".join("m." + c for c in COLUMNS)}
+            FROM (SELECT game, server_id, MAX(at) AS at FROM measurements{where}
+                  GROUP BY game, server_id) AS newest
+            JOIN measurements AS m
+              ON m.game = newest.game AND m.server_id = newest.server_id AND m.at = newest.at
+            ORDER BY m.game, m.server_id
+        """
+        return [HistoryRow(*row) for row in self._db.execute(sql, params)]
+
+    def tier_state(self) -> Dict[int, TierState]:
+        """Rollup and retention progress of every tier that has any."""
+        return {tier: TierState(rolled, kept) for tier, rolled, kept
+                in self._db.execute('SELECT tier, rolled_until, kept_from FROM tiers')}
+
+    def rollup(self) -> int:
+        """
+        Roll every finished bucket up into each tier, then drop raw rows and
+        rollups past their retention. Incremental: each call reads only what
+        was stored since the previous one, and one made before another
+        minute has closed returns without taking the write lock. Returns the
+        rollup rows written.
+        """
+        now = self._clock()
+        rolled = self._db.execute('SELECT rolled_until FROM tiers WHERE tier = ?',
+                                  (TIERS[0],)).fetchone()
+        if rolled and rolled[0] is not None and _floor(now - ROLLUP_DELAY, TIERS[0]) <= rolled[0]:
+            # Rollups and retention cut-offs only move on bucket boundaries
+            return 0
+        written = 0
+        with self._transaction() as db:
+            state = self.tier_state()
+            source, source_until = TIER_RAW, now - ROLLUP_DELAY
+            for tier in TIERS:
+                current = state.setdefault(tier, TierState())
+                end = _floor(source_until, tier) if source_until is not None else None
+                if end is not None and (current.rolled_until is None or end > current.rolled_until):
+                    start = current.rolled_until
+                    if start is None:
+                        first = self._first_time(source)
+                        start = _floor(first, tier) if first is not None else end
+                    if start < end:
+                        written += self._roll(db, source, tier, start, end)
+                    current.rolled_until = end
+                    db.execute('INSERT INTO tiers (tier, rolled_until) VALUES (?, ?) '
+                               'ON CONFLICT (tier) DO UPDATE SET rolled_until = excluded.rolled_until',
+                               (tier, end))
+                source, source_until = tier, current.rolled_until
+            self._prune(db, now, state)
+        return written
+
+    def rollup_in_background(self) -> threading.Thread:
+        """
+        Run rollup() on a connection of its own in a new thread, so the
+        caller that just recorded results does not wait for it. The thread
+        is not a daemon: a process that is exiting finishes the rollup first.
+        """
+        path, clock, retention = self._path, self._clock, self.retention
+
+        def run():
+            try:
+                with HistoryStore(path, clock, retention) as history:
+                    history.rollup()
+            except sqlite3.Error as e:
+                logger.warning(f"Error rolling up history: {e}")
+
+        thread = threading.Thread(target=run, name="PingDiffRollup")
+        thread.start()
+        return thread
+
+    def _first_time(self, tier: int) -> Optional[float]:
+        if tier == TIER_RAW:
+            return self._db.execute('SELECT MIN(at) FROM measurements').fetchone()[0]
+        return self._db.execute('SELECT MIN(bucket) FROM rollups WHERE tier = ?',
+                                (tier,)).fetchone()[0]
+
+    def _roll(self, db: sqlite3.Connection, source: int, tier: int, start: float,
+              end: float) -> int:
+        """Aggregate the source tier's data in [start, end) into buckets of `tier`."""
+        groups = self._aggregate([(source, start, end)], None, None, tier)
+        db.executemany(f'INSERT OR REPLACE INTO rollups (tier, bucket, game, server_id, '
+                       f'{", ".join(ROLLUP_FIELDS)}) VALUES ({", ".join("?" * (4 + len(ROLLUP_FIELDS)))})',
+                       [(tier, bucket, game, server_id) + aggregate.row()
+                        for (game, server_id, bucket), aggregate in groups.items()])
+        return len(groups)
+
+    def _prune(self, db: sqlite3.Connection, now: float, state: Dict[int, TierState]) -> None:
+        """
+        Drop each tier's data past its retention, once the next tier holds
+        it. Cut-offs fall on the next tier's bucket boundaries, so every
+        dropped stretch is covered by whole buckets of the tier above.
+        """
+        levels = (TIER_RAW,) + TIERS
+        for i, tier in enumerate(levels):
+            days = self.retention.get(tier)
+            if days is None:
+                continue
+            above = levels[i + 1] if i + 1 < len(levels) else None
+            cutoff = _floor(now - days * 86400, above or tier)
+            if above is not None:
+                rolled = state.get(above, TierState()).rolled_until
+                if rolled is None:
+                    continue
+                cutoff = min(cutoff, rolled)
+            current = state.setdefault(tier, TierState())
+            if current.kept_from is not None and cutoff <= current.kept_from:
+                continue
+            if tier == TIER_RAW:
+                db.execute('DELETE FROM measurements WHERE at < ?', (cutoff,))
+            else:
+                db.execute('DELETE FROM rollups WHERE tier = ? AND bucket < ?', (tier, cutoff))
+            current.kept_from = cutoff
+            db.execute('INSERT INTO tiers (tier, kept_from) VALUES (?, ?) '
+                       'ON CONFLICT (tier) DO UPDATE SET kept_from = excluded.kept_from',
+                       (tier, cutoff))
+
+    def _plan(self, since: Optional[float], until: Optional[float],
+              tiers: Tuple[int, ...]) -> List[Tuple[int, float, float]]:
+        """
+        Pieces (tier, start, end) covering [since, until): whole buckets of
+        the coarsest tier that has them, then finer tiers for what is left
+        at the edges, then raw rows.
+        """
+        state = self.tier_state()
+
+        def kept_from(tier: int) -> float:
+            kept = state.get(tier, TierState()).kept_from
+            return -math.inf if kept is None else kept
+
+        def rolled_until(tier: int) -> float:
+            if tier == TIER_RAW:
+                return math.inf
+            rolled = state.get(tier, TierState()).rolled_until
+            return -math.inf if rolled is None else rolled
+
+        since = -math.inf if since is None else since
+        until = math.inf if until is None else until
+        # An end that only rollups still hold moves out to their bucket boundary
+        levels = (TIER_RAW,) + tiers
+        for tier in levels:
+            if kept_from(tier) <= since:
+                since = _floor(since, tier) if tier != TIER_RAW else since
+                break
+        for tier in levels:
+            if kept_from(tier) < until:
+                until = _ceil(until, tier) if tier != TIER_RAW else until
+                break
+
+        gaps = [(since, until)]
+        pieces = []
+        for tier in reversed(tiers):
+            left = []
+            for a, b in gaps:
+                start = _ceil(max(a, kept_from(tier)), tier)
+                end = _floor(min(b, rolled_until(tier)), tier)
+                if start < end:
+                    pieces.append((tier, start, end))
+                    if a < start:
+                        left.append((a, start))
+                    if end < b:
+                        left.append((end, b))
+                else:
+                    left.append((a, b))
+            gaps = left
+        for a, b in gaps:
+            start = max(a, kept_from(TIER_RAW))
+            if start < b:
+                pieces.append((TIER_RAW, start, b))
+        return pieces
+
+    def _aggregate(self, pieces: List[Tuple[int, float, float]], game: Optional[str],
+                   server_id: Optional[str],
+                   resolution: Optional[float] = None) -> Dict[Tuple, "_Aggregate"]:
+        """Aggregates per (game, server_id, bucket of `resolution` or None) over the pieces."""
+        groups: Dict[Tuple, _Aggregate] = {}
+        for tier, start, end in pieces:
+            if tier == TIER_RAW:
+                where, params = _filters(game, server_id, start, end)
+                sql = f'SELECT game, server_id, {", ".join(RUN_FIELDS)} FROM measurements{where}'
+                for game_, server, *fields in self._db.execute(sql, params):
+                    bucket = _floor(fields[2], resolution) if resolution else None
+                    groups.setdefault((game_, server, bucket), _Aggregate()).add_run(*fields)
+            else:
+                where, params = _filters(game, server_id, start, end, 'bucket')
+                sql = (f'SELECT game, server_id, bucket, {", ".join(ROLLUP_FIELDS)} FROM rollups'
+                       f' WHERE tier = ?{where.replace(" WHERE ", " AND ", 1)}')
+                for game_, server, bucket, *fields in self._db.execute(sql, [tier] + params):
+                    bucket = _floor(bucket, resolution) if resolution else None
+                    groups.setdefault((game_, server, bucket), _Aggregate()).merge(*fields)
+        return groups
+
+
+class _Aggregate:
+    """Mergeable totals for a set of runs: what a rollups row holds"""
+
+    __slots__ = ROLLUP_FIELDS
+
+    def __init__(self):
+        self.location = ""
+        self.region = ""
+        self.runs = 0
+        self.reachable_runs = 0
+        self.ping_sum = 0.0
+        self.ping_min = math.inf
+        self.ping_max = 0.0
+        self.jitter_sum = 0.0
+        self.loss_sum = 0.0
+        self.first = math.inf
+        self.last = -math.inf
+        self.sketch: Optional[DDSketch] = None
+
+    def _span(self, location: str, region: str, first: float, last: float) -> None:
+        if last >= self.last:
+            self.location, self.region, self.last = location, region, last
+        self.first = min(self.first, first)
+
+    def _merge_sketch(self, packed: Optional[str]) -> None:
+        if packed:
+            sketch = _unpack_sketch(packed)
+            self.sketch = sketch if self.sketch is None else self.sketch.merge(sketch)
+
+    def add_run(self, location: str, region: str, at: float, ping_avg: float, ping_min: float,
+                ping_max: float, jitter: float, packet_loss: float, successful_pings: int,
+                sketch: Optional[str]) -> None:
+        self._span(location, region, at, at)
+        self.runs += 1
+        self.loss_sum += packet_loss
+        if successful_pings:
+            self.reachable_runs += 1
+            self.ping_sum += ping_avg
+            self.jitter_sum += jitter
+            self.ping_min = min(self.ping_min, ping_min)
+            self.ping_max = max(self.ping_max, ping_max)
+        self._merge_sketch(sketch)
+
+    def merge(self, location: str, region: str, runs: int, reachable_runs: int, ping_sum: float,
+              ping_min: float, ping_max: float, jitter_sum: float, loss_sum: float, first: float,
+              last: float, sketch: Optional[str]) -> None:
+        self._span(location, region, first, last)
+        self.runs += runs
+        self.loss_sum += loss_sum
+        if reachable_runs:
+            self.reachable_runs += reachable_runs
+            self.ping_sum += ping_sum
+            self.jitter_sum += jitter_sum
+            self.ping_min = min(self.ping_min, ping_min)
+            self.ping_max = max(self.ping_max, ping_max)
+        self._merge_sketch(sketch)
+
+    def row(self) -> tuple:
+        """Values for the ROLLUP_FIELDS columns"""
+        return (self.location, self.region, self.runs, self.reachable_runs, self.ping_sum,
+                self.ping_min if self.reachable_runs else 0.0, self.ping_max, self.jitter_sum,
+                self.loss_sum, self.first, self.last, _pack_sketch(self.sketch))
+
+    def summary(self, game: str, server_id: str, start: Optional[float] = None) -> ServerSummary:
+        reachable = self.reachable_runs
+        quantiles = [0.0, 0.0, 0.0]
+        if self.sketch is not None and self.sketch.count:
+            quantiles = [round(self.sketch.quantile(q), 2) for q in (0.5, 0.95, 0.99)]
+        return ServerSummary(
+            game=game,
+            server_id=server_id,
+            location=self.location,
+            region=self.region,
+            runs=self.runs,
+            reachable_runs=reachable,
+            ping_avg=self.ping_sum / reachable if reachable else 0.0,
+            ping_min=self.ping_min if reachable else 0.0,
+            ping_max=self.ping_max if reachable else 0.0,
+            ping_p50=quantiles[0],
+            ping_p95=quantiles[1],
+            ping_p99=quantiles[2],
+            jitter=self.jitter_sum / reachable if reachable else 0.0,
+            packet_loss=self.loss_sum / self.runs if self.runs else 0.0,
+            first=self.first,
+            last=self.last,
+            start=start,
+        )
+
+
+def _reply_sketch(result) -> Optional[DDSketch]:
+    """A PingResult's reply sketch, from its stats or its raw replies"""
+    if result.stats is not None:
+        return result.stats.sketch
+    if result.raw_times:
+        sketch = DDSketch()
+        for rtt in result.raw_times:
+            sketch.add(rtt)
+        return sketch
+    return None
+
+
+def _pack_sketch(sketch: Optional[DDSketch]) -> Optional[str]:
+    """A default-accuracy sketch as compact JSON: [zero_count, {bin: count}]"""
+    if sketch is None or not sketch.count:
+        return None
+    data = sketch.to_dict()
+    return json.dumps([data["zero_count"], data["bins"]], separators=(",", ":"))
+
+
+def _unpack_sketch(packed: str) -> DDSketch:
+    zero_count, bins = json.loads(packed)
+    return DDSketch.from_dict({"zero_count": zero_count, "bins": bins})
+
+
+def _floor(value: float, step: float) -> float:
+    return math.floor(value / step) * step if math.isfinite(value) else value
+
+
+def _ceil(value: float, step: float) -> float:
+    return math.ceil(value / step) * step if math.isfinite(value) else value
+
+
+def _filters(game: Optional[str], server_id: Optional[str], since: Optional[float],
+             until: Optional[float], time_column: str = 'at'):
+    """WHERE clause and parameters for the common query filters"""
+    clauses, params = [], []
+    if game is not None:
+        clauses.append('game = ?')
+        params.append(game)
+    if server_id is not None:
+        clauses.append('server_id = ?')
+        params.append(server_id)
+    if since is not None:
+        clauses.append(f'{time_column} >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append(f'{time_column} < ?')
+        params.append(until)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
@@ -0,0 +1,623 @@
+"""
+PingDiff ICMP Probe
+Native ICMP echo backend using unprivileged datagram sockets or raw sockets.
+Avoids spawning a system ping process per server.
+"""
+
+import os
+import asyncio
+import heapq
+import socket
+import struct
+import select
+import time
+import ipaddress
+import logging
+import math
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pacer import Pacer, get_pacer
+
+logger = logging.getLogger('PingDiff')
+
+# Socket kinds, reported as the backend name
+SOCKET_DGRAM = "icmp-dgram"
+SOCKET_RAW = "icmp-raw"
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# type, code, checksum, identifier, sequence
+ICMP_HEADER = struct.Struct("!BBHHH")
+PAYLOAD = b"pingdiff" + bytes(24)
+
+# Seconds between echo requests (same as the system ping default)
+DEFAULT_INTERVAL = 1.0
+
+# Why a target stopped being probed before all its rounds were sent
+ABORT_UNREACHABLE = "unreachable"
+ABORT_BUDGET = "budget"
+ABORT_RETIRED = "retired"
+
+# Multiplexed prober buffers
+RECV_BUFFER_SIZE = 2048
+SOCKET_RCVBUF = 1 << 20
+SEQ_SPACE = 1 << 16
+SEND_BATCH = 256
+SEND_RETRY_DELAY = 0.001
+
+
+def checksum(data: bytes) -> int:
+    """Internet checksum (RFC 1071) of a byte string."""
+    if len(data) % 2:
+        data += b"\x00"
+    return fold_checksum(sum(struct.unpack(f"!{len(data) // 2}H", data)))
+
+
+def fold_checksum(total: int) -> int:
+    """Fold a 32-bit sum of 16-bit words into a one's complement checksum."""
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, seq: int, payload: bytes = PAYLOAD,
+                       ipv6: bool = False) -> bytes:
+    """
+    Build an ICMP echo request packet.
+    The kernel fills in the ICMPv6 checksum, so it is left at zero for IPv6.
+    """
+    icmp_type = ICMPV6_ECHO_REQUEST if ipv6 else ICMP_ECHO_REQUEST
+    header = ICMP_HEADER.pack(icmp_type, 0, 0, ident & 0xFFFF, seq & 0xFFFF)
+    if ipv6:
+        return header + payload
+    csum = checksum(header + payload)
+    return ICMP_HEADER.pack(icmp_type, 0, csum, ident & 0xFFFF, seq & 0xFFFF) + payload
+
+
+def parse_echo_reply(packet: bytes, ipv6: bool = False) -> Optional[Tuple[int, int]]:
+    """
+    Parse an ICMP echo reply.
+    Raw IPv4 sockets (and datagram sockets on macOS) deliver the IP header too,
+    so it is stripped when present.
+
+    Returns:
+        (identifier, sequence) or None if the packet is not an echo reply
+    """
+    if not ipv6 and len(packet) >= 20 and packet[0] >> 4 == 4:
+        packet = packet[(packet[0] & 0x0F) * 4:]
+
+    if len(packet) < ICMP_HEADER.size:
+        return None
+
+    icmp_type, code, _, ident, seq = ICMP_HEADER.unpack_from(packet)
+    expected = ICMPV6_ECHO_REPLY if ipv6 else ICMP_ECHO_REPLY
+    if icmp_type != expected or code != 0:
+        return None
+    return ident, seq
+
+
+def open_icmp_socket(ipv6: bool = False) -> Tuple[socket.socket, str]:
+    """
+    Open an ICMP socket, preferring unprivileged datagram sockets
+    (Linux ping_group_range, macOS) and falling back to raw sockets
+    when the process has CAP_NET_RAW / root.
+
+    Raises:
+        OSError if neither socket type is permitted
+    """
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    proto = socket.IPPROTO_ICMPV6 if ipv6 else socket.IPPROTO_ICMP
+
+    try:
+        return socket.socket(family, socket.SOCK_DGRAM, proto), SOCKET_DGRAM
+    except OSError as e:
+        logger.debug(f"ICMP datagram socket unavailable: {e}")
+
+    return socket.socket(family, socket.SOCK_RAW, proto), SOCKET_RAW
+
+
+def detect_socket_kind() -> Optional[str]:
+    """Return the ICMP socket kind this process may open, or None."""
+    try:
+        sock, kind = open_icmp_socket()
+    except OSError as e:
+        logger.debug(f"ICMP raw socket unavailable: {e}")
+        return None
+    sock.close()
+    return kind
+
+
+def ping_native(ip: str, count: int = 10, timeout: int = 1,
+                interval: float = DEFAULT_INTERVAL, pacer: Optional[Pacer] = None) -> Dict:
+    """
+    Ping a server over a native ICMP socket.
+    Returns the same dict shape as ping_tester.ping_server.
+    Sends are paced by `pacer` (the shared process-wide pacer by default).
+
+    Raises:
+        OSError if no ICMP socket can be opened
+    """
+    address = ipaddress.ip_address(ip.strip())
+    ip = str(address)
+    ipv6 = address.version == 6
+    sock, kind = open_icmp_socket(ipv6)
+    # Datagram sockets get their identifier rewritten by the kernel
+    ident = (os.getpid() ^ id(sock)) & 0xFFFF
+    pacer = pacer or get_pacer()
+    ping_times = []
+
+    try:
+        sock.setblocking(False)
+        for seq in range(count):
+            pacer.wait(ip)
+            sent_at = time.perf_counter()
+            sock.sendto(build_echo_request(ident, seq, ipv6=ipv6), (ip, 0))
+
+            deadline = sent_at + timeout
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                ready, _, _ = select.select([sock], [], [], remaining)
+                if not ready:
+                    break
+                packet, addr = sock.recvfrom(1024)
+                received_at = time.perf_counter()
+                reply = parse_echo_reply(packet, ipv6)
+                if reply is None or addr[0] != ip or reply[1] != seq:
+                    continue
+                if kind == SOCKET_RAW and reply[0] != ident:
+                    continue
+                ping_times.append(round((received_at - sent_at) * 1000, 2))
+                break
+
+            if seq < count - 1:
+                pause = sent_at + interval - time.perf_counter()
+                if pause > 0:
+                    time.sleep(pause)
+    finally:
+        sock.close()
+
+    packets_received = len(ping_times)
+    return {
+        "ping_times": ping_times,
+        "packet_loss": ((count - packets_received) / count) * 100 if count else 100.0,
+        "packets_sent": count,
+        "packets_received": packets_received,
+        "error": None,
+        "backend": kind,
+    }
+
+
+class TargetResult(NamedTuple):
+    """Outcome of one target in a MultiProber sweep"""
+    rtts: List[float]  # replies in ms, lost probes omitted
+    sent: int  # echo requests actually sent
+    aborted: Optional[str] = None  # ABORT_* if probing stopped early
+    error: Optional[str] = None  # why the last probe that could not be sent failed
+
+
+class MultiProber:
+    """
+    Probe many targets concurrently over one ICMP socket per address family.
+
+    Each echo request takes the next 16-bit sequence number from a shared
+    counter; a preallocated sequence table maps it back to the target and
+    round, so replies are matched in O(1) by a single receive callback on
+    the asyncio event loop. Send and receive buffers are allocated once,
+    and per-sweep state is a few flat arrays, so memory grows only with
+    targets * count and no thread is needed per target.
+
+    Requires a selector event loop (add_reader), i.e. Linux or macOS.
+    One sweep may run at a time per prober.
+    """
+
+    def __init__(self):
+        self._sockets: Dict[int, Tuple[socket.socket, str]] = {}
+        self.ident = (os.getpid() ^ id(self)) & 0xFFFF
+        self._send_buf = bytearray(ICMP_HEADER.size + len(PAYLOAD))
+        self._send_buf[ICMP_HEADER.size:] = PAYLOAD
+        self._payload_sum = sum(struct.unpack(f"!{len(PAYLOAD) // 2}H", PAYLOAD))
+        self._recv_buf = bytearray(RECV_BUFFER_SIZE)
+        self._recv_view = memoryview(self._recv_buf)
+        self._pending = array('l', [-1]) * SEQ_SPACE
+        self._next_seq = 0
+        # Sequence numbers sent but not yet replied to or expired, oldest first
+        self._oldest_seq = 0
+        self._in_flight = 0
+        self._sweep: Optional[_SweepState] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def kind(self) -> Optional[str]:
+        """Socket kind of the first socket opened (the reported backend)."""
+        for _, kind in self._sockets.values():
+            return kind
+        return None
+
+    def close(self):
+        for sock, _ in self._sockets.values():
+            sock.close()
+        self._sockets.clear()
+
+    def _socket_for(self, version: int) -> Tuple[socket.socket, str]:
+        if version not in self._sockets:
+            sock, kind = open_icmp_socket(ipv6=(version == 6))
+            sock.setblocking(False)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+            except OSError:
+                pass
+            self._sockets[version] = (sock, kind)
+        return self._sockets[version]
+
+    def _send(self, sock: socket.socket, ip: str, ipv6: bool, slot: int) -> bool:
+        """
+        Send one echo request for a sweep slot. Returns False if the socket
+        is full; a probe that cannot be sent at all (e.g. no route to the
+        address) is settled as lost.
+        """
+        if self._in_flight == SEQ_SPACE:
+            # Sequence space exhausted: the oldest probe is written off
+            self._expire_oldest()
+
+        seq = self._next_seq
+        buf = self._send_buf
+        if ipv6:
+            ICMP_HEADER.pack_into(buf, 0, ICMPV6_ECHO_REQUEST, 0, 0, self.ident, seq)
+        else:
+            # Header words summed directly so no temporary packet is built
+            csum = fold_checksum((ICMP_ECHO_REQUEST << 8) + self.ident + seq + self._payload_sum)
+            ICMP_HEADER.pack_into(buf, 0, ICMP_ECHO_REQUEST, 0, csum, self.ident, seq)
+
+        self._sweep.sent_at[slot] = time.perf_counter()
+        try:
+            sock.sendto(buf, (ip, 0))
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            self._send_failed(slot, e)
+            return True
+
+        self._pending[seq] = slot
+        self._next_seq = (seq + 1) % SEQ_SPACE
+        self._in_flight += 1
+        return True
+
+    def _send_failed(self, slot: int, error: OSError) -> None:
+        """Settle a probe that never left as lost, keeping the error for its target."""
+        state = self._sweep
+        state.sent_at[slot] = 0.0
+        state.errors[slot // state.count] = error.strerror or str(error)
+        self._settle(slot, None)
+
+    def _on_readable(self, sock: socket.socket, kind: str, ipv6: bool) -> None:
+        """Read every queued reply on a socket and record its RTT."""
+        state = self._sweep
+        while True:
+            try:
+                size, addr = sock.recvfrom_into(self._recv_buf)
+            except (BlockingIOError, InterruptedError):
+                return
+            received_at = time.perf_counter()
+
+            reply = parse_echo_reply(self._recv_view[:size], ipv6)
+            if reply is None or state is None:
+                continue
+            ident, seq = reply
+            if kind == SOCKET_RAW and ident != self.ident:
+                continue
+
+            slot = self._pending[seq]
+            if slot < 0 or state.addresses[slot // state.count] != addr[0]:
+                continue
+
+            rtt = (received_at - state.sent_at[slot]) * 1000
+            self._resolve(seq, rtt if rtt <= state.timeout * 1000 else None)
+
+    def _resolve(self, seq: int, rtt: Optional[float]) -> None:
+        """Settle an in-flight probe as answered (rtt in ms) or lost (None)."""
+        slot = self._pending[seq]
+        self._pending[seq] = -1
+        self._settle(slot, rtt)
+
+    def _settle(self, slot: int, rtt: Optional[float], report: bool = True) -> None:
+        state = self._sweep
+        if state.settled[slot]:
+            return
+        state.settled[slot] = 1
+        target = slot // state.count
+        if rtt is not None:
+            state.rtts[slot] = rtt
+            state.replied[target] = 1
+
+        if report and state.on_probe:
+            state.on_probe(target, slot % state.count, rtt)
+        state.remaining[target] -= 1
+        if state.remaining[target] == 0:
+            state.done += 1
+            if state.on_done:
+                state.on_done(target, state.result_for(target))
+            if state.done == len(state.addresses):
+                state.finished.set()
+        elif (rtt is None and state.max_losses and not state.replied[target]
+              and state.aborted[target] is None
+              and state.count - state.remaining[target] >= state.max_losses):
+            self._abort(target, ABORT_UNREACHABLE)
+
+    def _abort(self, target: int, reason: str, drain: bool = False) -> None:
+        """
+        Stop probing a target. Rounds not yet sent are skipped; probes still
+        in flight are written off and any late reply to them is ignored,
+        unless drain is set, in which case they complete as usual.
+        """
+        state = self._sweep
+        state.aborted[target] = reason
+        base = target * state.count
+        for slot in range(base, base + state.count):
+            if state.sent_at[slot] == 0.0:
+                self._settle(slot, None, report=False)
+            elif not drain:
+                self._settle(slot, None)
+
+    def retire(self, target: int) -> None:
+        """
+        Send no further rounds to a target of the running sweep (for
+        example from an on_round callback). Probes already in flight
+        still complete, and the target finishes with ABORT_RETIRED.
+        """
+        state = self._sweep
+        if state is not None and state.aborted[target] is None and state.remaining[target]:
+            self._abort(target, ABORT_RETIRED, drain=True)
+
+    def _expire_oldest(self) -> None:
+        seq = self._oldest_seq
+        if self._pending[seq] >= 0:
+            self._resolve(seq, None)
+        self._oldest_seq = (seq + 1) % SEQ_SPACE
+        self._in_flight -= 1
+
+    def _abandon(self) -> None:
+        """Abort every target still being probed once the time budget is spent."""
+        state = self._sweep
+        for target in range(len(state.addresses)):
+            if state.remaining[target]:
+                self._abort(target, ABORT_BUDGET)
+
+    def _expire(self, now: float) -> Optional[float]:
+        """
+        Write off probes whose reply deadline has passed.
+
+        Returns:
+            perf_counter time of the next deadline, or None if nothing is in flight
+        """
+        state = self._sweep
+        while self._in_flight:
+            slot = self._pending[self._oldest_seq]
+            if slot >= 0 and not state.settled[slot]:
+                deadline = state.sent_at[slot] + state.timeout
+                if deadline > now:
+                    return deadline
+            self._expire_oldest()
+        return None
+
+    async def sweep(self, targets: List[str], count: int = 10, timeout: float = 1,
+                    interval: float = DEFAULT_INTERVAL,
+                    on_done: Optional[Callable[[int, TargetResult], None]] = None,
+                    on_probe: Optional[Callable[[int, int, Optional[float]], None]] = None,
+                    budget: Optional[float] = None,
+                    max_losses: Optional[int] = None,
+                    on_round: Optional[Callable[[int], None]] = None,
+                    rate: Optional[float] = None,
+                    pacer: Optional[Pacer] = None) -> List[List[float]]:
+        """
+        Send `count` rounds of echo requests to every target, one round per
+        interval, and collect the replies. Sends are interleaved round-robin
+        across targets and spread evenly over each interval rather than sent
+        as one burst.
+
+        Args:
+            targets: IP addresses (IPv4 and IPv6 may be mixed)
+            count: Echo requests per target
+            timeout: Seconds to wait for each reply
+            interval: Seconds between rounds
+            on_done: Optional callback(target_index, TargetResult) once a
+                target's last probe is answered or written off
+            on_probe: Optional callback(target_index, round, rtt_ms) as each
+                probe is answered, or written off with rtt None
+            budget: Optional seconds the whole sweep may take; targets still
+                being probed then are aborted with ABORT_BUDGET
+            max_losses: Optional number of lost probes, with no reply at all,
+                after which a target is aborted with ABORT_UNREACHABLE
+            on_round: Optional callback(round) before each round after the
+                first is sent; it may call retire() to drop targets
+            rate: Optional cap on echo requests per second across all targets;
+                rounds stretch beyond `interval` if needed to respect it
+            pacer: Pacer for per-prefix and global rate limits, shared with
+                every other backend (the process-wide pacer by default)
+
+        Returns:
+            Per-target list of RTTs in ms (lost probes omitted), in target order
+
+        Targets that cannot be sent to (no socket for their address family,
+        or a send error such as no route) have those probes written off
+        as lost, with the error in their TargetResult, while the rest of
+        the sweep carries on.
+
+        Raises:
+            OSError if no ICMP socket can be opened
+        """
+        n = len(targets)
+        if n == 0 or count <= 0:
+            return [[] for _ in targets]
+
+        parsed = [ipaddress.ip_address(t.strip()) for t in targets]
+        socket_errors: Dict[int, OSError] = {}
+        routes: List[Optional[Tuple[socket.socket, str, bool]]] = []
+        for address in parsed:
+            if address.version not in socket_errors:
+                try:
+                    routes.append(self._socket_for(address.version) + (address.version == 6,))
+                    continue
+                except OSError as e:
+                    socket_errors[address.version] = e
+            routes.append(None)
+        if all(route is None for route in routes):
+            raise next(iter(socket_errors.values()))
+        readers = {route[0].fileno(): route for route in routes if route is not None}
+
+        state = _SweepState([str(a) for a in parsed], count, timeout, on_done, on_probe,
+                            max_losses)
+        pacer = pacer or get_pacer()
+        self._sweep = state
+        loop = asyncio.get_running_loop()
+        for fd, args in readers.items():
+            loop.add_reader(fd, self._on_readable, *args)
+
+        try:
+            start = loop.time()
+            deadline = None if budget is None else time.perf_counter() + budget
+            # Round-robin time slots: probe k goes to target k % n at start + k * gap,
+            # so every target is sampled once per interval over the same window
+            gap = interval / n
+            if rate:
+                gap = max(gap, 1.0 / rate)
+            total = n * count
+            # Probes whose prefix (or the global cap) was out of tokens, as
+            # (reserved send time, slot, target); the rest of the sweep goes
+            # on around them rather than waiting
+            held: List[Tuple[float, int, int]] = []
+
+            async def send(i: int, slot: int) -> None:
+                sock, kind, ipv6 = routes[i]
+                while not self._send(sock, state.addresses[i], ipv6, slot):
+                    await asyncio.sleep(SEND_RETRY_DELAY)
+
+            k = 0
+            while k < total or held:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                now = loop.time()
+                sent = 0
+                while held and held[0][0] <= now:
+                    _, slot, i = heapq.heappop(held)
+                    if not state.settled[slot]:
+                        await send(i, slot)
+                        sent += 1
+                if k < total:
+                    delay = start + k * gap - now
+                    if held:
+                        delay = min(delay, held[0][0] - now)
+                elif held:
+                    delay = held[0][0] - now
+                else:
+                    break
+                if delay > 0:
+                    if deadline is not None:
+                        delay = min(delay, deadline - time.perf_counter())
+                    await asyncio.sleep(max(0.0, delay))
+                    continue
+
+                # Send every probe whose slot has come up
+                due = min(total, int((loop.time() - start) / gap) + 1)
+                while k < due:
+                    round_no, i = divmod(k, n)
+                    if i == 0 and round_no and on_round:
+                        on_round(round_no)
+                        if state.finished.is_set():
+                            k = total
+                            held.clear()
+                            break
+                    k += 1
+                    slot = i * count + round_no
+                    if state.settled[slot]:
+                        continue  # target aborted
+                    if routes[i] is None:
+                        self._send_failed(slot, socket_errors[parsed[i].version])
+                        continue
+                    wait = pacer.reserve(state.addresses[i])
+                    if wait > 0:
+                        heapq.heappush(held, (loop.time() + wait, slot, i))
+                        continue
+                    await send(i, slot)
+                    sent += 1
+                    if sent % SEND_BATCH == 0:
+                        # Let the reader callback keep up with a large batch
+                        await asyncio.sleep(0)
+                self._expire(time.perf_counter())
+
+            while not state.finished.is_set():
+                now = time.perf_counter()
+                wake = self._expire(now)
+                if wake is None:
+                    break
+                if deadline is not None:
+                    if now >= deadline:
+                        break
+                    wake = min(wake, deadline)
+                try:
+                    await asyncio.wait_for(state.finished.wait(),
+                                           max(0.0, wake - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    pass
+
+            if not state.finished.is_set():
+                # Out of time budget
+                self._abandon()
+        finally:
+            for fd in readers:
+                loop.remove_reader(fd)
+            self._pending = array('l', [-1]) * SEQ_SPACE
+            self._in_flight = 0
+            self._oldest_seq = self._next_seq
+            self._sweep = None
+
+        return [state.times_for(i) for i in range(n)]
+
+
+class _SweepState:
+    """Flat per-sweep arrays shared by the sender and the reply callback."""
+
+    __slots__ = ("addresses", "count", "timeout", "on_done", "on_probe", "max_losses",
+                 "sent_at", "rtts", "settled", "remaining", "replied", "aborted",
+                 "errors", "done", "finished")
+
+    def __init__(self, addresses: List[str], count: int, timeout: float,
+                 on_done: Optional[Callable[[int, TargetResult], None]],
+                 on_probe: Optional[Callable[[int, int, Optional[float]], None]],
+                 max_losses: Optional[int] = None):
+        n = len(addresses)
+        self.addresses = addresses
+        self.count = count
+        self.timeout = timeout
+        self.on_done = on_done
+        self.on_probe = on_probe
+        self.max_losses = max_losses
+        self.sent_at = array('d', [0.0]) * (n * count)
+        self.rtts = array('d', [math.nan]) * (n * count)
+        self.settled = bytearray(n * count)
+        self.remaining = array('l', [count]) * n
+        self.replied = bytearray(n)
+        self.aborted: List[Optional[str]] = [None] * n
+        self.errors: List[Optional[str]] = [None] * n
+        self.done = 0
+        self.finished = asyncio.Event()
+
+    def times_for(self, target: int) -> List[float]:
+        base = target * self.count
+        return [round(rtt, 2) for rtt in self.rtts[base:base + self.count]
+                if not math.isnan(rtt)]
+
+    def result_for(self, target: int) -> TargetResult:
+        base = target * self.count
+        sent = sum(1 for t in self.sent_at[base:base + self.count] if t != 0.0)
+        return TargetResult(self.times_for(target), sent, self.aborted[target], self.errors[target])
@@ -0,0 +1,143 @@
+"""
+PingDiff Probe Pacer
+Process-wide token buckets that keep our own bursts from tripping ICMP rate limits
+"""
+
+import asyncio
+import ipaddress
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Echo requests per second, and burst size, allowed towards one destination
+# prefix. Edge routers often police ICMP per source, so servers in the same
+# data center share a bucket.
+PREFIX_RATE = 100.0
+PREFIX_BURST = 20
+IPV4_PREFIX = 24
+IPV6_PREFIX = 48
+# Burst allowed by the global cap (the cap itself is off unless set)
+GLOBAL_BURST = 50
+# Forget idle prefix buckets once there are this many
+MAX_BUCKETS = 4096
+
+
+def address_prefix(ip: str) -> Optional[str]:
+    """The /24 (IPv4) or /48 (IPv6) network an address is in, None if it is not an address."""
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except (AttributeError, ValueError):
+        return None
+    bits = IPV4_PREFIX if address.version == 4 else IPV6_PREFIX
+    return str(ipaddress.ip_network(f"{address}/{bits}", strict=False))
+
+
+class TokenBucket:
+    """
+    Token bucket kept as a single "theoretical arrival time" (GCRA): a send
+    is allowed `burst` tokens ahead of the steady rate and no further.
+    """
+
+    __slots__ = ("rate", "burst", "tat")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tat = 0.0
+
+    def earliest(self, now: float) -> float:
+        """Earliest time the next token is available."""
+        return max(now, self.tat - (self.burst - 1) / self.rate)
+
+    def take(self, at: float) -> None:
+        """Spend a token at time `at` (no earlier than earliest())."""
+        self.tat = max(self.tat, at) + 1.0 / self.rate
+
+
+class Pacer:
+    """
+    Paces echo requests per destination prefix and, optionally, globally.
+    Loopback targets are never paced. Safe to share between threads.
+    """
+
+    def __init__(self, rate: Optional[float] = None, prefix_rate: float = PREFIX_RATE,
+                 prefix_burst: int = PREFIX_BURST,
+                 clock: Callable[[], float] = time.monotonic):
+        self.prefix_rate = prefix_rate
+        self.prefix_burst = prefix_burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._prefixes: Dict[str, Optional[str]] = {}
+        self._global: Optional[TokenBucket] = None
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self._global.rate if self._global else None
+
+    def set_rate(self, rate: Optional[float]) -> None:
+        """Set the global cap in echo requests per second (None for no cap)."""
+        with self._lock:
+            self._global = TokenBucket(rate, GLOBAL_BURST) if rate else None
+
+    def _prefix(self, ip: str) -> Optional[str]:
+        """Bucket key for an address, None for addresses that are not paced."""
+        if ip not in self._prefixes:
+            prefix = address_prefix(ip)
+            if prefix is not None and ipaddress.ip_address(ip.strip()).is_loopback:
+                prefix = None
+            self._prefixes[ip] = prefix
+        return self._prefixes[ip]
+
+    def reserve(self, ip: str) -> float:
+        """
+        Reserve the next send slot towards ip. Returns the seconds to wait
+        before sending; the slot is taken either way.
+        """
+        with self._lock:
+            prefix = self._prefix(ip)
+            if prefix is None:
+                return 0.0
+            now = self._clock()
+            bucket = self._buckets.get(prefix)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune(now)
+                bucket = self._buckets[prefix] = TokenBucket(self.prefix_rate, self.prefix_burst)
+            at = bucket.earliest(now)
+            if self._global:
+                at = max(at, self._global.earliest(now))
+                self._global.take(at)
+            bucket.take(at)
+            return at - now
+
+    def _prune(self, now: float) -> None:
+        """Drop buckets that have refilled completely."""
+        self._buckets = {p: b for p, b in self._buckets.items() if b.tat > now}
+        self._prefixes.clear()
+
+    def wait(self, ip: str) -> None:
+        """Block until a probe may be sent to ip."""
+        delay = self.reserve(ip)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, ip: str) -> None:
+        """Wait, without blocking the event loop, until a probe may be sent to ip."""
+        delay = self.reserve(ip)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_shared: Optional[Pacer] = None
+_shared_lock = threading.Lock()
+
+
+def get_pacer() -> Pacer:
+    """The pacer shared by every probe backend in this process."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Pacer()
+        return _shared
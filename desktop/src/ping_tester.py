@@ -4,6 +4,8 @@ Core ping testing logic with packet loss and jitter calculation
 Optimized for speed with parallel testing and hidden console
 """
 
+import asyncio
+import bisect
 import subprocess
 import platform
 import re
@@ -11,9 +13,19 @@ import statistics
 import sys
 import ipaddress
 import logging
-from typing import Dict, List, Optional, Callable
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import math
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Callable, Tuple
+from dataclasses import dataclass, field, replace
+
+import icmp_probe
+from circuit_breaker import CircuitBreaker
+from pacer import address_prefix, get_pacer
+from probe_log import ProbeLog
+from result_cache import CLAIM_POLL, ResultCache
+from running_stats import RunningStats
 
 logger = logging.getLogger('PingDiff')
 
@@ -47,8 +59,108 @@ else:
     STARTUPINFO = None
     CREATE_NO_WINDOW = 0
 
+# Probe backends: native ICMP sockets (icmp_probe.SOCKET_*) or system ping
+BACKEND_SUBPROCESS = "subprocess"
+_detected_backend: Optional[str] = None
 
-@dataclass
+# System ping processes allowed to run at once in the subprocess backend.
+# They are started in staggered slots so all servers share one sampling window.
+MAX_CONCURRENT_PINGS = 64
+# Adaptive concurrency (AIMD): start this many processes, add one per server
+# that tested clean, halve when a server shows signs of local queueing
+INITIAL_CONCURRENCY = 4
+# A server's test counts as congested above this packet loss (%) or when its
+# median ping exceeds its best ping by more than the ratio and the slack (ms)
+CONGESTION_LOSS = 10.0
+CONGESTION_RTT_RATIO = 1.5
+CONGESTION_RTT_SLACK = 10.0
+
+# Windows format: "Reply from x.x.x.x: bytes=32 time=25ms TTL=57"
+WINDOWS_TIME_PATTERN = re.compile(r"time[=<](\d+)ms")
+# Linux/Mac format: "64 bytes from x.x.x.x: icmp_seq=1 ttl=57 time=25.3 ms"
+UNIX_TIME_PATTERN = re.compile(r"time=(\d+\.?\d*)\s*ms")
+# Sequence number on Linux/Mac reply and loss lines ("icmp_seq=3", "icmp_seq 3")
+UNIX_SEQ_PATTERN = re.compile(r"icmp_seq[=\s](\d+)")
+# Linux -O "no answer yet for icmp_seq=3", Mac "Request timeout for icmp_seq 3"
+UNIX_LOSS_PATTERN = re.compile(r"no answer yet|Request timeout")
+# Windows "Request timed out.", "Destination host unreachable.", "General failure."
+WINDOWS_LOSS_PATTERN = re.compile(r"timed out|unreachable|General failure", re.IGNORECASE)
+
+# Seconds between probes sent by the system ping command
+PING_INTERVAL = 1.0
+# Burst mode: shortest interval the native backend will send at
+MIN_BURST_INTERVAL = 0.01
+# Shortest -i an unprivileged system ping accepts (Windows ping has no -i)
+MIN_PING_INTERVAL = {"linux": 0.2, "darwin": 0.1}
+# Allowance for process start-up before a silent probe is reported as lost
+STREAM_GRACE = 0.25
+
+# Fast-fail: stop probing a server after this many losses with no reply at all
+MAX_CONSECUTIVE_LOSSES = 3
+INVALID_IP_ERROR = "Invalid IP address"
+BUDGET_ERROR = "Time budget exceeded"
+SKIPPED_ERROR = "Unreachable in recent runs, retesting in {:.0f}s"
+
+# Race mode: a server is dropped once the lower confidence bound of its
+# average ping (mean - RACE_Z standard errors) is above the leader's upper bound
+RACE_Z = 3.0
+RACE_MIN_PROBES = 3
+# Floor on the standard deviation so a few identical replies do not give a zero-width bound
+RACE_MIN_STDEV = 1.0
+
+# Two-phase sweep: which pass produced a PingResult
+PHASE_SCREEN = "screen"
+PHASE_DEEP = "deep"
+# Probes per server in the screening pass
+SCREEN_COUNT = 2
+UNREACHABLE_ERROR = "No reply to {} pings in a row"
+# Result error for a server the native prober could not send any ping to
+SEND_ERROR = "Could not send pings: {}"
+
+# Target deduplication: servers sharing an address (or, with DEDUPE_PREFIX,
+# a /24 or /48 network, e.g. one anycast edge) are probed once and the
+# result is reported for each of them
+DEDUPE_IP = "ip"
+DEDUPE_PREFIX = "prefix"
+
+
+class RawTimes(array):
+    """
+    Reply times in ms packed as C doubles: 8 bytes a reply instead of a
+    float object plus a list slot. Compares equal to a list or tuple of the
+    same values and repr()s like one.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, values=()):
+        return super().__new__(cls, "d", values)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return array.__eq__(self, other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __reduce_ex__(self, protocol):
+        return type(self), (self.tolist(),)
+
+    def __copy__(self) -> "RawTimes":
+        return type(self)(self)
+
+    def __deepcopy__(self, memo) -> "RawTimes":
+        return type(self)(self)
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
+
+
+@dataclass(slots=True)
 class PingResult:
     """Result of a ping test to a single server"""
     server_id: str
@@ -61,12 +173,117 @@ class PingResult:
     packet_loss: float
     successful_pings: int
     total_pings: int
-    raw_times: List[float]
+    raw_times: RawTimes  # any sequence of floats is packed on construction
     region: str = ""
     error: Optional[str] = None
+    backend: str = ""
+    phase: str = ""  # PHASE_SCREEN / PHASE_DEEP in a two-phase sweep
+    game: str = ""  # game slug, from the server dict
+    # Reply time percentiles, within quantile_sketch.RELATIVE_ACCURACY
+    ping_p50: float = 0.0
+    ping_p95: float = 0.0
+    ping_p99: float = 0.0
+    # Per-probe accumulator, kept only when raw_times is not retained (it is
+    # then the only copy of the replies); the summary fields above cover the rest
+    stats: Optional[RunningStats] = None
+    age: float = 0.0  # seconds since it was measured, when served from a ResultCache
+    eliminated: bool = False  # dropped early by race mode, after only a few pings
+
+    def __post_init__(self):
+        if not isinstance(self.raw_times, RawTimes):
+            self.raw_times = RawTimes(self.raw_times or ())
+
+    @property
+    def partial(self) -> bool:
+        """Measured with fewer pings than the run asked for by design; kept out of history and uploads."""
+        return self.eliminated or self.phase == PHASE_SCREEN
+
+
+@dataclass
+class SweepStats:
+    """Counters for one test_all_servers run, filled in as it goes"""
+    servers: int = 0
+    probes_planned: int = 0
+    probes_sent: int = 0
+    eliminated: int = 0  # servers dropped early by race mode
+    elapsed: float = 0.0
+    concurrency: int = 0  # most servers tested at once
+    shared: int = 0  # servers reported from another server's probes (dedupe)
+    cache_hits: int = 0  # servers served from a ResultCache instead of probed
+    cache_misses: int = 0
+
+    @property
+    def probes_saved(self) -> int:
+        return max(0, self.probes_planned - self.probes_sent)
+
+
+@dataclass
+class ProbeEvent:
+    """A single probe settling: a reply (rtt in ms) or a loss (rtt None)"""
+    server_id: str
+    server_location: str
+    ip_address: str
+    seq: int
+    rtt: Optional[float]
+    region: str = ""
+
+
+def get_ping_backend(refresh: bool = False) -> str:
+    """
+    Pick the probe backend for this process (detected once and cached).
+    Native ICMP sockets are used when the OS allows them; Windows and
+    unprivileged hosts without ping_group_range use the system ping command.
+
+    Returns:
+        icmp_probe.SOCKET_DGRAM, icmp_probe.SOCKET_RAW or BACKEND_SUBPROCESS
+    """
+    global _detected_backend
+    if _detected_backend is None or refresh:
+        kind = None
+        if sys.platform != 'win32':
+            kind = icmp_probe.detect_socket_kind()
+        _detected_backend = kind or BACKEND_SUBPROCESS
+        logger.info(f"Ping backend: {_detected_backend}")
+    return _detected_backend
 
 
-def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
+def probe_interval(ping_count: int, interval_ms: Optional[float] = None,
+                   budget: Optional[float] = None) -> float:
+    """
+    Seconds between probes to one server.
+    An explicit interval_ms wins. Otherwise a time budget spreads the probes
+    over half of it, leaving the rest for the last replies, but never sends
+    slower than the standard one-second ping interval.
+    """
+    if interval_ms is not None:
+        return max(interval_ms / 1000, MIN_BURST_INTERVAL)
+    if budget is not None and ping_count > 0:
+        return min(PING_INTERVAL, max(budget / (2 * ping_count), MIN_BURST_INTERVAL))
+    return PING_INTERVAL
+
+
+def _subprocess_interval(interval: float, system: str) -> float:
+    """Clamp a probe interval to what an unprivileged system ping accepts."""
+    if system == "windows":
+        return PING_INTERVAL
+    return max(interval, MIN_PING_INTERVAL.get(system, PING_INTERVAL))
+
+
+def _ping_command(ip: str, count: int, timeout: int, system: str,
+                  interval: float = PING_INTERVAL) -> List[str]:
+    """Build the system ping command line for this platform."""
+    if system == "windows":
+        # Windows ping command - reduced timeout for speed
+        return ["ping", "-n", str(count), "-w", str(timeout * 1000), ip]
+    # Linux/Mac ping command
+    cmd = ["ping", "-c", str(count), "-W", str(timeout)]
+    if interval != PING_INTERVAL:
+        cmd += ["-i", f"{interval:g}"]
+    return cmd + [ip]
+
+
+def ping_server(ip: str, count: int = 10, timeout: int = 1,
+                interval: float = PING_INTERVAL) -> Dict:
     """
     Ping a server and return detailed statistics.
     Uses system ping command for reliability.
@@ -83,16 +300,18 @@ def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
             "packet_loss": 100.0,
             "packets_sent": count,
             "packets_received": 0,
-            "error": "Invalid IP address"
+            "error": INVALID_IP_ERROR,
+            "backend": BACKEND_SUBPROCESS
         }
 
     system = platform.system().lower()
+    interval = _subprocess_interval(interval, system)
     ping_times = []
 
     try:
+        cmd = _ping_command(ip, count, timeout, system, interval)
+        get_pacer().wait(ip)
         if system == "windows":
-            # Windows ping command - reduced timeout for speed
-            cmd = ["ping", "-n", str(count), "-w", str(timeout * 1000), ip]
             result = subprocess.run(
                 cmd,
                 capture_output=True,
@@ -102,27 +321,18 @@ def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
                 creationflags=CREATE_NO_WINDOW
             )
         else:
-            # Linux/Mac ping command
-            cmd = ["ping", "-c", str(count), "-W", str(timeout), ip]
             result = subprocess.run(
                 cmd,
                 capture_output=True,
                 text=True,
-                timeout=count * timeout + 5
+                timeout=count * max(interval, timeout) + 5
             )
 
         output = result.stdout
 
         # Parse ping times from output
-        if system == "windows":
-            # Windows format: "Reply from x.x.x.x: bytes=32 time=25ms TTL=57"
-            pattern = r"time[=<](\d+)ms"
-        else:
-            # Linux/Mac format: "64 bytes from x.x.x.x: icmp_seq=1 ttl=57 time=25.3 ms"
-            pattern = r"time=(\d+\.?\d*)\s*ms"
-
-        matches = re.findall(pattern, output)
-        ping_times = [float(t) for t in matches]
+        pattern = WINDOWS_TIME_PATTERN if system == "windows" else UNIX_TIME_PATTERN
+        ping_times = [float(t) for t in pattern.findall(output)]
 
         # Calculate packet loss
         packets_sent = count
@@ -134,7 +344,8 @@ def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
             "packet_loss": packet_loss,
             "packets_sent": packets_sent,
             "packets_received": packets_received,
-            "error": None
+            "error": None,
+            "backend": BACKEND_SUBPROCESS
         }
 
     except subprocess.TimeoutExpired:
@@ -143,7 +354,8 @@ def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
             "packet_loss": 100.0,
             "packets_sent": count,
             "packets_received": len(ping_times),
-            "error": "Request timed out"
+            "error": "Request timed out",
+            "backend": BACKEND_SUBPROCESS
         }
     except Exception as e:
         return {
@@ -151,10 +363,252 @@ def ping_server(ip: str, count: int = 10, timeout: int = 1) -> Dict:
             "packet_loss": 100.0,
             "packets_sent": count,
             "packets_received": 0,
-            "error": str(e)
+            "error": str(e),
+            "backend": BACKEND_SUBPROCESS
         }
 
 
+def parse_ping_line(line: str, system: str) -> Optional[Tuple[Optional[int], Optional[float]]]:
+    """
+    Parse one line of system ping output.
+
+    Returns:
+        (seq, rtt_ms) for a reply, (seq, None) for a reported loss, or None
+        for any other line. seq is 0-based, or None on Windows, which does
+        not print sequence numbers.
+    """
+    if system == "windows":
+        match = WINDOWS_TIME_PATTERN.search(line)
+        if match:
+            return None, float(match.group(1))
+        if WINDOWS_LOSS_PATTERN.search(line):
+            return None, None
+        return None
+
+    seq_match = UNIX_SEQ_PATTERN.search(line)
+    if not seq_match:
+        return None
+    # Linux (iputils) numbers probes from 1, macOS from 0
+    seq = int(seq_match.group(1)) - (1 if system == "linux" else 0)
+
+    match = UNIX_TIME_PATTERN.search(line)
+    if match:
+        return seq, float(match.group(1))
+    if UNIX_LOSS_PATTERN.search(line):
+        return seq, None
+    return None
+
+
+async def _read_ping_stream(stream: asyncio.StreamReader, count: int, timeout: int,
+                            system: str,
+                            settle: Callable[[int, Optional[float]], None],
+                            interval: float = PING_INTERVAL) -> None:
+    """
+    Read ping output line by line, settling each probe as its line arrives.
+    On Linux/Mac a probe with no reply by its expected send time plus the
+    timeout is settled as lost right away, so silent servers show up
+    before ping exits.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    settled = [False] * count
+    cursor = 0  # first probe not yet settled (Linux/Mac)
+    windows_seq = 0
+
+    def mark(seq: int, rtt: Optional[float]):
+        if 0 <= seq < count and not settled[seq]:
+            settled[seq] = True
+            settle(seq, rtt)
+
+    while True:
+        wait = None
+        if system != "windows":
+            while cursor < count and settled[cursor]:
+                cursor += 1
+            if cursor == count:
+                return
+            wait = start + cursor * interval + timeout + STREAM_GRACE - loop.time()
+            if wait <= 0:
+                mark(cursor, None)
+                continue
+
+        try:
+            line = await asyncio.wait_for(stream.readline(), wait)
+        except asyncio.TimeoutError:
+            continue
+        if not line:
+            # ping exited: anything it never reported was lost
+            for seq in range(count):
+                mark(seq, None)
+            return
+
+        parsed = parse_ping_line(line.decode(errors="replace"), system)
+        if parsed is None:
+            continue
+        seq, rtt = parsed
+        if seq is None:
+            seq = windows_seq
+            windows_seq += 1
+        mark(seq, rtt)
+
+
+class StopPinging(Exception):
+    """
+    Raised from a ping_server_async on_probe callback to stop pinging early.
+    The probes settled so far are kept and the result carries `error`.
+    """
+
+    def __init__(self, error: Optional[str] = None):
+        super().__init__(error)
+        self.error = error
+
+
+async def ping_server_async(ip: str, count: int = 10, timeout: int = 1,
+                            on_probe: Optional[Callable[[int, Optional[float]], None]] = None,
+                            interval: float = PING_INTERVAL,
+                            budget: Optional[float] = None,
+                            max_losses: Optional[int] = None) -> Dict:
+    """
+    Coroutine version of ping_server.
+    Runs system ping with asyncio.create_subprocess_exec, so many servers
+    can be pinged from one event loop without a thread per server, and
+    parses its output line by line as each reply comes in.
+
+    Args:
+        ip: Server IP address
+        count: Number of pings to send
+        timeout: Timeout per ping in seconds
+        on_probe: Optional callback(seq, rtt_ms) per probe; rtt is None for a
+            loss. It may raise StopPinging to end the run early.
+        interval: Seconds between probes, clamped to what the platform's ping allows
+        budget: Optional seconds after which ping is stopped; the probes sent
+            so far are kept and the result carries BUDGET_ERROR
+        max_losses: Optional number of lost probes, with no reply at all,
+            after which ping is stopped early with UNREACHABLE_ERROR
+
+    Returns:
+        Dict in the ping_server format
+    """
+    if not validate_ip(ip):
+        logger.error(f"Rejected invalid IP: {ip}")
+        return {
+            "ping_times": [],
+            "packet_loss": 100.0,
+            "packets_sent": count,
+            "packets_received": 0,
+            "error": INVALID_IP_ERROR,
+            "backend": BACKEND_SUBPROCESS
+        }
+
+    system = platform.system().lower()
+    interval = _subprocess_interval(interval, system)
+    kwargs = {}
+    if system == "windows":
+        kwargs = {"startupinfo": STARTUPINFO, "creationflags": CREATE_NO_WINDOW}
+
+    limit = count * max(interval, timeout) + 5
+    cut_short = budget is not None and budget < limit
+    replies: Dict[int, float] = {}
+    settled = set()
+
+    def settle(seq: int, rtt: Optional[float]):
+        if seq in settled:
+            return
+        settled.add(seq)
+        if rtt is not None:
+            replies[seq] = rtt
+        if on_probe:
+            on_probe(seq, rtt)
+        if max_losses and not replies and len(settled) >= max_losses and len(settled) < count:
+            raise StopPinging(UNREACHABLE_ERROR.format(len(settled)))
+
+    def collected() -> List[float]:
+        return [replies[seq] for seq in sorted(replies)]
+
+    proc = None
+    try:
+        # The process paces its own pings; the shared pacer spaces out the
+        # first one so many processes towards one prefix do not start at once
+        await get_pacer().wait_async(ip)
+        proc = await asyncio.create_subprocess_exec(
+            *_ping_command(ip, count, timeout, system, interval),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            **kwargs
+        )
+        started = asyncio.get_running_loop().time()
+        try:
+            await asyncio.wait_for(
+                _read_ping_stream(proc.stdout, count, timeout, system, settle, interval),
+                budget if cut_short else limit)
+        except StopPinging as stop:
+            return _counted(collected(), len(settled), error=stop.error)
+        except asyncio.TimeoutError:
+            if cut_short:
+                # Out of time budget: keep what the probes sent so far showed
+                elapsed = asyncio.get_running_loop().time() - started
+                sent = min(count, max(len(settled), int(elapsed / interval) + 1))
+                return _counted(collected(), sent, error=BUDGET_ERROR)
+            ping_times = collected()
+            return {
+                "ping_times": ping_times,
+                "packet_loss": 100.0,
+                "packets_sent": count,
+                "packets_received": len(ping_times),
+                "error": "Request timed out",
+                "backend": BACKEND_SUBPROCESS
+            }
+
+        return _counted(collected(), count)
+    except Exception as e:
+        return {
+            "ping_times": [],
+            "packet_loss": 100.0,
+            "packets_sent": count,
+            "packets_received": 0,
+            "error": str(e),
+            "backend": BACKEND_SUBPROCESS
+        }
+    finally:
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+def _counted(ping_times: List[float], sent: int, backend: str = BACKEND_SUBPROCESS,
+             error: Optional[str] = None) -> Dict:
+    """ping_server-style result from the replies to `sent` probes."""
+    packets_received = len(ping_times)
+    return {
+        "ping_times": ping_times,
+        "packet_loss": ((sent - packets_received) / sent) * 100 if sent else 100.0,
+        "packets_sent": sent,
+        "packets_received": packets_received,
+        "error": error,
+        "backend": backend
+    }
+
+
+def ping_host(ip: str, count: int = 10, timeout: int = 1,
+              backend: Optional[str] = None, interval: float = PING_INTERVAL) -> Dict:
+    """
+    Ping a server with the given backend (auto-detected if None).
+    Falls back to the system ping command if the native socket fails.
+
+    Returns:
+        Dict in the ping_server format, plus the backend that was used
+    """
+    backend = backend or get_ping_backend()
+
+    if backend != BACKEND_SUBPROCESS and validate_ip(ip):
+        try:
+            return icmp_probe.ping_native(ip, count=count, timeout=timeout, interval=interval)
+        except OSError as e:
+            logger.warning(f"Native ping to {ip} failed, using system ping: {e}")
+
+    return ping_server(ip, count=count, timeout=timeout, interval=interval)
+
+
 def calculate_jitter(ping_times: List[float]) -> float:
     """
     Calculate jitter (variation in ping times).
@@ -162,16 +616,12 @@ def calculate_jitter(ping_times: List[float]) -> float:
     """
     if len(ping_times) < 2:
         return 0.0
+    return round(RunningStats.from_times(ping_times).jitter, 2)
 
-    differences = []
-    for i in range(1, len(ping_times)):
-        diff = abs(ping_times[i] - ping_times[i-1])
-        differences.append(diff)
-
-    return round(statistics.mean(differences), 2)
 
-
-def test_server(server: Dict, ping_count: int = 10, timeout: int = 1) -> PingResult:
+def test_server(server: Dict, ping_count: int = 10, timeout: int = 1,
+                backend: Optional[str] = None,
+                interval_ms: Optional[float] = None) -> PingResult:
     """
     Run a complete ping test on a server.
 
@@ -179,30 +629,49 @@ def test_server(server: Dict, ping_count: int = 10, timeout: int = 1) -> PingRes
         server: Dict with id, location, ip, port
         ping_count: Number of pings to send
         timeout: Timeout per ping in seconds
+        backend: Probe backend (see get_ping_backend), auto-detected if None
+        interval_ms: Milliseconds between probes (default: one second)
 
     Returns:
         PingResult with all statistics
     """
-    ip = server["ip"]
-    result = ping_server(ip, count=ping_count, timeout=timeout)
+    result = ping_host(server["ip"], count=ping_count, timeout=timeout, backend=backend,
+                       interval=probe_interval(ping_count, interval_ms))
+    return _build_result(server, result)
+
 
+def _build_result(server: Dict, result: Dict, stats: Optional[RunningStats] = None,
+                  retain_raw: bool = True) -> PingResult:
+    """
+    Turn a ping_server-style result dict into a PingResult for a server.
+    `stats` is an accumulator already fed probe by probe; without one it is
+    built from ping_times in a single pass. The PingResult keeps either the
+    list of replies or, with retain_raw=False, the accumulator, never both.
+    """
     ping_times = result["ping_times"]
+    if stats is None or stats.received != len(ping_times):
+        # Not every reply was reported probe by probe
+        stats = RunningStats.from_times(ping_times)
+    if stats.sent < result["packets_sent"]:
+        # Probes written off without being reported one by one (budget, fast-fail)
+        stats.add_losses(result["packets_sent"] - stats.sent)
 
-    if ping_times:
-        ping_avg = round(statistics.mean(ping_times), 2)
-        ping_min = round(min(ping_times), 2)
-        ping_max = round(max(ping_times), 2)
-        jitter = calculate_jitter(ping_times)
+    if stats.received:
+        ping_avg = round(stats.mean, 2)
+        ping_min = round(stats.ping_min, 2)
+        ping_max = round(stats.ping_max, 2)
+        jitter = round(stats.jitter, 2)
     else:
         ping_avg = 0.0
         ping_min = 0.0
         ping_max = 0.0
         jitter = 0.0
+    p50, p95, p99 = (round(stats.quantile(q), 2) for q in (0.5, 0.95, 0.99))
 
     return PingResult(
         server_id=server["id"],
         server_location=server["location"],
-        ip_address=ip,
+        ip_address=server["ip"],
         ping_avg=ping_avg,
         ping_min=ping_min,
         ping_max=ping_max,
@@ -210,17 +679,41 @@ def test_server(server: Dict, ping_count: int = 10, timeout: int = 1) -> PingRes
         packet_loss=round(result["packet_loss"], 2),
         successful_pings=result["packets_received"],
         total_pings=result["packets_sent"],
-        raw_times=ping_times,
+        raw_times=ping_times if retain_raw else [],
         region=server.get("region", ""),
-        error=result["error"]
+        error=result["error"],
+        backend=result.get("backend", ""),
+        game=server.get("game", ""),
+        ping_p50=p50,
+        ping_p95=p95,
+        ping_p99=p99,
+        stats=None if retain_raw else stats,
     )
 
 
 def test_all_servers(servers: List[Dict], ping_count: int = 10,
                      timeout: int = 1, callback: Optional[Callable] = None,
-                     parallel: bool = True) -> List[PingResult]:
+                     parallel: bool = True, backend: Optional[str] = None,
+                     on_probe: Optional[Callable[[ProbeEvent], None]] = None,
+                     interval_ms: Optional[float] = None,
+                     budget: Optional[float] = None,
+                     max_losses: Optional[int] = MAX_CONSECUTIVE_LOSSES,
+                     target_budget: Optional[float] = None,
+                     breaker: Optional[CircuitBreaker] = None,
+                     race: bool = False,
+                     stats: Optional[SweepStats] = None,
+                     top_k: Optional[int] = None,
+                     screen_count: int = SCREEN_COUNT,
+                     rate: Optional[float] = None,
+                     max_concurrency: Optional[int] = None,
+                     retain_raw: bool = True,
+                     dedupe: Optional[str] = DEDUPE_IP,
+                     cache: Optional[ResultCache] = None,
+                     probe_log: Optional[ProbeLog] = None) -> List[PingResult]:
     """
     Test all servers in a list. Uses parallel testing for speed.
+    Blocking wrapper around test_all_servers_async; call that directly
+    from code that already runs an event loop.
 
     Args:
         servers: List of server dicts
@@ -228,71 +721,856 @@ def test_all_servers(servers: List[Dict], ping_count: int = 10,
         timeout: Timeout per ping
         callback: Optional callback(server_index, total_servers, result) for progress
         parallel: Whether to test servers in parallel (much faster)
+        backend: Probe backend (see get_ping_backend), auto-detected if None
+        on_probe: Optional callback(ProbeEvent) as each individual probe settles
+        interval_ms: Milliseconds between probes to a server (burst mode);
+            default is one second, or derived from budget if one is given
+        budget: Optional seconds the whole sweep may take; servers cut
+            short keep the probes sent so far and carry BUDGET_ERROR
+        max_losses: Stop probing a server after this many lost pings with no
+            reply at all (None to always send every ping)
+        target_budget: Optional seconds any one server may take
+        breaker: Optional CircuitBreaker; servers it holds open are skipped
+            and every tested server's outcome is recorded in it (failures
+            only if some server answered, so a local outage trips nothing)
+        race: Stop probing servers that are clearly slower than the current
+            leader, for when only get_best_server's answer is needed
+        stats: Optional SweepStats to fill in (probes sent and saved, ...)
+        top_k: Two-phase sweep: screen every server with screen_count pings,
+            then measure only the top_k best with ping_count pings. Each
+            result's phase says which pass produced it.
+        screen_count: Pings per server in the screening pass
+        rate: Optional global cap on pings sent per second across all servers
+        max_concurrency: Most system ping processes to run at once
+            (default MAX_CONCURRENT_PINGS); the actual level adapts below it
+        retain_raw: Keep every reply in PingResult.raw_times; with False only
+            the constant-size PingResult.stats accumulator is kept instead
+        dedupe: Probe servers sharing an address (DEDUPE_IP) or a /24 or /48
+            network (DEDUPE_PREFIX) only once, reporting the result for each
+            of them; None probes every server separately
+        cache: Optional ResultCache; servers measured within its max_age are
+            served from it (with PingResult.age set) and only the rest are
+            probed, then stored in it. Servers another run is measuring at
+            the same time are waited for instead of probed twice.
+        probe_log: Optional ProbeLog every probe sent is appended to as it
+            settles (once per target, however many servers share it)
 
     Returns:
         List of PingResult objects
     """
+    return asyncio.run(test_all_servers_async(
+        servers, ping_count, timeout, callback, parallel, backend, on_probe,
+        interval_ms=interval_ms, budget=budget, max_losses=max_losses,
+        target_budget=target_budget, breaker=breaker, race=race, stats=stats,
+        top_k=top_k, screen_count=screen_count, rate=rate,
+        max_concurrency=max_concurrency, retain_raw=retain_raw, dedupe=dedupe,
+        cache=cache, probe_log=probe_log))
+
+
+async def test_all_servers_async(servers: List[Dict], ping_count: int = 10,
+                                 timeout: int = 1, callback: Optional[Callable] = None,
+                                 parallel: bool = True,
+                                 backend: Optional[str] = None,
+                                 on_probe: Optional[Callable[[ProbeEvent], None]] = None,
+                                 interval_ms: Optional[float] = None,
+                                 budget: Optional[float] = None,
+                                 max_losses: Optional[int] = MAX_CONSECUTIVE_LOSSES,
+                                 target_budget: Optional[float] = None,
+                                 breaker: Optional[CircuitBreaker] = None,
+                                 race: bool = False,
+                                 stats: Optional[SweepStats] = None,
+                                 top_k: Optional[int] = None,
+                                 screen_count: int = SCREEN_COUNT,
+                                 rate: Optional[float] = None,
+                                 max_concurrency: Optional[int] = None,
+                                 retain_raw: bool = True,
+                                 dedupe: Optional[str] = DEDUPE_IP,
+                                 cache: Optional[ResultCache] = None,
+                                 probe_log: Optional[ProbeLog] = None) -> List[PingResult]:
+    """
+    Test all servers in a list from an asyncio event loop.
+    With a native ICMP backend every server is probed concurrently on one
+    socket; otherwise system ping runs as asyncio subprocesses, a few at a
+    time. No thread is used per server in either case.
+
+    Args:
+        servers: List of server dicts
+        ping_count: Pings per server
+        timeout: Timeout per ping
+        callback: Optional callback(server_index, total_servers, result) for progress
+        parallel: Whether to test servers concurrently (much faster)
+        backend: Probe backend (see get_ping_backend), auto-detected if None
+        on_probe: Optional callback(ProbeEvent) as each individual probe settles
+        interval_ms: Milliseconds between probes to a server (burst mode)
+        budget: Optional seconds the whole sweep may take
+        max_losses: Stop probing a server after this many lost pings with no reply
+        target_budget: Optional seconds any one server may take
+        breaker: Optional CircuitBreaker for skipping servers dead in recent runs
+        race: Stop probing servers that are clearly slower than the current leader
+        stats: Optional SweepStats to fill in
+        top_k: Two-phase sweep: deep-test only the top_k servers from a screening pass
+        screen_count: Pings per server in the screening pass
+        rate: Optional global cap on pings sent per second across all servers
+        max_concurrency: Most system ping processes to run at once
+            (default MAX_CONCURRENT_PINGS); the actual level adapts below it
+        retain_raw: Keep every reply in PingResult.raw_times; with False only
+            the constant-size PingResult.stats accumulator is kept instead
+        dedupe: Probe servers sharing an address (DEDUPE_IP) or a /24 or /48
+            network (DEDUPE_PREFIX) only once, reporting the result for each
+            of them; None probes every server separately
+        cache: Optional ResultCache; servers measured within its max_age are
+            served from it (with PingResult.age set) and only the rest are
+            probed, then stored in it. Servers another run is measuring at
+            the same time are waited for instead of probed twice.
+        probe_log: Optional ProbeLog every probe sent is appended to as it
+            settles (once per target, however many servers share it)
+
+    Returns:
+        List of PingResult objects, in completion order
+    """
     results = []
     total = len(servers)
 
-    if parallel and total > 1:
-        # Test servers in parallel for speed
-        completed = 0
-        with ThreadPoolExecutor(max_workers=min(total, 4)) as executor:
-            future_to_server = {
-                executor.submit(test_server, server, ping_count, timeout): server
-                for server in servers
-            }
+    async for result in iter_results_async(servers, ping_count, timeout, parallel,
+                                           backend, on_probe, interval_ms=interval_ms,
+                                           budget=budget, max_losses=max_losses,
+                                           target_budget=target_budget, breaker=breaker,
+                                           race=race, stats=stats,
+                                           top_k=top_k, screen_count=screen_count,
+                                           rate=rate, max_concurrency=max_concurrency,
+                                           retain_raw=retain_raw, dedupe=dedupe,
+                                           cache=cache, probe_log=probe_log):
+        results.append(result)
+        if callback:
+            callback(len(results), total, result)
+
+    return results
+
 
-            for future in as_completed(future_to_server):
+async def iter_results_async(servers: List[Dict], ping_count: int = 10, timeout: int = 1,
+                             parallel: bool = True,
+                             backend: Optional[str] = None,
+                             on_probe: Optional[Callable[[ProbeEvent], None]] = None,
+                             interval_ms: Optional[float] = None,
+                             budget: Optional[float] = None,
+                             max_losses: Optional[int] = MAX_CONSECUTIVE_LOSSES,
+                             target_budget: Optional[float] = None,
+                             breaker: Optional[CircuitBreaker] = None,
+                             race: bool = False,
+                             stats: Optional[SweepStats] = None,
+                             top_k: Optional[int] = None,
+                             screen_count: int = SCREEN_COUNT,
+                             rate: Optional[float] = None,
+                             max_concurrency: Optional[int] = None,
+                             retain_raw: bool = True,
+                             dedupe: Optional[str] = DEDUPE_IP,
+                             cache: Optional[ResultCache] = None,
+                             probe_log: Optional[ProbeLog] = None
+                             ) -> AsyncIterator[PingResult]:
+    """
+    Test all servers, yielding each PingResult as soon as it is ready.
+    Leaving the loop early cancels any probes still in flight.
+
+    Args:
+        servers: List of server dicts
+        ping_count: Pings per server
+        timeout: Timeout per ping
+        parallel: Whether to test servers concurrently (much faster)
+        backend: Probe backend (see get_ping_backend), auto-detected if None
+        on_probe: Optional callback(ProbeEvent) as each individual probe settles,
+            within milliseconds of the reply (or of its timeout)
+        interval_ms: Milliseconds between probes to a server (burst mode)
+        budget: Optional seconds the whole sweep may take
+        max_losses: Stop probing a server after this many lost pings with no reply
+        target_budget: Optional seconds any one server may take
+        breaker: Optional CircuitBreaker for skipping servers dead in recent runs
+        race: Stop probing servers that are clearly slower than the current leader
+        stats: Optional SweepStats to fill in
+        top_k: Two-phase sweep: deep-test only the top_k servers from a screening pass
+        screen_count: Pings per server in the screening pass
+        rate: Optional global cap on pings sent per second across all servers
+        max_concurrency: Most system ping processes to run at once
+            (default MAX_CONCURRENT_PINGS); the actual level adapts below it
+        retain_raw: Keep every reply in PingResult.raw_times; with False only
+            the constant-size PingResult.stats accumulator is kept instead
+        dedupe: Probe servers sharing an address (DEDUPE_IP) or a /24 or /48
+            network (DEDUPE_PREFIX) only once, reporting the result for each
+            of them; None probes every server separately
+        cache: Optional ResultCache; servers measured within its max_age are
+            served from it (with PingResult.age set) and only the rest are
+            probed, then stored in it. Servers another run is measuring at
+            the same time are waited for instead of probed twice.
+        probe_log: Optional ProbeLog every probe sent is appended to as it
+            settles (once per target, however many servers share it)
+    """
+    backend = backend or get_ping_backend()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    plan = _SweepPlan(
+        ping_count=ping_count,
+        timeout=timeout,
+        interval=probe_interval(ping_count, interval_ms, budget),
+        parallel=parallel,
+        deadline=loop.time() + budget if budget is not None else None,
+        max_losses=max_losses,
+        target_budget=target_budget,
+        race=_Race() if race else None,
+        rate=rate,
+        max_concurrency=max_concurrency or MAX_CONCURRENT_PINGS,
+        retain_raw=retain_raw,
+        probe_log=probe_log,
+    )
+    if stats is not None:
+        stats.servers = len(servers)
+        stats.probes_planned = len(servers) * ping_count
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    skipped = []
+    if breaker:
+        allowed = []
+        for server in servers:
+            (allowed if breaker.allow(server["ip"]) else skipped).append(server)
+        servers = allowed
+
+    fanout = _Fanout(group_targets(servers, dedupe))
+    servers = fanout.representatives
+    if stats is not None:
+        stats.shared = fanout.shared
+
+    cached = []
+    waiting = []  # (server, key) for targets another run is measuring
+    if cache is not None:
+        # SQLite calls block, so they run on one worker thread, in the order made
+        cache_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-cache")
+
+        def cache_call(fn, *args) -> asyncio.Future:
+            return loop.run_in_executor(cache_io, fn, *args)
+
+        def look_up():
+            hits, stale = [], []
+            for server in servers:
+                key = _cache_key(server["ip"], plan, dedupe)
+                hit = cache.get(key)
+                if hit:
+                    hits.append((server, hit))
+                else:
+                    stale.append((server, key))
+            return hits, stale, set(cache.claim(key for _, key in stale))
+
+        hits, stale, held = await cache_call(look_up)
+        cached = [_cached_result(server, *hit, retain_raw) for server, hit in hits]
+        servers = [server for server, key in stale if key in held]
+        waiting = [(server, key) for server, key in stale if key not in held]
+        if stats is not None:
+            stats.cache_hits = len(cached)
+            stats.cache_misses = len(servers)
+    if on_probe and fanout.shared:
+        report_probe = on_probe
+
+        def on_probe(event: ProbeEvent):
+            for shared_event in fanout.events(event):
+                report_probe(shared_event)
+
+    # Servers that got no reply; only recorded in the breaker if some other
+    # server answered, since a sweep where nothing answers is a local outage
+    unanswered: List[str] = []
+    answered = False
+
+    def settle(result: PingResult):
+        """Store a finished measurement, or give up its claim at once so another run can take it over"""
+        if cache is None:
+            return
+        key = _cache_key(result.ip_address, plan, dedupe)
+        if _cacheable(result, plan):
+            cache_call(cache.put, key, _cache_entry(result))
+        else:
+            cache_call(cache.release, [key])
+
+    def account(result: PingResult):
+        nonlocal answered
+        if plan.race and (result.server_id, result.ip_address) in plan.race.eliminated:
+            result.eliminated = True
+        if breaker and result.total_pings and result.error not in (INVALID_IP_ERROR, BUDGET_ERROR):
+            if result.successful_pings:
+                answered = True
+                breaker.record(result.ip_address, True)
+            else:
+                unanswered.append(result.ip_address)
+        if stats is not None and result.error != INVALID_IP_ERROR:
+            stats.probes_sent += result.total_pings
+
+    def publish(result: PingResult):
+        for shared_result in fanout.results(result):
+            queue.put_nowait(shared_result)
+
+    def emit(result: PingResult):
+        account(result)
+        settle(result)
+        publish(result)
+
+    async def probe_all():
+        if top_k:
+            await _produce_two_phase(servers, plan, backend, account, settle, publish,
+                                     on_probe, top_k, screen_count)
+        else:
+            await _produce_results(servers, plan, backend, emit, on_probe)
+
+    async def share(probing: asyncio.Future, waiting: List[Tuple[Dict, str]]):
+        """
+        Keep this run's claims alive while it probes, serve the targets other
+        runs are measuring as their results arrive, and take over any target
+        whose claim is released without a result or runs out.
+        """
+        def poll(keys: List[str]) -> List[Optional[Tuple[Dict, float]]]:
+            cache.renew()
+            return [cache.settled(key) for key in keys]
+
+        while waiting or not probing.done():
+            if probing.done():
+                await asyncio.sleep(CLAIM_POLL)
+            else:
+                await asyncio.wait({probing}, timeout=CLAIM_POLL)
+            unsettled = []
+            polled = await cache_call(poll, [key for _, key in waiting])
+            for (server, key), found in zip(waiting, polled):
+                if found:
+                    publish(_cached_result(server, *found, retain_raw))
+                    if stats is not None:
+                        stats.cache_hits += 1
+                else:
+                    unsettled.append((server, key))
+            if not unsettled:
+                waiting = []
+                continue
+            held = set(await cache_call(cache.claim, [key for _, key in unsettled]))
+            waiting = [(server, key) for server, key in unsettled if key not in held]
+            takeover = [server for server, key in unsettled if key in held]
+            if takeover:
+                if stats is not None:
+                    stats.cache_misses += len(takeover)
+                await _produce_results(takeover, plan, backend, emit, on_probe)
+
+    async def produce():
+        try:
+            for server in skipped:
+                error = SKIPPED_ERROR.format(breaker.retry_in(server["ip"]))
+                queue.put_nowait(_error_result(server, 0, error, backend))
+            for result in cached:
+                publish(result)
+            if cache is None:
+                await probe_all()
+            else:
+                probing = asyncio.ensure_future(probe_all())
+                await asyncio.gather(probing, share(probing, waiting))
+        finally:
+            if breaker:
+                if answered:
+                    for ip in unanswered:
+                        breaker.record(ip, False)
+                elif unanswered:
+                    logger.warning(f"No server answered; not marking {len(unanswered)} "
+                                   f"servers unreachable (network down?)")
+                breaker.save()
+            if cache is not None:
+                # Queued behind every put and release, then the worker goes
                 try:
-                    result = future.result()
-                except Exception as e:
-                    server = future_to_server[future]
-                    logger.error(f"Unexpected error testing server {server.get('id', '?')}: {e}")
-                    result = PingResult(
-                        server_id=server.get("id", "unknown"),
-                        server_location=server.get("location", "Unknown"),
-                        ip_address=server.get("ip", ""),
-                        ping_avg=0.0, ping_min=0.0, ping_max=0.0,
-                        jitter=0.0, packet_loss=100.0,
-                        successful_pings=0, total_pings=ping_count,
-                        raw_times=[],
-                        region=server.get("region", ""),
-                        error=str(e),
-                    )
-                results.append(result)
-                completed += 1
-
-                if callback:
-                    callback(completed, total, result)
-    else:
-        # Sequential testing
-        for i, server in enumerate(servers):
-            result = test_server(server, ping_count, timeout)
-            results.append(result)
+                    await cache_call(cache.save)
+                finally:
+                    cache_io.shutdown(wait=False)
+            if stats is not None:
+                stats.elapsed = loop.time() - started
+                stats.eliminated = len(plan.race.eliminated) if plan.race else 0
+                stats.concurrency = max(plan.levels, default=0)
+            queue.put_nowait(finished)
 
-            if callback:
-                callback(i + 1, total, result)
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            result = await queue.get()
+            if result is finished:
+                break
+            yield result
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
 
-    return results
 
+@dataclass
+class _SweepPlan:
+    """Probe schedule shared by every server in one sweep"""
+    ping_count: int
+    timeout: int
+    interval: float
+    parallel: bool = True
+    deadline: Optional[float] = None  # event loop time the sweep must end by
+    max_losses: Optional[int] = None
+    target_budget: Optional[float] = None
+    race: Optional["_Race"] = None
+    rate: Optional[float] = None  # pings per second across all servers
+    max_concurrency: int = MAX_CONCURRENT_PINGS
+    # Peak concurrency of each producer run, shared with copies of the plan
+    levels: List[int] = field(default_factory=list)
+    retain_raw: bool = True
+    probe_log: Optional[ProbeLog] = None
 
-def get_best_server(results: List[PingResult]) -> Optional[PingResult]:
+    def time_left(self) -> Optional[float]:
+        """Seconds of budget remaining, or None when the sweep is unbounded."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+    def budget_for_next(self) -> Optional[float]:
+        """Seconds the next server (or parallel group) may take."""
+        left = self.time_left()
+        if self.target_budget is None:
+            return left
+        return self.target_budget if left is None else min(left, self.target_budget)
+
+
+class _Race:
     """
-    Find the best server based on ping and packet loss.
-    Prioritizes low packet loss, then low ping.
+    Race mode state: running ping statistics per server and the confidence
+    bounds used to drop servers that cannot end up the best one.
+    Servers are keyed by (id, ip).
+    """
+
+    def __init__(self, z: float = RACE_Z, min_probes: int = RACE_MIN_PROBES):
+        self.z = z
+        self.min_probes = min_probes
+        self._stats: Dict[Tuple, List[float]] = {}  # key -> [replies, mean, m2, lost]
+        self.eliminated = set()
+
+    def record(self, key: Tuple, rtt: Optional[float]) -> None:
+        """Add one settled probe (Welford's running mean and variance)."""
+        s = self._stats.setdefault(key, [0, 0.0, 0.0, 0])
+        if rtt is None:
+            s[3] += 1
+            return
+        s[0] += 1
+        delta = rtt - s[1]
+        s[1] += delta / s[0]
+        s[2] += delta * (rtt - s[1])
+
+    def _margin(self, s: List[float]) -> float:
+        stdev = math.sqrt(s[2] / (s[0] - 1)) if s[0] > 1 else 0.0
+        return self.z * max(stdev, RACE_MIN_STDEV) / math.sqrt(s[0])
+
+    def leader_bound(self) -> Optional[float]:
+        """Upper bound on the best average ping among servers with no losses so far."""
+        best = None
+        for key, s in self._stats.items():
+            if s[0] >= self.min_probes and not s[3] and key not in self.eliminated:
+                upper = s[1] + self._margin(s)
+                if best is None or upper < best:
+                    best = upper
+        return best
+
+    def losers(self, keys) -> List[Tuple]:
+        """Mark and return the servers among `keys` that are clearly behind the leader."""
+        bound = self.leader_bound()
+        if bound is None:
+            return []
+        dropped = []
+        for key in keys:
+            s = self._stats.get(key)
+            if key in self.eliminated or s is None or s[0] < self.min_probes:
+                continue
+            if s[1] - self._margin(s) > bound:
+                self.eliminated.add(key)
+                dropped.append(key)
+        return dropped
+
+
+def _server_key(server: Dict) -> Tuple:
+    return server.get("id"), server.get("ip")
+
+
+def target_key(ip: str, dedupe: Optional[str] = DEDUPE_IP) -> str:
+    """The key servers share probes under: the normalized address, or its network with DEDUPE_PREFIX."""
+    if dedupe == DEDUPE_PREFIX:
+        prefix = address_prefix(ip)
+        if prefix:
+            return prefix
+    try:
+        return str(ipaddress.ip_address(ip.strip()))
+    except (AttributeError, ValueError):
+        return ip
+
+
+def group_targets(servers: List[Dict], dedupe: Optional[str] = DEDUPE_IP) -> List[List[Dict]]:
+    """
+    Servers grouped by target_key, in order of first appearance. The first
+    server of each group is the one probed. With dedupe=None every server
+    is its own group.
+    """
+    if not dedupe:
+        return [[server] for server in servers]
+    groups: Dict[str, List[Dict]] = {}
+    for server in servers:
+        groups.setdefault(target_key(server.get("ip", ""), dedupe), []).append(server)
+    return list(groups.values())
+
+
+def _cache_key(ip: str, plan: _SweepPlan, dedupe: Optional[str]) -> str:
+    """ResultCache key: the target plus the probe schedule that measured it."""
+    return f"{target_key(ip, dedupe)}|{plan.ping_count}|{plan.interval:g}"
+
+
+def _cacheable(result: PingResult, plan: _SweepPlan) -> bool:
+    """Only complete, error-free measurements with their replies kept are worth serving again."""
+    return (result.error is None and result.total_pings == plan.ping_count
+            and len(result.raw_times) == result.successful_pings)
+
+
+def _cache_entry(result: PingResult) -> Dict:
+    return {
+        "times": result.raw_times.tolist(),
+        "sent": result.total_pings,
+        "backend": result.backend,
+    }
+
+
+def _cached_result(server: Dict, entry: Dict, age: float, retain_raw: bool) -> PingResult:
+    """PingResult for a server rebuilt from a ResultCache entry."""
+    result = _build_result(server, _counted(entry["times"], entry["sent"], entry.get("backend", "")),
+                           retain_raw=retain_raw)
+    result.age = round(age, 1)
+    return result
+
+
+class _Fanout:
+    """Copies the results and probe events of each probed server to the servers sharing its target"""
+
+    def __init__(self, groups: List[List[Dict]]):
+        self.representatives = [group[0] for group in groups]
+        self._members = {_server_key(group[0]): group[1:] for group in groups if len(group) > 1}
+        self.shared = sum(len(group) - 1 for group in groups)
+
+    def results(self, result: PingResult) -> List[PingResult]:
+        """result followed by one copy per server that shares its target."""
+        members = self._members.get((result.server_id, result.ip_address), ())
+        return [result] + [replace(result, server_id=server["id"], server_location=server["location"],
+                                   ip_address=server["ip"], region=server.get("region", ""),
+                                   game=server.get("game", ""))
+                           for server in members]
+
+    def events(self, event: ProbeEvent) -> List[ProbeEvent]:
+        members = self._members.get((event.server_id, event.ip_address), ())
+        return [event] + [replace(event, server_id=server["id"], server_location=server["location"],
+                                  ip_address=server["ip"], region=server.get("region", ""))
+                          for server in members]
+
+
+async def _produce_two_phase(servers: List[Dict], plan: _SweepPlan, backend: str,
+                             account: Callable[[PingResult], None],
+                             settle: Callable[[PingResult], None],
+                             emit: Callable[[PingResult], None],
+                             on_probe: Optional[Callable[[ProbeEvent], None]],
+                             top_k: int, screen_count: int) -> None:
+    """
+    Screen every server with a few pings, emit the screening result for all
+    but the top_k best, then re-test those with the full plan. A result is
+    settled (in the cache) only once no further pass will measure its target.
+    """
+    screened: List[PingResult] = []
+
+    def collect(result: PingResult):
+        account(result)
+        screened.append(result)
+
+    screen_plan = replace(plan, ping_count=min(screen_count, plan.ping_count),
+                          race=None, max_losses=None)
+    await _produce_results(servers, screen_plan, backend, collect, on_probe)
+
+    reachable = [r for r in screened if r.packet_loss < 100]
+    reachable.sort(key=lambda r: (r.packet_loss, r.ping_avg))
+    finalists = {(r.server_id, r.ip_address) for r in reachable[:top_k]}
+    for result in screened:
+        if (result.server_id, result.ip_address) not in finalists:
+            result.phase = PHASE_SCREEN
+            settle(result)
+            emit(result)
+
+    def emit_deep(result: PingResult):
+        result.phase = PHASE_DEEP
+        account(result)
+        settle(result)
+        emit(result)
+
+    deep = [s for s in servers if _server_key(s) in finalists]
+    await _produce_results(deep, plan, backend, emit_deep, on_probe)
+
+
+async def _produce_results(servers: List[Dict], plan: _SweepPlan, backend: str,
+                           emit: Callable[[PingResult], None],
+                           on_probe: Optional[Callable[[ProbeEvent], None]] = None) -> None:
+    """Run the chosen backend, falling back to system ping for anything left untested."""
+    remaining = servers
+
+    if backend != BACKEND_SUBPROCESS:
+        emitted = set()
+
+        def emit_native(result: PingResult):
+            emitted.add((result.server_id, result.ip_address))
+            emit(result)
+
+        try:
+            await _produce_native(servers, plan, emit_native, on_probe)
+            return
+        except OSError as e:
+            logger.warning(f"Native sweep failed, using system ping: {e}")
+            remaining = [s for s in servers if (s.get("id"), s.get("ip")) not in emitted]
+
+    await _produce_subprocess(remaining, plan, emit, on_probe)
+
+
+async def _produce_native(servers: List[Dict], plan: _SweepPlan,
+                          emit: Callable[[PingResult], None],
+                          on_probe: Optional[Callable[[ProbeEvent], None]] = None) -> None:
+    """
+    Test servers over a single multiplexed ICMP socket, emitting each
+    PingResult as soon as its last probe is settled. With parallel=True a
+    full sweep takes about ping_count probe intervals regardless of how
+    many servers there are.
+
+    Raises:
+        OSError if no ICMP socket can be opened
     """
-    # Filter out servers with 100% packet loss
-    valid_results = [r for r in results if r.packet_loss < 100]
+    ping_count = plan.ping_count
+    valid, invalid = [], []
+    for server in servers:
+        (valid if validate_ip(server["ip"]) else invalid).append(server)
+    groups = [valid] if plan.parallel else [[s] for s in valid]
+    if valid:
+        plan.levels.append(max(len(g) for g in groups))
+
+    with icmp_probe.MultiProber() as prober:
+        for group in groups:
+            if not group:
+                continue
+
+            accumulators = [RunningStats() for _ in group]
+
+            def on_done(index: int, outcome: icmp_probe.TargetResult, group=group,
+                        accumulators=accumulators):
+                error = _abort_error(outcome.aborted, outcome.sent)
+                if outcome.error and not outcome.rtts:
+                    error = SEND_ERROR.format(outcome.error)
+                emit(_build_result(group[index], _counted(
+                    outcome.rtts, outcome.sent, prober.kind, error),
+                    accumulators[index], plan.retain_raw))
+
+            keys = [_server_key(s) for s in group]
+            log_ids = [plan.probe_log.target(s["ip"]) for s in group] if plan.probe_log else None
+
+            def probe_settled(index: int, seq: int, rtt: Optional[float], group=group, keys=keys,
+                              accumulators=accumulators, log_ids=log_ids):
+                accumulators[index].add(rtt)
+                if log_ids:
+                    plan.probe_log.append(log_ids[index], seq, rtt)
+                if plan.race:
+                    plan.race.record(keys[index], rtt)
+                if on_probe:
+                    on_probe(_probe_event(group[index], seq, rtt))
+
+            positions = {key: i for i, key in enumerate(keys)}
+
+            def next_round(round_no: int, keys=keys, positions=positions):
+                for key in plan.race.losers(keys):
+                    prober.retire(positions[key])
+
+            await prober.sweep([s["ip"] for s in group], count=ping_count,
+                               timeout=plan.timeout, interval=plan.interval,
+                               on_done=on_done,
+                               on_probe=probe_settled,
+                               budget=plan.budget_for_next(), max_losses=plan.max_losses,
+                               on_round=next_round if plan.race else None,
+                               rate=plan.rate)
+
+        backend = prober.kind or BACKEND_SUBPROCESS
+
+    for server in invalid:
+        emit(_error_result(server, ping_count, INVALID_IP_ERROR, backend))
+
+
+async def _produce_subprocess(servers: List[Dict], plan: _SweepPlan,
+                              emit: Callable[[PingResult], None],
+                              on_probe: Optional[Callable[[ProbeEvent], None]] = None) -> None:
+    """
+    Test servers with system ping processes. With parallel=True they run
+    side by side under an adaptive limit (see _Concurrency) capped by
+    max_concurrency and by what the global rate allows, and the first
+    wave's start times are staggered across one probe interval so their
+    pings interleave round-robin instead of arriving in bursts.
+    """
+    ping_count = plan.ping_count
+    ceiling = 1
+    if plan.parallel and servers:
+        ceiling = min(len(servers), plan.max_concurrency)
+        if plan.rate:
+            # Each process sends one ping per interval
+            ceiling = min(ceiling, int(plan.rate * plan.interval))
+    limit = _Concurrency(ceiling)
+    width = limit.level
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    gap = plan.interval / width
+
+    async def run(server: Dict, position: int):
+        key = _server_key(server)
+        accumulator = RunningStats()
+        log_id = plan.probe_log.target(server["ip"]) if plan.probe_log else None
+
+        def probe_settled(seq: int, rtt: Optional[float]):
+            accumulator.add(rtt)
+            if log_id is not None:
+                plan.probe_log.append(log_id, seq, rtt)
+            if on_probe:
+                on_probe(_probe_event(server, seq, rtt))
+            if plan.race:
+                plan.race.record(key, rtt)
+                if plan.race.losers([key]):
+                    raise StopPinging()
 
-    if not valid_results:
+        if 0 < position < width:
+            await asyncio.sleep(max(0.0, start + position * gap - loop.time()))
+        generation = await limit.acquire()
+        congested = None
+        try:
+            budget = plan.budget_for_next()
+            if budget == 0:
+                emit(_error_result(server, 0, BUDGET_ERROR, BACKEND_SUBPROCESS))
+                return
+            try:
+                result = await ping_server_async(server["ip"], count=ping_count,
+                                                 timeout=plan.timeout,
+                                                 on_probe=probe_settled,
+                                                 interval=plan.interval, budget=budget,
+                                                 max_losses=plan.max_losses)
+                congested = _congested(result)
+                emit(_build_result(server, result, accumulator, plan.retain_raw))
+            except Exception as e:
+                logger.error(f"Unexpected error testing server {server.get('id', '?')}: {e}")
+                emit(_error_result(server, ping_count, str(e), BACKEND_SUBPROCESS))
+        finally:
+            limit.release(generation, congested)
+
+    try:
+        await asyncio.gather(*(run(server, i) for i, server in enumerate(servers)))
+    finally:
+        if servers:
+            plan.levels.append(limit.peak)
+            logger.info(f"System ping concurrency: peak {limit.peak}, "
+                        f"final {limit.level} (ceiling {ceiling})")
+
+
+class _Concurrency:
+    """
+    AIMD limit on how many servers are tested at once, like TCP congestion
+    control: grows by one for every server whose test came back clean while
+    every slot was in use, and halves when one shows loss or inflated pings, which on a busy link is
+    usually our own probes queueing. One bad window only halves it once.
+    """
+
+    def __init__(self, ceiling: int, initial: int = INITIAL_CONCURRENCY):
+        self.ceiling = max(1, ceiling)
+        self.level = min(initial, self.ceiling)
+        self.peak = self.level
+        self.active = 0
+        self._generation = 0  # bumped on every decrease
+        self._waiters: List[asyncio.Future] = []
+
+    async def acquire(self) -> int:
+        """Wait for a free slot; returns the generation to hand back to release()."""
+        while self.active >= self.level:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self.active += 1
+        return self._generation
+
+    def release(self, generation: int, congested: Optional[bool]) -> None:
+        """
+        Free a slot and adjust the level. congested is None when the test
+        says nothing about the link (an error, or a server that never replied).
+        """
+        at_limit = self.active >= self.level
+        self.active -= 1
+        if congested is False and at_limit:
+            # Only grow while the limit is what holds servers back
+            self.level = min(self.ceiling, self.level + 1)
+            self.peak = max(self.peak, self.level)
+        elif congested and generation == self._generation:
+            # Servers started before the last decrease saw the old level
+            self.level = max(1, self.level // 2)
+            self._generation += 1
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _congested(result: Dict) -> Optional[bool]:
+    """Whether a system ping result shows loss or queueing delay (None if it cannot tell)."""
+    times = result.get("ping_times") or []
+    if not times:
         return None
+    if result.get("packet_loss", 0.0) > CONGESTION_LOSS:
+        return True
+    best = min(times)
+    inflation = statistics.median(times) - best
+    return inflation > max(CONGESTION_RTT_SLACK, best * (CONGESTION_RTT_RATIO - 1))
+
+
+def _abort_error(reason: Optional[str], sent: int) -> Optional[str]:
+    """PingResult error for a target the native prober stopped early."""
+    if reason == icmp_probe.ABORT_BUDGET:
+        return BUDGET_ERROR
+    if reason == icmp_probe.ABORT_UNREACHABLE:
+        return UNREACHABLE_ERROR.format(sent)
+    return None
 
-    # Sort by packet loss first, then by ping
-    sorted_results = sorted(valid_results, key=lambda r: (r.packet_loss, r.ping_avg))
 
-    return sorted_results[0]
+def _probe_event(server: Dict, seq: int, rtt: Optional[float]) -> ProbeEvent:
+    return ProbeEvent(
+        server_id=server["id"],
+        server_location=server["location"],
+        ip_address=server["ip"],
+        seq=seq,
+        rtt=round(rtt, 2) if rtt is not None else None,
+        region=server.get("region", ""),
+    )
+
+
+def _error_result(server: Dict, ping_count: int, error: str, backend: str) -> PingResult:
+    """PingResult for a server that could not be tested at all."""
+    return PingResult(
+        server_id=server.get("id", "unknown"),
+        server_location=server.get("location", "Unknown"),
+        ip_address=server.get("ip", ""),
+        ping_avg=0.0, ping_min=0.0, ping_max=0.0,
+        jitter=0.0, packet_loss=100.0,
+        successful_pings=0, total_pings=ping_count,
+        raw_times=[],
+        region=server.get("region", ""),
+        error=error,
+        backend=backend,
+        game=server.get("game", ""),
+    )
+
+
+def get_best_server(results: List[PingResult]) -> Optional[PingResult]:
+    """
+    Find the best server based on ping and packet loss.
+    Prioritizes low packet loss, then low ping.
+    """
+    return as_result_set(results).best()
 
 
 def get_connection_quality(result: PingResult) -> str:
@@ -318,3 +1596,134 @@ def get_connection_quality(result: PingResult) -> str:
         return "Poor"
     else:
         return "Bad"
+
+
+# Columns a ResultSet can be sorted by, with the PingResult fields compared
+# after reachability (unreachable servers always sort last)
+SORT_COLUMNS = {
+    "ping": ("ping_avg",),
+    "p95": ("ping_p95",),
+    "jitter": ("jitter",),
+    "loss": ("packet_loss", "ping_avg"),
+    "location": ("location_key",),
+    "region": ("region", "ping_avg"),
+}
+DEFAULT_SORT = "ping"
+
+
+class ResultSet(Sequence):
+    """
+    The results of a sweep, stored column by column for repeated queries.
+
+    Numeric fields are packed into arrays, the quality class of every result
+    is computed once, and each sort order, threshold filter and region
+    grouping is computed on first use and then served from cache. Indexing
+    and iteration give the PingResults themselves, so a ResultSet can be
+    passed wherever a list of results is expected. It is a snapshot: editing
+    a PingResult afterwards does not update the columns.
+    """
+
+    def __init__(self, results: Iterable[PingResult] = ()):
+        self._results: List[PingResult] = list(results)
+        rows = self._results
+        self.ping_avg = array("d", (r.ping_avg for r in rows))
+        self.ping_p95 = array("d", (r.ping_p95 for r in rows))
+        self.jitter = array("d", (r.jitter for r in rows))
+        self.packet_loss = array("d", (r.packet_loss for r in rows))
+        self.region = [r.region for r in rows]
+        self.location_key = [r.server_location.lower() for r in rows]
+        self.quality = [get_connection_quality(r) for r in rows]
+        self._reset_cache()
+
+    def _reset_cache(self) -> None:
+        self._orders: Dict[str, List[int]] = {}
+        self._reachable_pings: Optional[array] = None
+        self._regions: Optional[Dict[str, "ResultSet"]] = None
+
+    def _take(self, indexes: Iterable[int]) -> "ResultSet":
+        """A new set of the rows at `indexes`, columns copied rather than recomputed."""
+        indexes = list(indexes)
+        subset = ResultSet.__new__(ResultSet)
+        subset._results = [self._results[i] for i in indexes]
+        for name in ("ping_avg", "ping_p95", "jitter", "packet_loss"):
+            column = getattr(self, name)
+            setattr(subset, name, array("d", (column[i] for i in indexes)))
+        for name in ("region", "location_key", "quality"):
+            column = getattr(self, name)
+            setattr(subset, name, [column[i] for i in indexes])
+        subset._reset_cache()
+        return subset
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._take(range(*index.indices(len(self))))
+        return self._results[index]
+
+    def __iter__(self) -> Iterator[PingResult]:
+        return iter(self._results)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ResultSet, list, tuple)):
+            return self._results == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ResultSet({len(self)} results)"
+
+    @property
+    def reachable_count(self) -> int:
+        return sum(1 for loss in self.packet_loss if loss < 100)
+
+    def order(self, sort_by: str = DEFAULT_SORT) -> List[int]:
+        """Row indexes in SORT_COLUMNS order (unknown columns sort by ping)."""
+        if sort_by not in SORT_COLUMNS:
+            sort_by = DEFAULT_SORT
+        order = self._orders.get(sort_by)
+        if order is None:
+            columns = [getattr(self, name) for name in SORT_COLUMNS[sort_by]]
+            unreachable = [loss >= 100 for loss in self.packet_loss]
+            order = sorted(range(len(self)),
+                           key=lambda i: (unreachable[i], *(column[i] for column in columns)))
+            self._orders[sort_by] = order
+        return order
+
+    def sorted(self, sort_by: str = DEFAULT_SORT) -> "ResultSet":
+        """The results sorted by a SORT_COLUMNS column."""
+        return self._take(self.order(sort_by))
+
+    def top(self, k: int, sort_by: str = DEFAULT_SORT) -> "ResultSet":
+        """The first k results in sort order."""
+        return self._take(self.order(sort_by)[:k])
+
+    def within(self, max_ping: float) -> "ResultSet":
+        """Reachable results with an average ping of at most max_ping, in their original order."""
+        order = self.order("ping")
+        if self._reachable_pings is None:
+            self._reachable_pings = array("d", (self.ping_avg[i] for i in order
+                                               if self.packet_loss[i] < 100))
+        end = bisect.bisect_right(self._reachable_pings, max_ping)
+        return self._take(sorted(order[:end]))
+
+    def by_region(self) -> Dict[str, "ResultSet"]:
+        """Results grouped by region, each group sorted by ping."""
+        if self._regions is None:
+            groups: Dict[str, List[int]] = {}
+            for i in self.order("ping"):
+                groups.setdefault(self.region[i], []).append(i)
+            self._regions = {region: self._take(rows) for region, rows in groups.items()}
+        return self._regions
+
+    def best(self) -> Optional[PingResult]:
+        """Lowest packet loss, then lowest ping, among reachable results."""
+        order = self.order("loss")
+        if not order or self.packet_loss[order[0]] >= 100:
+            return None
+        return self._results[order[0]]
+
+
+def as_result_set(results: Iterable[PingResult]) -> ResultSet:
+    """results as a ResultSet, reusing it (and its caches) if it already is one."""
+    return results if isinstance(results, ResultSet) else ResultSet(results)
@@ -0,0 +1,277 @@
+"""
+PingDiff Probe Log
+Every probe appended to memory-mapped binary segments, readable while they are written
+"""
+
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from config import get_app_data_dir
+
+try:
+    import numpy as np
+except ImportError:  # optional; only ProbeLogReader.array needs it
+    np = None
+
+HAS_NUMPY = np is not None
+
+logger = logging.getLogger('PingDiff')
+
+# Segment header: magic, record size, reserved, committed record count.
+# Records start at HEADER_SIZE so they stay 8-byte aligned.
+MAGIC = b"PDPROBE1"
+HEADER = struct.Struct("<8sIIQ")
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 16
+HEADER_SIZE = 64
+# One probe: timestamp_ns, target index, seq, rtt in microseconds, flags
+RECORD = struct.Struct("<qIIII")
+RECORD_SIZE = RECORD.size
+
+# Record flags
+FLAG_LOST = 1  # no reply; rtt_us is 0
+
+# Bytes per segment file; a full segment is closed and a new one started
+SEGMENT_BYTES = 32 * 1024 * 1024
+# Segments kept in the log directory; the oldest go first
+MAX_SEGMENTS = 8
+SEGMENT_SUFFIX = ".plog"
+TARGETS_FILE = "targets.txt"
+
+if HAS_NUMPY:
+    DTYPE = np.dtype([("timestamp_ns", "<i8"), ("target", "<u4"), ("seq", "<u4"),
+                      ("rtt_us", "<u4"), ("flags", "<u4")])
+    assert DTYPE.itemsize == RECORD_SIZE
+else:
+    DTYPE = None
+
+
+class ProbeRecord(NamedTuple):
+    """One settled probe"""
+    timestamp_ns: int  # Unix time in nanoseconds
+    target: int  # index into the log's targets
+    seq: int
+    rtt_us: int  # 0 when lost
+    flags: int
+
+    @property
+    def lost(self) -> bool:
+        return bool(self.flags & FLAG_LOST)
+
+
+def default_log_dir() -> Path:
+    return get_app_data_dir() / 'probe_log'
+
+
+class ProbeLog:
+    """
+    Append-only log of individual probes in fixed-size binary records,
+    written through mmap into segment files of SEGMENT_BYTES in a log
+    directory. Appending a probe is a struct pack into mapped memory with
+    no system call, so the writer keeps up with any probe rate the engine
+    reaches, and readers in other processes see each record as soon as
+    the segment's committed count is bumped past it.
+
+    Targets are logged by index; the address behind each index is kept in
+    targets.txt, one per line, and stays the same for the life of the log.
+    Only MAX_SEGMENTS segments are kept, and each is cut down to the
+    records it holds when it is closed.
+
+    One writer thread per instance; separate processes write separate
+    segments.
+    """
+
+    def __init__(self, path: Optional[Path] = None, segment_bytes: int = SEGMENT_BYTES,
+                 max_segments: int = MAX_SEGMENTS, clock: Callable[[], int] = time.time_ns):
+        self.path = Path(path) if path else default_log_dir()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = max(segment_bytes, HEADER_SIZE + RECORD_SIZE)
+        self.max_segments = max_segments
+        self._clock = clock
+        self._targets: Dict[str, int] = {}
+        self._load_targets()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._offset = self._end = 0
+        self._count = 0
+        self.segment: Optional[Path] = None
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_targets(self) -> None:
+        try:
+            with open(self.path / TARGETS_FILE, encoding="utf-8") as f:
+                for line_no, line in enumerate(f):
+                    self._targets.setdefault(line.rstrip("\n"), line_no)
+        except FileNotFoundError:
+            pass
+
+    def target(self, address: str) -> int:
+        """Index of an address in this log, added to targets.txt the first time it is seen."""
+        if address not in self._targets:
+            # Another process may have added it since we loaded the file
+            self._load_targets()
+        if address not in self._targets:
+            with open(self.path / TARGETS_FILE, "a", encoding="utf-8") as f:
+                f.write(address + "\n")
+            # The first line holding an address is its index, whoever wrote it
+            self._load_targets()
+        return self._targets[address]
+
+    def append(self, target: int, seq: int, rtt: Optional[float], flags: int = 0) -> None:
+        """Log one probe: a reply (rtt in ms) or a loss (rtt None)."""
+        if self._offset >= self._end:
+            self._rotate()
+        if rtt is None:
+            rtt_us, flags = 0, flags | FLAG_LOST
+        else:
+            rtt_us = min(int(rtt * 1000 + 0.5), 0xFFFFFFFF)
+        RECORD.pack_into(self._map, self._offset, self._clock(), target, seq & 0xFFFFFFFF,
+                         rtt_us, flags)
+        self._offset += RECORD_SIZE
+        self._count += 1
+        # Published only once the record is in place
+        COUNT.pack_into(self._map, COUNT_OFFSET, self._count)
+        self.written += 1
+
+    def _rotate(self) -> None:
+        """Close the current segment and map a new, empty one."""
+        self._close_segment()
+        name = f"{self._clock():020d}-{os.getpid()}{SEGMENT_SUFFIX}"
+        self.segment = self.path / name
+        self._file = open(self.segment, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        HEADER.pack_into(self._map, 0, MAGIC, RECORD_SIZE, 0, 0)
+        self._offset = HEADER_SIZE
+        self._end = HEADER_SIZE + (self.segment_bytes - HEADER_SIZE) // RECORD_SIZE * RECORD_SIZE
+        self._count = 0
+        self._prune()
+
+    def _prune(self) -> None:
+        for old in list_segments(self.path)[:-self.max_segments]:
+            try:
+                old.unlink()
+            except OSError as e:
+                # Still mapped by a reader on Windows; try again next rotation
+                logger.debug(f"Could not remove probe log segment {old.name}: {e}")
+
+    def _close_segment(self) -> None:
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            try:
+                # Give back the unused, preallocated tail of the segment
+                self._file.truncate(self._offset)
+            except OSError as e:
+                # Still mapped by a reader on Windows; the segment keeps its full size
+                logger.debug(f"Could not shrink probe log segment {self.segment.name}: {e}")
+            self._file.close()
+            self._map = self._file = None
+        self._offset = self._end = 0
+
+    def close(self) -> None:
+        self._close_segment()
+
+
+class ProbeLogReader:
+    """
+    Reads a probe log, including segments still being written. Views and
+    arrays point straight into the mapped segment files and are not
+    copied; each covers the records committed when it was taken. Drop
+    them before close().
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else default_log_dir()
+        self._maps: Dict[Path, mmap.mmap] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def segments(self) -> List[Path]:
+        """Segment files, oldest first."""
+        return list_segments(self.path)
+
+    def targets(self) -> List[str]:
+        """Addresses by target index."""
+        try:
+            with open(self.path / TARGETS_FILE, encoding="utf-8") as f:
+                return [line.rstrip("\n") for line in f]
+        except FileNotFoundError:
+            return []
+
+    def _mapped(self, segment: Path) -> Optional[mmap.mmap]:
+        mapped = self._maps.get(segment)
+        if mapped is None:
+            try:
+                with open(segment, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None  # removed, or not sized yet
+            if len(mapped) < HEADER_SIZE or HEADER.unpack_from(mapped)[:2] != (MAGIC, RECORD_SIZE):
+                mapped.close()
+                return None
+            self._maps[segment] = mapped
+        return mapped
+
+    def count(self, segment: Path) -> int:
+        """Records committed to a segment so far."""
+        mapped = self._mapped(segment)
+        if mapped is None:
+            return 0
+        count = COUNT.unpack_from(mapped, COUNT_OFFSET)[0]
+        return min(count, (len(mapped) - HEADER_SIZE) // RECORD_SIZE)
+
+    def view(self, segment: Path) -> memoryview:
+        """The committed records of a segment as bytes (RECORD layout), without copying."""
+        mapped = self._mapped(segment)
+        if mapped is None:
+            return memoryview(b"")
+        return memoryview(mapped)[HEADER_SIZE:HEADER_SIZE + self.count(segment) * RECORD_SIZE]
+
+    def array(self, segment: Path):
+        """The committed records of a segment as a NumPy structured array (DTYPE) over the mapping."""
+        if not HAS_NUMPY:
+            raise RuntimeError("NumPy is required for ProbeLogReader.array")
+        mapped = self._mapped(segment)
+        if mapped is None:
+            return np.empty(0, dtype=DTYPE)
+        return np.frombuffer(mapped, dtype=DTYPE, count=self.count(segment), offset=HEADER_SIZE)
+
+    def records(self, since_ns: Optional[int] = None) -> Iterator[ProbeRecord]:
+        """Every committed record, segment by segment, optionally from a time on."""
+        for segment in self.segments():
+            with self.view(segment) as view:
+                for fields in RECORD.iter_unpack(view):
+                    if since_ns is None or fields[0] >= since_ns:
+                        yield ProbeRecord._make(fields)
+
+    def close(self) -> None:
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # a view or array still points into it; freed with it
+        self._maps.clear()
+
+
+def list_segments(path: Path) -> List[Path]:
+    """Segment files in a log directory, oldest first."""
+    try:
+        return sorted(p for p in Path(path).iterdir() if p.name.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return []
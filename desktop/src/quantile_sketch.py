@@ -0,0 +1,114 @@
+"""
+PingDiff Quantile Sketch
+Mergeable latency quantiles (p50/p95/p99) in bounded memory
+"""
+
+import math
+from typing import Dict, Optional
+
+# Every quantile is reported within this relative error of the exact
+# sample quantile: 1% means an 80ms p95 is off by at most 0.8ms
+RELATIVE_ACCURACY = 0.01
+# Most bins one sketch keeps (a few dozen bytes each). At 1% accuracy this
+# spans values a factor of ~10^9 apart, far more than any real ping range,
+# so the cap only matters for pathological input; past it the lowest bins
+# are folded together, which affects only the lowest quantiles.
+MAX_BINS = 1024
+# Values below this (ms) are counted as zero
+MIN_VALUE = 1e-3
+
+
+class DDSketch:
+    """
+    DDSketch quantile sketch (Masson, Rim and Lee, VLDB 2019).
+
+    A value x is counted in the logarithmic bin i with
+    gamma^(i-1) < x <= gamma^i, gamma = (1 + a) / (1 - a), and a quantile
+    is reported as the midpoint of its bin, which is within relative error
+    a of the exact sample quantile. Sketches with the same accuracy merge
+    exactly by adding bin counts.
+    """
+
+    __slots__ = ("relative_accuracy", "max_bins", "_gamma", "_log_gamma", "_bins",
+                 "zero_count", "count")
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, max_bins: int = MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, DDSketch):
+            return NotImplemented
+        return (self.relative_accuracy == other.relative_accuracy
+                and self.zero_count == other.zero_count and self._bins == other._bins)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Count a value (ms) `count` times."""
+        self.count += count
+        if value < MIN_VALUE:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._bins[index] = self._bins.get(index, 0) + count
+        if len(self._bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Fold the lowest bins into one to get back under max_bins."""
+        indexes = sorted(self._bins)
+        excess = len(indexes) - self.max_bins
+        folded = sum(self._bins.pop(i) for i in indexes[:excess])
+        self._bins[indexes[excess]] += folded
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        """Add another sketch's counts to this one. Returns self."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for index, count in other._bins.items():
+            self._bins[index] = self._bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self._bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0 to 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+            if seen > rank:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._bins) / (self._gamma + 1)
+
+    def to_dict(self) -> Dict:
+        """Sketch state as plain JSON-friendly values."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "zero_count": self.zero_count,
+            "bins": {str(i): c for i, c in self._bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "DDSketch":
+        """Rebuild a sketch saved with to_dict()."""
+        sketch = cls(data.get("relative_accuracy", RELATIVE_ACCURACY),
+                     data.get("max_bins", MAX_BINS))
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch._bins = {int(i): c for i, c in data.get("bins", {}).items()}
+        sketch.count = sketch.zero_count + sum(sketch._bins.values())
+        return sketch
@@ -0,0 +1,231 @@
+"""
+PingDiff Result Cache
+Recent measurements shared between tests and concurrent runs so fresh ones are not repeated
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import get_app_data_dir
+
+logger = logging.getLogger('PingDiff')
+
+# Seconds a measurement is served from the cache by default
+DEFAULT_MAX_AGE = 60
+# Most measurements kept; the least recently used go first
+MAX_ENTRIES = 2048
+# Entries older than this are dropped on save, whatever age a run allows
+RETAIN_AGE = 3600
+# Seconds a claim on a target lasts unless renewed; a run that dies while
+# holding claims holds up other runs for at most this long
+CLAIM_TIMEOUT = 15
+# Seconds between checks for a result another run is measuring
+CLAIM_POLL = 0.1
+# Seconds to wait for another run's write lock before giving up
+BUSY_TIMEOUT = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    at REAL NOT NULL,
+    used INTEGER NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS claims (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+
+class ResultCache:
+    """
+    Measurements keyed by target in an SQLite database (WAL mode) that
+    every pingdiff process on the machine shares.
+
+    An entry is served while it is at most max_age seconds old, and the
+    least recently used entries are evicted past max_entries. With max_age
+    0 nothing is served, but new measurements are still stored for later
+    runs that allow an age.
+
+    Runs started at the same time coordinate through claims: a run claims
+    the targets it is about to measure, and other runs wait for the result
+    (settled) instead of probing those targets too. A claim that is
+    released without a result, or not renewed within CLAIM_TIMEOUT, is
+    taken over.
+
+    The connection may be used from a thread other than the one that
+    opened it, one thread at a time.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_age: float = DEFAULT_MAX_AGE,
+                 max_entries: int = MAX_ENTRIES, clock: Callable[[], float] = time.time,
+                 claim_timeout: float = CLAIM_TIMEOUT):
+        self._path = Path(path) if path else get_app_data_dir() / 'result_cache.db'
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.claim_timeout = claim_timeout
+        self._clock = clock
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._db = self._connect()
+        self._touched: List[str] = []  # served keys, in order, to mark used on the next write
+        self._waiting: Dict[str, float] = {}  # keys claimed by another run -> when we asked
+        self._renewed = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the shared database, or a private in-memory one if it is unusable"""
+        try:
+            db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            return db
+        except sqlite3.Error as e:
+            logger.warning(f"Error opening result cache: {e}")
+            db = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+            db.executescript(SCHEMA)
+            return db
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def _lookup(self, key: str, since: Optional[float] = None) -> Optional[Tuple[Dict, float]]:
+        try:
+            row = self._db.execute('SELECT at, entry FROM results WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading result cache: {e}")
+            return None
+        if row is None or (since is not None and row[0] < since):
+            return None
+        return json.loads(row[1]), self._clock() - row[0]
+
+    def get(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """A fresh measurement and its age in seconds, or None (counted as a miss)."""
+        if self.max_age <= 0:
+            return None
+        found = self._lookup(key)
+        if found is not None and 0 <= found[1] <= self.max_age:
+            self._touched.append(key)
+            self.hits += 1
+            return found
+        self.misses += 1
+        return None
+
+    def put(self, key: str, entry: Dict) -> None:
+        """Store a measurement taken now, releasing this run's claim on it."""
+        try:
+            with self._transaction() as db:
+                self._mark_used(db)
+                db.execute('INSERT OR REPLACE INTO results VALUES '
+                           '(?, ?, (SELECT COALESCE(MAX(used), 0) + 1 FROM results), ?)',
+                           (key, self._clock(), json.dumps(entry)))
+                db.execute('DELETE FROM claims WHERE key = ? AND owner = ?', (key, self.owner))
+                db.execute('DELETE FROM results WHERE key IN '
+                           '(SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                           (self.max_entries,))
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing result cache: {e}")
+
+    def _mark_used(self, db: sqlite3.Connection) -> None:
+        for key in self._touched:
+            db.execute('UPDATE results SET used = (SELECT MAX(used) + 1 FROM results) WHERE key = ?',
+                       (key,))
+        self._touched.clear()
+
+    def claim(self, keys: Iterable[str]) -> List[str]:
+        """
+        Claim targets for this run to measure. Returns the keys now held;
+        the rest are being measured by another run (see settled).
+        """
+        keys = list(keys)
+        now = self._clock()
+        won = []
+        try:
+            with self._transaction() as db:
+                for key in keys:
+                    row = db.execute('SELECT owner, expires FROM claims WHERE key = ?',
+                                     (key,)).fetchone()
+                    if row is None or row[0] == self.owner or row[1] < now:
+                        db.execute('INSERT OR REPLACE INTO claims VALUES (?, ?, ?)',
+                                   (key, self.owner, now + self.claim_timeout))
+                        won.append(key)
+        except sqlite3.Error as e:
+            # Without the lock, measure everything rather than wait on nothing
+            logger.warning(f"Error claiming in result cache: {e}")
+            return keys
+        held = set(won)
+        for key in keys:
+            if key in held:
+                self._waiting.pop(key, None)
+            else:
+                self._waiting.setdefault(key, now)
+        return won
+
+    def release(self, keys: Iterable[str]) -> None:
+        """Give up this run's claims on targets it will store no result for, so other runs take them over."""
+        try:
+            with self._transaction() as db:
+                db.executemany('DELETE FROM claims WHERE key = ? AND owner = ?',
+                               [(key, self.owner) for key in keys])
+        except sqlite3.Error as e:
+            logger.warning(f"Error releasing result cache claims: {e}")
+
+    def settled(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """The measurement another run stored for a key this run failed to claim, once it is there."""
+        since = self._waiting.get(key)
+        found = self._lookup(key, since)
+        if found is not None:
+            self._waiting.pop(key, None)
+        return found
+
+    def renew(self) -> None:
+        """Extend this run's claims; call at least every claim_timeout / 2 seconds while measuring."""
+        now = self._clock()
+        if now - self._renewed < self.claim_timeout / 3:
+            return
+        self._renewed = now
+        try:
+            with self._transaction() as db:
+                db.execute('UPDATE claims SET expires = ? WHERE owner = ?',
+                           (now + self.claim_timeout, self.owner))
+        except sqlite3.Error as e:
+            logger.warning(f"Error renewing result cache claims: {e}")
+
+    def save(self) -> None:
+        """Record which entries were used, drop expired ones and release this run's claims"""
+        now = self._clock()
+        try:
+            with self._transaction() as db:
+                self._mark_used(db)
+                db.execute('DELETE FROM results WHERE at < ?', (now - max(self.max_age, RETAIN_AGE),))
+                db.execute('DELETE FROM claims WHERE owner = ? OR expires < ?', (self.owner, now))
+        except sqlite3.Error as e:
+            logger.error(f"Error saving result cache: {e}")
+        self._waiting.clear()
+
+    def clear(self) -> None:
+        with self._transaction() as db:
+            db.execute('DELETE FROM results')
+        self._touched.clear()
@@ -0,0 +1,216 @@
+"""
+PingDiff Running Statistics
+Constant-memory ping statistics that update per probe and merge across shards
+"""
+
+import math
+from typing import Dict, Iterable, Optional
+
+from quantile_sketch import DDSketch
+
+# RFC 3550 interarrival jitter gain (J += (|D| - J) / 16)
+RFC3550_GAIN = 1 / 16
+
+
+class RunningStats:
+    """
+    Summary of a stream of probes in O(1) memory.
+
+    Tracks Welford mean/variance, min/max, the mean absolute difference
+    between consecutive replies (PingResult.jitter), RFC 3550 interarrival
+    jitter, runs of lost probes, and a DDSketch of the replies for tail
+    quantiles (the only part that is not constant-size, and it is capped;
+    see quantile_sketch). Feed it probes in send order with
+    add(); merge() folds in the stats of a later stretch of the same stream
+    (or of another shard), exactly as if its probes had been added one by one.
+    """
+
+    __slots__ = ("sent", "received", "mean", "_m2", "_min", "_max", "_first", "_last",
+                 "_diff_sum", "rfc_jitter", "_leading_losses", "loss_run", "max_loss_run",
+                 "loss_bursts", "sketch")
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._first: Optional[float] = None
+        self._last: Optional[float] = None
+        self._diff_sum = 0.0
+        self.rfc_jitter = 0.0
+        self._leading_losses = 0  # losses before the first reply
+        self.loss_run = 0  # losses since the last reply
+        self.max_loss_run = 0
+        self.loss_bursts = 0
+        self.sketch = DDSketch()
+
+    @classmethod
+    def from_times(cls, ping_times: Iterable[float], sent: Optional[int] = None) -> "RunningStats":
+        """Stats for a list of replies, with `sent - len(ping_times)` losses after them."""
+        stats = cls()
+        for rtt in ping_times:
+            stats.add(rtt)
+        if sent is not None and sent > stats.sent:
+            stats.add_losses(sent - stats.sent)
+        return stats
+
+    def add(self, rtt: Optional[float]) -> None:
+        """Record one probe: a reply in ms, or None for a loss."""
+        self.sent += 1
+        if rtt is None:
+            if not self.loss_run:
+                self.loss_bursts += 1
+            self.loss_run += 1
+            if not self.received:
+                self._leading_losses += 1
+            if self.loss_run > self.max_loss_run:
+                self.max_loss_run = self.loss_run
+            return
+
+        self.loss_run = 0
+        self.received += 1
+        self.sketch.add(rtt)
+        delta = rtt - self.mean
+        self.mean += delta / self.received
+        self._m2 += delta * (rtt - self.mean)
+        if rtt < self._min:
+            self._min = rtt
+        if rtt > self._max:
+            self._max = rtt
+        if self._last is None:
+            self._first = rtt
+        else:
+            diff = abs(rtt - self._last)
+            self._diff_sum += diff
+            self.rfc_jitter += (diff - self.rfc_jitter) * RFC3550_GAIN
+        self._last = rtt
+
+    def add_losses(self, count: int) -> None:
+        """Record `count` lost probes in a row."""
+        for _ in range(count):
+            self.add(None)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Fold in the stats of probes sent after these ones. Returns self."""
+        if not other.sent:
+            return self
+        self.sketch.merge(other.sketch)
+        if not self.sent:
+            for name in self.__slots__:
+                if name != "sketch":
+                    setattr(self, name, getattr(other, name))
+            return self
+
+        # A loss run at the end of self continues into other's leading losses
+        leading = other.sent if not other.received else other._leading_losses
+        joined = self.loss_run + leading
+        self.loss_bursts += other.loss_bursts - (1 if self.loss_run and leading else 0)
+        self.max_loss_run = max(self.max_loss_run, other.max_loss_run, joined)
+        if not self.received:
+            self._leading_losses += leading
+        self.loss_run = joined if not other.received else other.loss_run
+        self.sent += other.sent
+
+        if not other.received:
+            return self
+        if not self.received:
+            self.received = other.received
+            self.mean, self._m2 = other.mean, other._m2
+            self._min, self._max = other._min, other._max
+            self._first, self._last = other._first, other._last
+            self._diff_sum, self.rfc_jitter = other._diff_sum, other.rfc_jitter
+            return self
+
+        total = self.received + other.received
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.received * other.received / total
+        self.mean += delta * other.received / total
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+
+        # The jitter recurrences are linear, so other's estimate (started from
+        # zero) adds to ours once ours has taken the boundary difference and
+        # decayed over other's differences
+        boundary = abs(other._first - self._last)
+        self._diff_sum += boundary + other._diff_sum
+        jitter = self.rfc_jitter + (boundary - self.rfc_jitter) * RFC3550_GAIN
+        self.rfc_jitter = jitter * (1 - RFC3550_GAIN) ** (other.received - 1) + other.rfc_jitter
+        self._last = other._last
+        self.received = total
+        return self
+
+    def copy(self) -> "RunningStats":
+        return RunningStats().merge(self)
+
+    def quantile(self, q: float) -> float:
+        """Reply time at quantile q (0 to 1), within the sketch's accuracy (0.0 if no replies)."""
+        value = self.sketch.quantile(q)
+        if value is None:
+            return 0.0
+        if q <= 0:
+            return self._min
+        if q >= 1:
+            return self._max
+        # A bin midpoint can fall just outside the replies actually seen
+        return min(max(value, self._min), self._max)
+
+    @property
+    def lost(self) -> int:
+        return self.sent - self.received
+
+    @property
+    def packet_loss(self) -> float:
+        """Lost probes in percent (100 when nothing was sent)"""
+        return (self.lost / self.sent) * 100 if self.sent else 100.0
+
+    @property
+    def ping_min(self) -> float:
+        return self._min if self.received else 0.0
+
+    @property
+    def ping_max(self) -> float:
+        return self._max if self.received else 0.0
+
+    @property
+    def variance(self) -> float:
+        """Sample variance of the replies"""
+        return self._m2 / (self.received - 1) if self.received > 1 else 0.0
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def jitter(self) -> float:
+        """Mean absolute difference between consecutive replies (see calculate_jitter)"""
+        return self._diff_sum / (self.received - 1) if self.received > 1 else 0.0
+
+    def to_dict(self) -> Dict:
+        """Accumulator state as plain JSON-friendly values."""
+        data = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, DDSketch):
+                value = value.to_dict()
+            elif isinstance(value, float) and not math.isfinite(value):
+                value = None  # min/max before the first reply
+            data[name.lstrip("_")] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RunningStats":
+        """Rebuild an accumulator saved with to_dict()."""
+        stats = cls()
+        for name in cls.__slots__:
+            value = data.get(name.lstrip("_"))
+            if name == "sketch" and value is not None:
+                value = DDSketch.from_dict(value)
+            if value is not None:
+                setattr(stats, name, value)
+        return stats
+
+    def __repr__(self) -> str:
+        return (f"RunningStats(sent={self.sent}, received={self.received}, "
+                f"mean={self.mean:.2f}, jitter={self.jitter:.2f})")
@@ -0,0 +1,69 @@
+"""
+PingDiff Times Codec
+Compact wire encoding for raw_times: integer microseconds, delta + varint, base64
+"""
+
+import base64
+from typing import Dict, Iterable, List, Optional
+
+# Name of the encoding, as advertised by the server in raw_times_encodings
+ENCODING = "dv1"
+
+# Token the format keeps for a probe that got no reply; replies are
+# zigzag(delta) + 1. raw_times only holds replies, so encode_times never
+# writes it, but decoders accept it.
+LOST = 0
+
+
+def encode_times(times: Iterable[float]) -> str:
+    """
+    Encode reply times in ms as base64 text.
+
+    Each reply is rounded to a whole microsecond and stored as the
+    difference from the previous reply, zigzagged so small negative steps
+    stay small, plus one, as an unsigned LEB128 varint. Pings to one
+    server rarely differ by more than 8ms, so most replies take two bytes
+    instead of the 6-18 characters of a JSON float.
+    """
+    out = bytearray()
+    prev = 0
+    for rtt in times:
+        us = round(rtt * 1000)
+        delta = us - prev
+        prev = us
+        token = ((delta << 1) ^ (delta >> 63)) + 1
+        while token > 0x7F:
+            out.append((token & 0x7F) | 0x80)
+            token >>= 7
+        out.append(token)
+    return base64.b64encode(out).decode("ascii")
+
+
+def decode_times(text: str) -> List[Optional[float]]:
+    """Reply times in ms (None for any lost-probe token) from dv1 text."""
+    data = base64.b64decode(text, validate=True)
+    times: List[Optional[float]] = []
+    prev = 0
+    token = shift = 0
+    for byte in data:
+        token |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        if token == LOST:
+            times.append(None)
+        else:
+            zigzag = token - 1
+            prev += (zigzag >> 1) ^ -(zigzag & 1)
+            times.append(prev / 1000)
+        token = shift = 0
+    if shift:
+        raise ValueError("Truncated varint in encoded times")
+    return times
+
+
+def pack_result(result: Dict) -> Dict:
+    """A submitted result with raw_times replaced by raw_times_packed."""
+    packed = {k: v for k, v in result.items() if k != "raw_times"}
+    packed["raw_times_packed"] = encode_times(result.get("raw_times") or ())
+    return packed
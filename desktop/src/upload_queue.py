@@ -0,0 +1,349 @@
+"""
+PingDiff Upload Queue
+Result submissions kept on disk until delivered, uploaded in compressed batches by one thread
+"""
+
+import gzip
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import get_app_data_dir
+from pacer import TokenBucket
+from times_codec import ENCODING as TIMES_ENCODING, pack_result
+
+logger = logging.getLogger('PingDiff')
+
+# The server allows 30 requests a minute per IP on /api/results
+# (web/src/lib/rate-limit.ts); uploads use half of that, leaving the rest
+# for other clients behind the same address
+UPLOAD_RATE = 15 / 60
+UPLOAD_BURST = 3
+# Most runs coalesced into one request (the server accepts up to 10)
+MAX_BATCH_RUNS = 10
+# Retry delay after a failed upload: BACKOFF_BASE doubled per attempt, capped
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 15 * 60.0
+# Runs kept at most; the oldest are dropped beyond this
+MAX_QUEUED = 500
+# Runs not delivered within this many seconds are dropped
+MAX_QUEUE_AGE = 7 * 86400
+# Seconds to wait for another process's write lock before giving up
+BUSY_TIMEOUT = 5
+
+# Statuses worth retrying; anything else (400, 404, ...) is dropped
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+# Statuses from a server that does not take batched or gzip requests
+LEGACY_STATUSES = (404, 405, 415)
+# Statuses for a request the server could not take as sent: a batch is split
+# up, and a single run dropped
+REJECTED_STATUSES = (400, 413)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    due REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_by_due ON outbox (due);
+"""
+
+# send(body, headers) -> (status, response JSON, Retry-After seconds or None);
+# raises ConnectionError when the server cannot be reached
+Sender = Callable[[bytes, Dict[str, str]], Tuple[int, Dict, Optional[float]]]
+
+
+@dataclass
+class UploadStats:
+    """Upload queue depth and latency, for display and logs"""
+    queued: int = 0  # runs waiting to be delivered
+    uploaded: int = 0  # runs delivered this session
+    dropped: int = 0  # runs given up on (rejected, too old or over MAX_QUEUED)
+    requests: int = 0
+    bytes_sent: int = 0  # request bodies, as sent
+    failures: int = 0  # requests that failed and were retried
+    last_latency: Optional[float] = None  # seconds for the last request's round trip
+    last_delay: Optional[float] = None  # seconds from queueing to delivery, newest run of the last batch
+    last_error: Optional[str] = None
+
+
+class UploadQueue:
+    """
+    Runs waiting to be submitted, in an SQLite database (WAL mode) in the
+    app data dir so they survive restarts and network outages. Each run
+    is due at once and, after a failed attempt, again after its backoff.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: Optional[Path] = None, clock: Callable[[], float] = time.time,
+                 max_queued: int = MAX_QUEUED, max_age: float = MAX_QUEUE_AGE):
+        self._path = Path(path) if path else get_app_data_dir() / 'upload_queue.db'
+        self._clock = clock
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def put(self, payload: Dict) -> int:
+        """Queue one run's submission. Returns the number of runs dropped to make room or as too old."""
+        now = self._clock()
+        with self._transaction() as db:
+            db.execute('INSERT INTO outbox (created, due, payload) VALUES (?, ?, ?)',
+                       (now, now, json.dumps(payload, separators=(",", ":"))))
+            return self._trim(db, now)
+
+    def _trim(self, db: sqlite3.Connection, now: float) -> int:
+        dropped = db.execute('DELETE FROM outbox WHERE created < ?', (now - self.max_age,)).rowcount
+        dropped += db.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox '
+                              'ORDER BY id DESC LIMIT -1 OFFSET ?)', (self.max_queued,)).rowcount
+        if dropped:
+            logger.warning(f"Dropped {dropped} queued result uploads")
+        return dropped
+
+    def due(self, limit: int = MAX_BATCH_RUNS) -> List[Tuple[int, float, Dict]]:
+        """Up to `limit` runs due now, oldest first, as (id, created, payload)."""
+        with self._lock:
+            rows = self._db.execute('SELECT id, created, payload FROM outbox WHERE due <= ? '
+                                    'ORDER BY id LIMIT ?', (self._clock(), limit)).fetchall()
+        return [(run_id, created, json.loads(payload)) for run_id, created, payload in rows]
+
+    def next_due(self) -> Optional[float]:
+        """When the next run is due, or None if the queue is empty."""
+        with self._lock:
+            return self._db.execute('SELECT MIN(due) FROM outbox').fetchone()[0]
+
+    def done(self, ids: List[int]) -> None:
+        """Remove delivered (or rejected) runs."""
+        with self._transaction() as db:
+            db.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+
+    def retry(self, ids: List[int], delay: Optional[float] = None) -> None:
+        """
+        Count a failed attempt and hold runs back: for `delay` seconds if
+        given (e.g. the server's Retry-After), otherwise for their backoff.
+        """
+        now = self._clock()
+        with self._transaction() as db:
+            for run_id in ids:
+                row = db.execute('SELECT attempts FROM outbox WHERE id = ?', (run_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                wait = backoff(attempts) if delay is None else delay
+                db.execute('UPDATE outbox SET attempts = ?, due = ? WHERE id = ?',
+                           (attempts, now + wait, run_id))
+            self._trim(db, now)
+
+
+def backoff(attempts: int) -> float:
+    """Seconds to wait after `attempts` failures: exponential, capped, with jitter so clients spread out."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Uploader:
+    """
+    Delivers queued runs from one background thread. Up to MAX_BATCH_RUNS
+    due runs go in one gzip-compressed request, paced by a token bucket
+    under the server's rate limit. Failed requests are retried with
+    exponential backoff (or after the server's Retry-After); runs the
+    server rejects are dropped.
+
+    A server that answers a batch with 404, 405 or 415 is taken to predate
+    batched uploads, and runs are then sent one per request as plain JSON.
+    A batch answered with 400 or 413 is sent again in halves, down to single
+    runs; a single run the server still rejects with 400 is tried once as
+    plain JSON, which tells a server that predates batches (it succeeds)
+    from a run the server will not take (it is dropped).
+
+    With compact() true, raw_times go out in the times_codec encoding once
+    the server has listed it in raw_times_encodings on a successful upload,
+    and as JSON arrays again if the server then rejects them.
+    """
+
+    def __init__(self, queue: UploadQueue, send: Sender,
+                 enabled: Callable[[], bool] = lambda: True,
+                 on_uploaded: Optional[Callable[[Dict], None]] = None,
+                 clock: Callable[[], float] = time.time,
+                 rate: float = UPLOAD_RATE, burst: int = UPLOAD_BURST,
+                 compact: Callable[[], bool] = lambda: False):
+        self.queue = queue
+        self._send = send
+        self._enabled = enabled
+        self.on_uploaded = on_uploaded
+        self._clock = clock
+        self._bucket = TokenBucket(rate, burst)
+        self._paused_until = 0.0
+        self.legacy = False
+        self._batch_runs = MAX_BATCH_RUNS  # cut down while the server rejects batches
+        self._plain_trial = False  # next request: the rejected single run as plain JSON
+        self._compact = compact
+        self.times_encoding: Optional[str] = None  # accepted by the server, once it has said so
+        self._packing_refused = False
+        self.stats = UploadStats(queued=len(queue))
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the upload thread (once)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._thread_main, name="PingDiffUpload", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, payload: Dict) -> None:
+        """Queue one run's submission and wake the upload thread."""
+        self.stats.dropped += self.queue.put(payload)
+        self.stats.queued = len(self.queue)
+        self.kick()
+
+    def kick(self) -> None:
+        """Look at the queue again now (e.g. once sharing is turned back on)."""
+        self._wake.set()
+
+    def _thread_main(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                wait = self.step()
+            except sqlite3.Error as e:
+                logger.error(f"Upload queue error: {e}")
+                wait = BACKOFF_MAX
+            if wait is None or wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+
+    def step(self) -> Optional[float]:
+        """
+        Send one request if a run is due and the rate limit allows it.
+        Returns seconds until there may be more to do (0 = at once), or
+        None to wait for the next submit().
+        """
+        if not self._enabled():
+            return None
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        ready = self._bucket.earliest(now)
+        if ready > now:
+            return ready - now
+
+        single = self.legacy or self._plain_trial
+        batch = self.queue.due(1 if single else self._batch_runs)
+        if not batch:
+            next_due = self.queue.next_due()
+            return None if next_due is None else max(0.0, next_due - now)
+
+        self._bucket.take(now)
+        ids = [run_id for run_id, _, _ in batch]
+        packed = self.times_encoding == TIMES_ENCODING and self._compact()
+        trial, self._plain_trial = self._plain_trial, False
+        body, headers = self._encode([payload for _, _, payload in batch], packed, single)
+        self.stats.requests += 1
+        self.stats.bytes_sent += len(body)
+        started = time.perf_counter()
+        try:
+            status, data, retry_after = self._send(body, headers)
+        except ConnectionError as e:
+            self._failed(ids, f"Network error: {e}")
+            return 0.0
+        self.stats.last_latency = time.perf_counter() - started
+
+        if status in (200, 201):
+            self.queue.done(ids)
+            self.stats.uploaded += len(ids)
+            self.stats.last_delay = self._clock() - batch[-1][1]
+            self.stats.last_error = None
+            logger.info(f"Uploaded {len(ids)} runs in {self.stats.last_latency * 1000:.0f}ms")
+            if trial:
+                logger.info("Server took a run as plain JSON only; uploading runs one at a time")
+                self.legacy = True
+            self._batch_runs = MAX_BATCH_RUNS
+            if TIMES_ENCODING in (data.get("raw_times_encodings") or ()) and not self._packing_refused:
+                self.times_encoding = TIMES_ENCODING
+            if self.on_uploaded:
+                for run in data.get("runs", [data]):
+                    self.on_uploaded(run)
+        elif status in LEGACY_STATUSES + REJECTED_STATUSES and packed:
+            logger.info(f"Server returned {status} for packed raw_times; sending them as JSON")
+            self.times_encoding = None
+            self._packing_refused = True
+        elif status in LEGACY_STATUSES and not self.legacy:
+            logger.info(f"Server returned {status} for a batch; uploading runs one at a time")
+            self.legacy = True
+        elif status in REJECTED_STATUSES and len(ids) > 1:
+            self._batch_runs = max(1, len(ids) // 2)
+            logger.info(f"Server returned {status} for {len(ids)} runs; "
+                        f"sending {self._batch_runs} at a time")
+        elif status == 400 and not single:
+            self._plain_trial = True
+        elif status in RETRY_STATUSES:
+            if status == 429:
+                # Hold every upload, not just this batch, until the window resets
+                self._paused_until = now + (retry_after or backoff(1))
+            self._failed(ids, f"Server returned {status}", retry_after)
+        else:
+            logger.warning(f"Server rejected {len(ids)} runs ({status}); dropping them")
+            self._batch_runs = MAX_BATCH_RUNS
+            self.queue.done(ids)
+            self.stats.dropped += len(ids)
+            self.stats.last_error = f"Server returned {status}"
+        self.stats.queued = len(self.queue)
+        return 0.0
+
+    def _encode(self, payloads: List[Dict], packed: bool = False,
+                single: bool = False) -> Tuple[bytes, Dict[str, str]]:
+        """Request body and headers for a batch, or with single=True one run as plain JSON."""
+        if packed:
+            payloads = [{**payload, "results": [pack_result(r) for r in payload["results"]]}
+                        if "results" in payload else payload for payload in payloads]
+        if single:
+            return json.dumps(payloads[0]).encode(), {"Content-Type": "application/json"}
+        body = gzip.compress(json.dumps({"runs": payloads}, separators=(",", ":")).encode())
+        return body, {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+    def _failed(self, ids: List[int], error: str, delay: Optional[float] = None) -> None:
+        logger.warning(f"Upload of {len(ids)} runs failed ({error}); will retry")
+        self.queue.retry(ids, delay)
+        self.stats.failures += 1
+        self.stats.last_error = error
+        self.stats.queued = len(self.queue)
@@ -0,0 +1,258 @@
+"""
+PingDiff Watch Sessions
+Long-lived probing for watch mode, summarised over rolling time windows
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import icmp_probe
+from ping_tester import (
+    BACKEND_SUBPROCESS, DEDUPE_IP, INVALID_IP_ERROR, PING_INTERVAL, PingResult,
+    get_ping_backend, ping_server_async, target_key, validate_ip, _build_result, _counted,
+)
+from probe_log import ProbeLog
+
+logger = logging.getLogger('PingDiff')
+
+# Rolling windows shown in watch mode, in seconds
+WINDOWS = (30, 5 * 60, 60 * 60)
+# Rounds per native sweep or system ping process before it is renewed;
+# long enough that renewing costs next to nothing
+SESSION_ROUNDS = 600
+# Result error for a server with no probe settled in the window yet
+WAITING_ERROR = "Waiting for first pings"
+# Seconds watch mode collects pings before its first refresh
+WATCH_WARMUP = 5
+
+
+def window_label(seconds: float) -> str:
+    """Short label for a window length: 30s, 5m, 1h."""
+    if seconds >= 3600 and seconds % 3600 == 0:
+        return f"{seconds // 3600:.0f}h"
+    if seconds >= 60 and seconds % 60 == 0:
+        return f"{seconds // 60:.0f}m"
+    return f"{seconds:g}s"
+
+
+class ProbeHistory:
+    """Timestamped probe outcomes for one server, kept for the longest window"""
+
+    __slots__ = ("keep", "total", "_samples")
+
+    def __init__(self, keep: float):
+        self.keep = keep
+        self.total = 0  # probes ever added, including those since dropped
+        self._samples: Deque[Tuple[float, Optional[float]]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, at: float, rtt: Optional[float]) -> None:
+        """Record a reply (rtt in ms) or a loss (rtt None) at time `at`."""
+        self._samples.append((at, rtt))
+        self.total += 1
+        cutoff = at - self.keep
+        while self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def window(self, now: float, seconds: float) -> Tuple[List[float], int]:
+        """Replies (oldest first) and probes settled in the last `seconds`."""
+        cutoff = now - seconds
+        times = []
+        sent = 0
+        for at, rtt in reversed(self._samples):
+            if at < cutoff:
+                break
+            sent += 1
+            if rtt is not None:
+                times.append(rtt)
+        times.reverse()
+        return times, sent
+
+    def since(self, total: int) -> Tuple[List[float], int]:
+        """Replies (oldest first) and probes settled since `total` probes had been added."""
+        new = min(self.total - total, len(self._samples))
+        times = [rtt for _, rtt in islice(reversed(self._samples), new) if rtt is not None]
+        times.reverse()
+        return times, new
+
+
+class WatchSession:
+    """
+    Probes every server continuously from a background thread, one ping per
+    interval, over one multiplexed ICMP socket or one long-running system
+    ping process per server. Results are summarised on demand over rolling
+    windows, so a display refresh costs nothing and nothing goes unmeasured
+    between refreshes. Servers sharing a target (see ping_tester.target_key)
+    share one probe stream and history. With a ProbeLog, every probe is
+    also appended to it from the probing thread.
+    """
+
+    def __init__(self, servers: List[Dict], interval: float = PING_INTERVAL, timeout: int = 1,
+                 backend: Optional[str] = None, windows: Tuple[float, ...] = WINDOWS,
+                 rate: Optional[float] = None, clock: Callable[[], float] = time.monotonic,
+                 dedupe: Optional[str] = DEDUPE_IP, probe_log: Optional[ProbeLog] = None):
+        self.servers = list(servers)
+        self.interval = interval
+        self.timeout = timeout
+        self.backend = backend
+        self.windows = windows
+        self.rate = rate
+        self.probe_log = probe_log
+        self._clock = clock
+        self._valid = [validate_ip(s["ip"]) for s in self.servers]
+        # Index of the probed server (and its history) behind each server
+        first: Dict = {}
+        self._target = [first.setdefault(target_key(s["ip"], dedupe) if dedupe else i, i)
+                        for i, s in enumerate(self.servers)]
+        self._history = [ProbeHistory(max(windows)) if target == i else None
+                         for i, target in enumerate(self._target)]
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._log_ids: Dict[int, int] = {}
+        self._taken = [0] * len(self.servers)  # per server, probes already handed out by take_settled
+        self.started_at: Optional[float] = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start probing in a background thread."""
+        if self._thread is not None:
+            return
+        self.started_at = self._clock()
+        self._thread = threading.Thread(target=self._thread_main, name="PingDiffWatch", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop probing and wait for ping processes and sockets to be closed."""
+        self._stopped.set()
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # loop already closed
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def record(self, index: int, rtt: Optional[float]) -> None:
+        """Record one settled probe for servers[index] (and the servers sharing its target)."""
+        with self._lock:
+            self._history[self._target[index]].add(self._clock(), rtt)
+
+    def _settled(self, index: int, seq: int, rtt: Optional[float]) -> None:
+        self.record(index, rtt)
+        if self.probe_log is not None:
+            self.probe_log.append(self._log_ids[index], seq, rtt)
+
+    def snapshot(self, window: float) -> List[PingResult]:
+        """One PingResult per server over the last `window` seconds."""
+        now = self._clock()
+        backend = self.backend or ""
+        results = []
+        with self._lock:
+            for server, valid, target in zip(self.servers, self._valid, self._target):
+                times, sent = self._history[target].window(now, window)
+                error = None
+                if not sent:
+                    error = WAITING_ERROR if valid else INVALID_IP_ERROR
+                results.append(_build_result(server, _counted(times, sent, backend, error)))
+        return results
+
+    def take_settled(self) -> List[PingResult]:
+        """
+        One PingResult per server over the probes settled since the previous
+        call, so each probe is recorded once however often this is called.
+        Servers with no new probes are left out.
+        """
+        backend = self.backend or ""
+        results = []
+        with self._lock:
+            for i, (server, target) in enumerate(zip(self.servers, self._target)):
+                history = self._history[target]
+                times, sent = history.since(self._taken[i])
+                self._taken[i] = history.total
+                if sent:
+                    results.append(_build_result(server, _counted(times, sent, backend)))
+        return results
+
+    def _thread_main(self) -> None:
+        try:
+            asyncio.run(self._run())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Watch session stopped: {e}")
+
+    async def _run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        if self._stopped.is_set():
+            return
+        indexes = [i for i, valid in enumerate(self._valid) if valid and self._target[i] == i]
+        if not indexes:
+            return
+        if self.probe_log is not None:
+            self._log_ids = {i: self.probe_log.target(self.servers[i]["ip"]) for i in indexes}
+
+        backend = self.backend or get_ping_backend()
+        if backend != BACKEND_SUBPROCESS:
+            try:
+                await self._run_native(indexes, backend)
+                return
+            except OSError as e:
+                logger.warning(f"Native watch session failed, using system ping: {e}")
+        self.backend = BACKEND_SUBPROCESS
+        await self._run_subprocess(indexes)
+
+    async def _run_native(self, indexes: List[int], backend: str) -> None:
+        """One multiplexed sweep after another over the same socket."""
+        ips = [self.servers[i]["ip"] for i in indexes]
+
+        def probe_settled(target: int, seq: int, rtt: Optional[float]):
+            self._settled(indexes[target], seq, rtt)
+
+        with icmp_probe.MultiProber() as prober:
+            self.backend = backend
+            while True:
+                await prober.sweep(ips, count=SESSION_ROUNDS, timeout=self.timeout,
+                                   interval=self.interval, on_probe=probe_settled,
+                                   rate=self.rate)
+                self.backend = prober.kind or backend
+
+    async def _run_subprocess(self, indexes: List[int]) -> None:
+        """One system ping process per server, renewed every SESSION_ROUNDS pings."""
+        gap = self.interval / len(indexes)
+
+        async def follow(index: int, position: int):
+            ip = self.servers[index]["ip"]
+            # Stagger the processes so their pings interleave
+            await asyncio.sleep(position * gap)
+            while True:
+                result = await ping_server_async(
+                    ip, count=SESSION_ROUNDS, timeout=self.timeout,
+                    on_probe=lambda seq, rtt: self._settled(index, seq, rtt),
+                    interval=self.interval)
+                if result.get("error"):
+                    logger.warning(f"Watch session ping to {ip} failed: {result['error']}")
+                    await asyncio.sleep(max(self.interval, 1.0))
+
+        await asyncio.gather(*(follow(i, p) for p, i in enumerate(indexes)))
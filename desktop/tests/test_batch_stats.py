@@ -0,0 +1,132 @@
+"""
+Unit tests for batch_stats.py — batch statistics with and without NumPy.
+"""
+
+import sys
+import os
+import math
+import random
+import statistics
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import batch_stats as batch_module
+from batch_stats import QUANTILES, batch_stats, results_stats
+from ping_tester import PingResult
+
+
+def random_series(rng, count, longest=12):
+    series = [[round(rng.uniform(5, 200), 3) for _ in range(rng.randint(0, longest))]
+              for _ in range(count)]
+    sent = [max(len(times), longest) for times in series]
+    return series, sent
+
+
+def reference(times, sent, quantiles=QUANTILES):
+    """Per-series statistics computed the straightforward way."""
+    if not times:
+        return [0.0] * (4 + len(quantiles)) + [100.0]
+    ordered = sorted(times)
+    diffs = [abs(b - a) for a, b in zip(times, times[1:])]
+    jitter = statistics.mean(diffs) if diffs else 0.0
+    return ([statistics.mean(times), min(times), max(times), jitter]
+            + [ordered[math.floor(q * (len(times) - 1))] for q in quantiles]
+            + [(sent - len(times)) / sent * 100 if sent else 100.0])
+
+
+def rows(stats):
+    return [list(row) for row in zip(stats.mean, stats.min, stats.max, stats.jitter,
+                                     *stats.quantiles, stats.packet_loss)]
+
+
+def flat(rows_):
+    return [value for row in rows_ for value in row]
+
+
+BACKENDS = [False, pytest.param(True, marks=pytest.mark.skipif(
+    not batch_module.HAS_NUMPY, reason="NumPy not installed"))]
+
+
+# ---------------------------------------------------------------------------
+# batch_stats
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("use_numpy", BACKENDS)
+class TestBatchStats:
+    def test_matches_reference(self, use_numpy):
+        rng = random.Random(15)
+        series, sent = random_series(rng, 300)
+        stats = batch_stats(series, sent, use_numpy=use_numpy)
+
+        assert len(stats) == 300
+        assert stats.count == [len(t) for t in series]
+        assert stats.sent == sent
+        for row, times, total in zip(rows(stats), series, sent):
+            assert row == pytest.approx(reference(times, total))
+
+    def test_empty_and_single_series(self, use_numpy):
+        stats = batch_stats([[], [42.0], [10.0, 30.0]], [4, 4, 2], use_numpy=use_numpy)
+        assert stats.mean == [0.0, 42.0, 20.0]
+        assert stats.min == [0.0, 42.0, 10.0]
+        assert stats.jitter == [0.0, 0.0, 20.0]
+        assert stats.packet_loss == [100.0, 75.0, 0.0]
+        assert [column[0] for column in stats.quantiles] == [0.0] * len(QUANTILES)
+        assert [column[2] for column in stats.quantiles] == [10.0, 10.0, 10.0]
+
+    def test_no_series(self, use_numpy):
+        stats = batch_stats([], use_numpy=use_numpy)
+        assert len(stats) == 0
+        assert stats.quantiles == [[] for _ in QUANTILES]
+
+    def test_sent_defaults_to_replies(self, use_numpy):
+        stats = batch_stats([[1.0, 2.0], []], use_numpy=use_numpy)
+        assert stats.sent == [2, 0]
+        assert stats.packet_loss == [0.0, 100.0]
+
+    def test_custom_quantiles(self, use_numpy):
+        stats = batch_stats([[float(i) for i in range(1, 101)]], quantiles=(0.0, 0.25, 1.0),
+                            use_numpy=use_numpy)
+        assert stats.quantiles == [[1.0], [25.0], [100.0]]
+
+    def test_skewed_lengths(self, use_numpy):
+        """One long series among short ones (the NumPy path's flat sort)."""
+        rng = random.Random(3)
+        series = [[rng.uniform(1, 50) for _ in range(2)] for _ in range(20)]
+        series.append([rng.uniform(1, 50) for _ in range(500)])
+        stats = batch_stats(series, use_numpy=use_numpy)
+        for row, times in zip(rows(stats), series):
+            assert row == pytest.approx(reference(times, len(times)))
+
+    def test_sent_length_checked(self, use_numpy):
+        with pytest.raises(ValueError):
+            batch_stats([[1.0]], [1, 2], use_numpy=use_numpy)
+
+
+class TestBackends:
+    def test_numpy_agrees_with_fallback(self):
+        pytest.importorskip("numpy")
+        rng = random.Random(7)
+        series, sent = random_series(rng, 500, longest=30)
+        vector = batch_stats(series, sent, use_numpy=True)
+        python = batch_stats(series, sent, use_numpy=False)
+        assert vector.count == python.count
+        assert flat(rows(vector)) == pytest.approx(flat(rows(python)))
+
+    def test_fallback_without_numpy(self, monkeypatch):
+        monkeypatch.setattr(batch_module, "HAS_NUMPY", False)
+        stats = batch_stats([[5.0, 7.0]])
+        assert stats.mean == [6.0]
+        with pytest.raises(ImportError):
+            batch_stats([[5.0]], use_numpy=True)
+
+    def test_results_stats(self):
+        results = [
+            PingResult("a", "A", "1.1.1.1", 12.0, 10.0, 14.0, 4.0, 50.0, 2, 4, [10.0, 14.0]),
+            PingResult("b", "B", "2.2.2.2", 0.0, 0.0, 0.0, 0.0, 100.0, 0, 3, []),
+        ]
+        stats = results_stats(results)
+        assert stats.mean == [12.0, 0.0]
+        assert stats.packet_loss == [50.0, 100.0]
+        assert stats.jitter == [4.0, 0.0]
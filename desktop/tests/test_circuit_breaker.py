@@ -0,0 +1,82 @@
+"""
+Unit tests for circuit_breaker.py — persistent skipping of dead servers.
+"""
+
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(tmp_path, clock=None):
+    return CircuitBreaker(tmp_path / "dead.json", base_backoff=60, max_backoff=300,
+                          clock=clock or FakeClock())
+
+
+class TestCircuitBreaker:
+    def test_unknown_server_allowed(self, tmp_path):
+        breaker = make_breaker(tmp_path)
+        assert breaker.allow("1.2.3.4")
+        assert breaker.retry_in("1.2.3.4") == 0
+
+    def test_failure_opens_breaker(self, tmp_path):
+        breaker = make_breaker(tmp_path)
+        breaker.record("1.2.3.4", reachable=False)
+        assert not breaker.allow("1.2.3.4")
+        assert breaker.retry_in("1.2.3.4") == 60
+
+    def test_allowed_again_after_backoff(self, tmp_path):
+        clock = FakeClock()
+        breaker = make_breaker(tmp_path, clock)
+        breaker.record("1.2.3.4", reachable=False)
+        clock.now += 60
+        assert breaker.allow("1.2.3.4")
+
+    def test_backoff_doubles_up_to_max(self, tmp_path):
+        breaker = make_breaker(tmp_path)
+        backoffs = []
+        for _ in range(5):
+            breaker.record("1.2.3.4", reachable=False)
+            backoffs.append(breaker.retry_in("1.2.3.4"))
+        assert backoffs == [60, 120, 240, 300, 300]
+        assert breaker.failures("1.2.3.4") == 5
+
+    def test_success_closes_breaker(self, tmp_path):
+        breaker = make_breaker(tmp_path)
+        breaker.record("1.2.3.4", reachable=False)
+        breaker.record("1.2.3.4", reachable=True)
+        assert breaker.allow("1.2.3.4")
+        assert breaker.failures("1.2.3.4") == 0
+
+    def test_state_persists(self, tmp_path):
+        clock = FakeClock()
+        breaker = make_breaker(tmp_path, clock)
+        breaker.record("1.2.3.4", reachable=False)
+        breaker.save()
+        assert not make_breaker(tmp_path, clock).allow("1.2.3.4")
+
+    def test_save_skipped_when_unchanged(self, tmp_path):
+        make_breaker(tmp_path).save()
+        assert not (tmp_path / "dead.json").exists()
+
+    def test_corrupt_file_ignored(self, tmp_path):
+        (tmp_path / "dead.json").write_text("{not json")
+        assert make_breaker(tmp_path).allow("1.2.3.4")
+
+    def test_file_format(self, tmp_path):
+        breaker = make_breaker(tmp_path)
+        breaker.record("1.2.3.4", reachable=False)
+        breaker.save()
+        data = json.loads((tmp_path / "dead.json").read_text())
+        assert data == {"1.2.3.4": {"failures": 1, "retry_at": 1060.0}}
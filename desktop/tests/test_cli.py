@@ -13,6 +13,9 @@ import pytest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
 
+import cli
+from probe_log import ProbeLog
+from history_store import HistoryStore, SOURCE_CLI
 from ping_tester import PingResult
 from cli import (
     sort_results,
@@ -24,7 +27,11 @@ from cli import (
     format_ping,
     format_loss,
     build_parser,
+    sweep_options,
+    collect_servers,
+    print_table,
 )
+from config import DEFAULT_SERVERS, GAMES
 
 
 # ---------------------------------------------------------------------------
@@ -78,6 +85,12 @@ class TestSortResults:
         pings = [r.ping_avg for r in sorted_r]
         assert pings == sorted(pings)
 
+    def test_sort_by_p95(self):
+        results = [make_result(server_id=f"s{i}") for i in range(3)]
+        for r, p95 in zip(results, [80.0, 40.0, 60.0]):
+            r.ping_p95 = p95
+        assert [r.ping_p95 for r in sort_results(results, "p95")] == [40.0, 60.0, 80.0]
+
     def test_sort_by_jitter(self):
         results = self._make_set()
         sorted_r = sort_results(results, "jitter")
@@ -162,6 +175,7 @@ class TestResultsToJson:
         assert item["region"] == "NA"
         assert item["ping_avg"] == 42.5
         assert "quality" in item
+        assert {"ping_p50", "ping_p95", "ping_p99"} <= set(item)
 
     def test_best_only_returns_single_item(self):
         results = [
@@ -181,6 +195,16 @@ class TestResultsToJson:
         data = json.loads(results_to_json([]))
         assert data == []
 
+    def test_phase_included(self):
+        r = make_result()
+        r.phase = "screen"
+        assert json.loads(results_to_json([r]))[0]["phase"] == "screen"
+
+    def test_game_included(self):
+        r = make_result()
+        r.game = "valorant"
+        assert json.loads(results_to_json([r]))[0]["game"] == "valorant"
+
 
 # ---------------------------------------------------------------------------
 # results_to_csv
@@ -224,6 +248,18 @@ class TestResultsToCsv:
         rows = list(reader)
         assert len(rows) == 5
 
+    def test_percentile_columns(self):
+        r = make_result()
+        r.ping_p50, r.ping_p95, r.ping_p99 = 50.0, 58.5, 60.0
+        rows = list(csv.DictReader(io.StringIO(results_to_csv([r]))))
+        assert (rows[0]["ping_p50"], rows[0]["ping_p95"], rows[0]["ping_p99"]) == ("50.00", "58.50", "60.00")
+
+    def test_phase_column(self):
+        r = make_result()
+        r.phase = "deep"
+        rows = list(csv.DictReader(io.StringIO(results_to_csv([r]))))
+        assert rows[0]["phase"] == "deep"
+
 
 # ---------------------------------------------------------------------------
 # colorize / format helpers
@@ -266,6 +302,8 @@ class TestBuildParser:
         assert args.interval == 30
         assert args.max_ping is None
         assert args.output is None
+        assert args.interval_ms is None
+        assert args.budget is None
 
     def test_cli_flag(self):
         parser = build_parser()
@@ -298,3 +336,142 @@ class TestBuildParser:
         parser = build_parser()
         args = parser.parse_args(["--output", "results.json"])
         assert args.output == "results.json"
+
+    def test_burst_flags(self):
+        parser = build_parser()
+        args = parser.parse_args(["--interval-ms", "50", "--budget", "2"])
+        assert args.interval_ms == 50.0
+        assert args.budget == 2.0
+
+    def test_fast_fail_flags(self):
+        parser = build_parser()
+        args = parser.parse_args([])
+        assert args.max_losses == 3
+        assert args.server_budget is None
+        assert args.retest_dead is False
+        args = parser.parse_args(["--max-losses", "0", "--server-budget", "1.5", "--retest-dead"])
+        assert (args.max_losses, args.server_budget, args.retest_dead) == (0, 1.5, True)
+
+    def test_two_phase_flags(self):
+        parser = build_parser()
+        args = parser.parse_args(["--retest-dead", "--top-k", "5"])
+        options = sweep_options(args)
+        assert (options["top_k"], options["screen_count"]) == (5, 2)
+
+    def test_best_implies_race(self):
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["race"] is False
+        assert sweep_options(parser.parse_args(["--retest-dead", "--best"]))["race"] is True
+        assert sweep_options(parser.parse_args(["--retest-dead", "--race"]))["race"] is True
+
+    def test_rate_flag(self):
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["rate"] is None
+        assert sweep_options(parser.parse_args(["--retest-dead", "--rate", "200"]))["rate"] == 200.0
+
+    def test_max_concurrency_flag(self):
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["max_concurrency"] is None
+        args = parser.parse_args(["--retest-dead", "--max-concurrency", "16"])
+        assert sweep_options(args)["max_concurrency"] == 16
+
+    def test_dedupe_flag(self):
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["dedupe"] == "ip"
+        assert sweep_options(parser.parse_args(["--retest-dead", "--dedupe", "prefix"]))["dedupe"] == "prefix"
+        assert sweep_options(parser.parse_args(["--retest-dead", "--dedupe", "off"]))["dedupe"] is None
+
+    def test_max_age_flag(self):
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["cache"].max_age == 0
+        args = parser.parse_args(["--retest-dead", "--max-age", "90"])
+        assert sweep_options(args)["cache"].max_age == 90.0
+
+    def test_probe_log_flag(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(cli, "ProbeLog", lambda: ProbeLog(tmp_path))
+        parser = build_parser()
+        assert sweep_options(parser.parse_args(["--retest-dead"]))["probe_log"] is None
+        log = sweep_options(parser.parse_args(["--retest-dead", "--probe-log"]))["probe_log"]
+        assert log.path == tmp_path
+
+
+# ---------------------------------------------------------------------------
+# --game all
+# ---------------------------------------------------------------------------
+
+class TestAllGames:
+    def test_collect_servers_tags_game_and_region(self):
+        servers = collect_servers(sorted(GAMES))
+        assert len(servers) == sum(len(s) for regions in DEFAULT_SERVERS.values()
+                                   for s in regions.values())
+        assert {s["game"] for s in servers} == set(DEFAULT_SERVERS)
+        assert all(s["region"] for s in servers)
+
+    def test_collect_servers_by_region(self):
+        servers = collect_servers(sorted(GAMES), "EU")
+        assert servers and {s["region"] for s in servers} == {"EU"}
+
+    def test_table_shows_game_column_for_several_games(self, capsys, monkeypatch):
+        monkeypatch.setattr(Colors, "supports_color", staticmethod(lambda: False))
+        r1, r2 = make_result(server_id="a"), make_result(server_id="b")
+        r1.game, r2.game = "overwatch-2", "valorant"
+        print_table([r1, r2])
+        out = capsys.readouterr().out
+        assert "Game" in out and GAMES["valorant"]["short"] in out
+
+        print_table([r1])
+        assert "Game" not in capsys.readouterr().out
+
+
+# ---------------------------------------------------------------------------
+# Watch mode
+# ---------------------------------------------------------------------------
+
+class TestWatchFlags:
+    def test_one_off_flags_warned_about(self, monkeypatch, capsys):
+        monkeypatch.setattr(cli, "run_watch", lambda game_info, servers, args: 0)
+        args = build_parser().parse_args(["--cli", "--watch", "--count", "20", "--budget", "5",
+                                          "--server-budget", "1", "--top-k", "3", "--race"])
+        assert cli.run_cli(args) == 0
+        out = capsys.readouterr().out
+        for flag in ("--count", "--budget", "--server-budget", "--top-k", "--race"):
+            assert f"Warning: {flag} is not supported with --watch" in out
+
+    def test_defaults_not_warned_about(self, monkeypatch, capsys):
+        monkeypatch.setattr(cli, "run_watch", lambda game_info, servers, args: 0)
+        assert cli.run_cli(build_parser().parse_args(["--cli", "--watch"])) == 0
+        assert "Warning" not in capsys.readouterr().out
+
+
+# ---------------------------------------------------------------------------
+# Local history
+# ---------------------------------------------------------------------------
+
+class TestHistory:
+    @pytest.fixture
+    def history_path(self, tmp_path, monkeypatch):
+        path = tmp_path / "history.db"
+        monkeypatch.setattr(cli, "HistoryStore", lambda: HistoryStore(path))
+        monkeypatch.setattr(Colors, "supports_color", staticmethod(lambda: False))
+        return path
+
+    def test_save_history(self, history_path):
+        parser = build_parser()
+        cli.save_history([make_result()], SOURCE_CLI, parser.parse_args([]))
+        cli.save_history([make_result()], SOURCE_CLI, parser.parse_args(["--no-history"]))
+        with HistoryStore(history_path) as history:
+            assert len(history) == 1
+
+    def test_history_report(self, history_path, capsys):
+        r = make_result(location="Frankfurt")
+        r.game = "overwatch-2"
+        with HistoryStore(history_path) as history:
+            history.record([r])
+        args = build_parser().parse_args(["--cli", "--history", "7", "--game", "overwatch-2"])
+        assert cli.run_cli(args) == 0
+        out = capsys.readouterr().out
+        assert "Frankfurt" in out and "Runs" in out
+
+        args = build_parser().parse_args(["--cli", "--history", "7", "--game", "valorant"])
+        assert cli.run_cli(args) == 0
+        assert "No results saved" in capsys.readouterr().out
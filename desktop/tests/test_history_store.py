@@ -0,0 +1,253 @@
+"""
+Unit tests for history_store.py — the local results history.
+"""
+
+import sys
+import os
+import sqlite3
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from history_store import (HistoryStore, SOURCE_CLI, SOURCE_WATCH, ROLLUP_DELAY, TIER_RAW,
+                           TIER_MINUTE, TIER_HOUR, TIER_DAY)
+from ping_tester import PingResult
+from quantile_sketch import DDSketch
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_result(server_id="fra", location="Frankfurt", ping=40.0, loss=0.0, game="valorant",
+                region="EU", total=10, raw_times=(), **kwargs):
+    received = round(total * (100 - loss) / 100)
+    return PingResult(
+        server_id=server_id, server_location=location, ip_address="10.0.0.1",
+        ping_avg=ping if received else 0.0, ping_min=ping - 5 if received else 0.0,
+        ping_max=ping + 5 if received else 0.0, jitter=2.0 if received else 0.0,
+        packet_loss=loss, successful_pings=received, total_pings=total, raw_times=list(raw_times),
+        region=region, game=game, ping_p95=ping + 4 if received else 0.0, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with HistoryStore(tmp_path / "history.db") as history:
+        yield history
+
+
+class TestRecord:
+    def test_run_stored_as_rows(self, store):
+        written = store.record([make_result(), make_result("ams", "Amsterdam", 30.0)], at=100.0)
+        assert written == 2
+        rows = store.query()
+        assert [(r.server_id, r.at, r.source) for r in rows] == [
+            ("fra", 100.0, SOURCE_CLI), ("ams", 100.0, SOURCE_CLI)]
+        assert rows[0].ping_p95 == 44.0
+
+    def test_cached_and_unprobed_results_skipped(self, store):
+        results = [make_result(), make_result("old", age=12.0), make_result("dead", total=0)]
+        assert store.record(results) == 1
+        assert [r.server_id for r in store.query()] == ["fra"]
+
+    def test_partial_results_skipped(self, store):
+        assert store.record([make_result(), make_result("raced", total=3, eliminated=True),
+                             make_result("screened", total=2, phase="screen")]) == 1
+        assert [r.server_id for r in store.query()] == ["fra"]
+
+    def test_game_fills_in_missing(self, store):
+        store.record([make_result(game="")], game="overwatch-2")
+        assert store.query()[0].game == "overwatch-2"
+
+    def test_empty_run(self, store):
+        assert store.record([]) == 0
+        assert len(store) == 0
+
+    def test_shared_between_instances(self, tmp_path):
+        with HistoryStore(tmp_path / "history.db") as first:
+            first.record([make_result()])
+        with HistoryStore(tmp_path / "history.db") as second:
+            assert len(second) == 1
+
+
+class TestQueries:
+    def _fill(self, store):
+        for at, ping in ((100.0, 40.0), (200.0, 50.0), (300.0, 60.0)):
+            store.record([make_result(ping=ping), make_result("ams", "Amsterdam", ping - 10)], at=at)
+        store.record([make_result(ping=45.0, game="overwatch-2")], at=250.0, source=SOURCE_WATCH)
+
+    def test_time_range(self, store):
+        self._fill(store)
+        rows = store.query(game="valorant", server_id="fra", since=150.0, until=300.0)
+        assert [(r.at, r.ping_avg) for r in rows] == [(200.0, 50.0)]
+
+    def test_limit_and_order(self, store):
+        self._fill(store)
+        assert [r.at for r in store.query(server_id="fra", limit=3)] == [100.0, 200.0, 250.0]
+
+    def test_summary(self, store):
+        self._fill(store)
+        store.record([make_result(loss=100.0)], at=400.0)
+        by_key = {(s.game, s.server_id): s for s in store.summary()}
+        fra = by_key[("valorant", "fra")]
+        assert (fra.runs, fra.reachable_runs) == (4, 3)
+        assert fra.ping_avg == pytest.approx(50.0)
+        assert (fra.ping_min, fra.ping_max) == (35.0, 65.0)
+        assert fra.packet_loss == 25.0
+        assert (fra.first, fra.last) == (100.0, 400.0)
+        assert by_key[("overwatch-2", "fra")].runs == 1
+
+    def test_summary_filters(self, store):
+        self._fill(store)
+        summaries = store.summary(game="valorant", since=200.0)
+        assert [(s.server_id, s.runs) for s in summaries] == [("ams", 2), ("fra", 2)]
+
+    def test_latest(self, store):
+        self._fill(store)
+        latest = {(r.game, r.server_id): r for r in store.latest()}
+        assert latest[("valorant", "fra")].ping_avg == 60.0
+        assert latest[("overwatch-2", "fra")].at == 250.0
+        assert len(store.latest(game="valorant")) == 2
+
+
+DAY = 86400
+
+
+class TestRollups:
+    def _fill(self, store, days=3, every=600):
+        """A run of two servers every `every` seconds for `days` days from time 0"""
+        for at in range(0, days * DAY, every):
+            ping = 40.0 + at % 7
+            store.record([make_result(ping=ping, raw_times=[ping - 1, ping, ping + 1]),
+                          make_result("ams", "Amsterdam", ping - 10)], at=float(at))
+
+    def test_rollup_keeps_summary(self, tmp_path):
+        clock = FakeClock(3 * DAY + ROLLUP_DELAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock) as store:
+            self._fill(store)
+            before = store.summary()
+            assert store.rollup() > 0
+            state = store.tier_state()
+            assert state[TIER_MINUTE].rolled_until == 3 * DAY
+            assert state[TIER_DAY].rolled_until == 3 * DAY
+            after = store.summary()
+        assert len(after) == len(before) == 2
+        for raw, rolled in zip(before, after):
+            assert (rolled.runs, rolled.reachable_runs) == (raw.runs, raw.reachable_runs)
+            assert rolled.ping_avg == pytest.approx(raw.ping_avg)
+            assert (rolled.ping_min, rolled.ping_max) == (raw.ping_min, raw.ping_max)
+            assert (rolled.first, rolled.last) == (raw.first, raw.last)
+
+    def test_incremental(self, tmp_path):
+        clock = FakeClock(DAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock) as store:
+            self._fill(store, days=1)
+            store.rollup()
+            assert store.rollup() == 0
+            # Too recent to roll up until ROLLUP_DELAY has passed
+            store.record([make_result()], at=DAY - 10)
+            assert store.rollup() == 0
+            clock.now += ROLLUP_DELAY
+            assert store.rollup() > 0
+            assert store.tier_state()[TIER_MINUTE].rolled_until == DAY
+            assert store.summary(server_id="fra")[0].runs == DAY // 600 + 1
+
+    def test_nothing_to_do_before_a_minute_closes(self, tmp_path):
+        clock = FakeClock(DAY)
+        path = tmp_path / "history.db"
+        with HistoryStore(path, clock=clock) as store:
+            self._fill(store, days=1)
+            store.rollup()
+            store.record([make_result()], at=DAY - 90)
+            clock.now += 59
+            other = sqlite3.connect(path, isolation_level=None)
+            other.execute("BEGIN IMMEDIATE")
+            try:
+                assert store.rollup() == 0  # without waiting on the lock
+            finally:
+                other.execute("ROLLBACK")
+                other.close()
+            clock.now += 1
+            assert store.rollup() > 0
+
+    def test_rollup_in_background(self, tmp_path):
+        clock = FakeClock(DAY + ROLLUP_DELAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock) as store:
+            self._fill(store, days=1)
+            store.rollup_in_background().join()
+            assert store.tier_state()[TIER_MINUTE].rolled_until == DAY
+
+    def test_raw_rows_dropped_after_retention(self, tmp_path):
+        clock = FakeClock(3 * DAY + ROLLUP_DELAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock,
+                          retention={TIER_RAW: 1, TIER_MINUTE: 2}) as store:
+            self._fill(store)
+            store.rollup()
+            state = store.tier_state()
+            # Cut-offs fall on the next tier's bucket boundaries
+            assert state[TIER_RAW].kept_from == 2 * DAY + ROLLUP_DELAY
+            assert state[TIER_MINUTE].kept_from == DAY
+            assert store.query()[0].at == 2 * DAY + 600
+            fra = store.summary(server_id="fra")[0]
+        assert fra.runs == 3 * DAY // 600
+        assert fra.first == 0.0
+
+    def test_range_widened_only_where_raw_rows_are_gone(self, tmp_path):
+        clock = FakeClock(3 * DAY + ROLLUP_DELAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock,
+                          retention={TIER_RAW: 1, TIER_MINUTE: 1, TIER_HOUR: 1}) as store:
+            self._fill(store)
+            store.rollup()
+            # Only day buckets before day 2: the start moves back to midnight
+            assert store.summary(server_id="fra", since=DAY + 3600)[0].first == DAY
+            # Raw rows still there: exact
+            assert store.summary(server_id="fra", since=2 * DAY + 3600)[0].first == 2 * DAY + 3600
+
+    def test_quantiles_from_merged_sketches(self, tmp_path):
+        clock = FakeClock(DAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock, retention={TIER_RAW: 0}) as store:
+            for at, times in ((0.0, [10.0, 20.0]), (60.0, [30.0, 40.0]), (3600.0, [50.0])):
+                store.record([make_result(raw_times=times)], at=at)
+            store.rollup()
+            assert len(store) == 0
+            fra = store.summary()[0]
+        whole = DDSketch()
+        for rtt in (10.0, 20.0, 30.0, 40.0, 50.0):
+            whole.add(rtt)
+        assert (fra.ping_p50, fra.ping_p95, fra.ping_p99) == tuple(
+            round(whole.quantile(q), 2) for q in (0.5, 0.95, 0.99))
+
+    def test_series(self, tmp_path):
+        clock = FakeClock(3 * DAY + ROLLUP_DELAY)
+        with HistoryStore(tmp_path / "history.db", clock=clock) as store:
+            self._fill(store)
+            store.rollup()
+            hourly = store.series(3600, server_id="fra", since=DAY, until=2 * DAY)
+            daily = store.series(DAY, server_id="fra")
+        assert [s.start for s in hourly] == [DAY + h * 3600 for h in range(24)]
+        assert all(s.runs == 6 for s in hourly)
+        assert [(s.start, s.runs) for s in daily] == [(d * DAY, DAY // 600) for d in range(3)]
+
+    def test_old_database_gains_sketch_column(self, tmp_path):
+        path = tmp_path / "history.db"
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE measurements (game TEXT NOT NULL, server_id TEXT NOT NULL, "
+                   "at REAL NOT NULL, location TEXT NOT NULL, region TEXT NOT NULL, "
+                   "ip TEXT NOT NULL, ping_avg REAL NOT NULL, ping_min REAL NOT NULL, "
+                   "ping_max REAL NOT NULL, ping_p50 REAL NOT NULL, ping_p95 REAL NOT NULL, "
+                   "ping_p99 REAL NOT NULL, jitter REAL NOT NULL, packet_loss REAL NOT NULL, "
+                   "successful_pings INTEGER NOT NULL, total_pings INTEGER NOT NULL, "
+                   "error TEXT, source TEXT NOT NULL)")
+        db.execute("INSERT INTO measurements VALUES ('valorant', 'fra', 0, 'Frankfurt', 'EU', "
+                   "'10.0.0.1', 40, 35, 45, 40, 44, 45, 2, 0, 10, 10, NULL, 'cli')")
+        db.commit()
+        db.close()
+        with HistoryStore(path, clock=FakeClock(DAY)) as store:
+            store.record([make_result()], at=60.0)
+            store.rollup()
+            assert store.summary()[0].runs == 2
@@ -0,0 +1,408 @@
+"""
+Unit tests for icmp_probe.py — ICMP packets and the multiplexed prober.
+No network traffic; all tests use synthetic packets and a fake ICMP socket.
+"""
+
+import sys
+import os
+import asyncio
+import socket
+import struct
+import time
+from collections import deque
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pacer
+from pacer import Pacer
+import icmp_probe
+from icmp_probe import (
+    MultiProber,
+    checksum,
+    build_echo_request,
+    parse_echo_reply,
+    ICMP_ECHO_REQUEST,
+    ICMP_ECHO_REPLY,
+    ICMPV6_ECHO_REPLY,
+    SOCKET_RAW,
+)
+
+
+def make_reply(ident, seq, icmp_type=ICMP_ECHO_REPLY, code=0, payload=b"data"):
+    return struct.pack("!BBHHH", icmp_type, code, 0, ident, seq) + payload
+
+
+def make_ipv4_header(length=20):
+    # Version 4, IHL in 32-bit words
+    return bytes([0x40 | (length // 4)]) + bytes(length - 1)
+
+
+# ---------------------------------------------------------------------------
+# checksum
+# ---------------------------------------------------------------------------
+
+class TestChecksum:
+    def test_zero_bytes(self):
+        assert checksum(b"\x00\x00") == 0xFFFF
+
+    def test_known_value(self):
+        # RFC 1071 example words: 0x0001 + 0xf203 + 0xf4f5 + 0xf6f7
+        data = bytes([0x00, 0x01, 0xF2, 0x03, 0xF4, 0xF5, 0xF6, 0xF7])
+        assert checksum(data) == 0x220D
+
+    def test_odd_length_padded(self):
+        assert checksum(b"\x01") == checksum(b"\x01\x00")
+
+    def test_packet_with_checksum_sums_to_zero(self):
+        packet = build_echo_request(0x1234, 7)
+        assert checksum(packet) == 0
+
+
+# ---------------------------------------------------------------------------
+# build_echo_request
+# ---------------------------------------------------------------------------
+
+class TestBuildEchoRequest:
+    def test_header_fields(self):
+        packet = build_echo_request(0xBEEF, 42, payload=b"")
+        icmp_type, code, _, ident, seq = struct.unpack("!BBHHH", packet)
+        assert icmp_type == ICMP_ECHO_REQUEST
+        assert code == 0
+        assert ident == 0xBEEF
+        assert seq == 42
+
+    def test_sequence_wraps(self):
+        packet = build_echo_request(1, 65536 + 5, payload=b"")
+        assert struct.unpack("!BBHHH", packet)[4] == 5
+
+    def test_ipv6_leaves_checksum_to_kernel(self):
+        packet = build_echo_request(1, 1, ipv6=True)
+        assert packet[0] == 128
+        assert struct.unpack("!H", packet[2:4])[0] == 0
+
+
+# ---------------------------------------------------------------------------
+# parse_echo_reply
+# ---------------------------------------------------------------------------
+
+class TestParseEchoReply:
+    def test_bare_icmp_reply(self):
+        assert parse_echo_reply(make_reply(10, 3)) == (10, 3)
+
+    def test_strips_ipv4_header(self):
+        packet = make_ipv4_header() + make_reply(10, 3)
+        assert parse_echo_reply(packet) == (10, 3)
+
+    def test_strips_ipv4_header_with_options(self):
+        packet = make_ipv4_header(24) + make_reply(10, 3)
+        assert parse_echo_reply(packet) == (10, 3)
+
+    def test_echo_request_ignored(self):
+        assert parse_echo_reply(make_reply(10, 3, icmp_type=ICMP_ECHO_REQUEST)) is None
+
+    def test_truncated_packet(self):
+        assert parse_echo_reply(b"\x00\x00\x00") is None
+
+    def test_ipv6_reply(self):
+        assert parse_echo_reply(make_reply(5, 9, icmp_type=ICMPV6_ECHO_REPLY), ipv6=True) == (5, 9)
+
+    def test_ipv4_reply_rejected_on_ipv6(self):
+        assert parse_echo_reply(make_reply(5, 9), ipv6=True) is None
+
+
+# ---------------------------------------------------------------------------
+# MultiProber (fake socket, no network)
+# ---------------------------------------------------------------------------
+
+class FakeIcmpSocket:
+    """
+    Echoes every request straight back unless the target is in `drop`.
+    A local socketpair supplies a real file descriptor for the event loop.
+    """
+
+    def __init__(self, drop=()):
+        self.drop = set(drop)
+        self.queue = deque()
+        self.sent = []
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def setblocking(self, flag):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+    def sendto(self, data, addr):
+        packet = bytes(data)
+        self.sent.append((addr[0], packet))
+        if addr[0] in self.drop:
+            return
+        icmp_type, code, _, ident, seq = struct.unpack("!BBHHH", packet[:8])
+        self.queue.append((make_ipv4_header() + make_reply(ident, seq), addr))
+        self._writer.send(b"x")
+
+    def recvfrom_into(self, buf):
+        if not self.queue:
+            raise BlockingIOError
+        self._reader.recv(1)
+        packet, addr = self.queue.popleft()
+        buf[:len(packet)] = packet
+        return len(packet), addr
+
+
+@pytest.fixture
+def fake_socket(monkeypatch):
+    sock = FakeIcmpSocket(drop={"10.0.0.9"})
+    monkeypatch.setattr(icmp_probe, "open_icmp_socket", lambda ipv6=False: (sock, SOCKET_RAW))
+    # Fresh token buckets so pacing from earlier tests does not carry over
+    monkeypatch.setattr(pacer, "_shared", None)
+    yield sock
+    sock.close()
+
+
+def sweep(prober, targets, **kwargs):
+    return asyncio.run(prober.sweep(targets, **kwargs))
+
+
+class TestMultiProber:
+    def test_every_target_gets_replies(self, fake_socket):
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.0.1", "10.0.0.2"], count=3, timeout=0.05, interval=0.001)
+        assert [len(r) for r in results] == [3, 3]
+        assert prober.kind is None  # sockets are released on close
+
+    def test_lost_target_has_no_rtts(self, fake_socket):
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.0.1", "10.0.0.9"], count=2, timeout=0.02, interval=0.001)
+        assert len(results[0]) == 2
+        assert results[1] == []
+
+    def test_one_round_per_interval_across_targets(self, fake_socket):
+        targets = [f"10.0.1.{i}" for i in range(50)]
+        with MultiProber() as prober:
+            sweep(prober, targets, count=2, timeout=0.05, interval=0.001)
+        # Round 1 reaches every target before round 2 starts
+        first_round = [addr for addr, _ in fake_socket.sent[:50]]
+        assert first_round == targets
+
+    def test_sends_spread_evenly_over_interval(self, fake_socket, monkeypatch):
+        stamps = []
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            stamps.append(time.perf_counter())
+            original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"], count=2,
+                  timeout=0.1, interval=0.08)
+        # One slot every interval / targets = 20ms, not four back-to-back sends
+        gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+        assert len(gaps) == 7
+        assert min(gaps) > 0.01
+
+    def test_rate_caps_sends_per_second(self, fake_socket, monkeypatch):
+        stamps = []
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            stamps.append(time.perf_counter())
+            original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        with MultiProber() as prober:
+            sweep(prober, [f"10.0.2.{i}" for i in range(10)], count=1, timeout=0.1,
+                  interval=0.001, rate=200)
+        # 10 probes at 200/s take at least 9 gaps of 5ms
+        assert stamps[-1] - stamps[0] >= 0.045
+
+    def test_sends_wait_for_pacer(self, fake_socket, monkeypatch):
+        stamps = []
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            stamps.append(time.perf_counter())
+            original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        shared = Pacer(prefix_rate=100, prefix_burst=1)
+        with MultiProber() as prober:
+            sweep(prober, [f"10.0.3.{i}" for i in range(6)], count=1, timeout=0.1,
+                  interval=0.001, pacer=shared)
+        # One /24: the first probe goes at once, the rest 10ms apart
+        assert len(stamps) == 6
+        assert stamps[-1] - stamps[0] >= 0.045
+
+    def test_throttled_prefix_does_not_hold_up_others(self, fake_socket, monkeypatch):
+        stamps = {}
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            stamps[addr[0]] = time.perf_counter()
+            original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        shared = Pacer(prefix_rate=10, prefix_burst=1)
+        started = time.perf_counter()
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.4.1", "10.0.4.2", "10.0.4.3", "10.0.5.1"], count=1,
+                            timeout=0.1, interval=0.001, pacer=shared)
+        assert all(len(r) == 1 for r in results)
+        # 10.0.4.2 and .3 wait 100ms and 200ms for their /24; 10.0.5.1 goes straight away
+        assert stamps["10.0.5.1"] - started < 0.05
+        assert stamps["10.0.4.3"] - stamps["10.0.4.1"] >= 0.19
+
+    def test_sequence_numbers_unique_within_sweep(self, fake_socket):
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1", "10.0.0.1", "10.0.0.2"], count=4, timeout=0.05, interval=0.001)
+        seqs = [struct.unpack("!H", packet[6:8])[0] for _, packet in fake_socket.sent]
+        assert len(seqs) == len(set(seqs)) == 12
+
+    def test_checksums_valid(self, fake_socket):
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1"], count=3, timeout=0.05, interval=0.001)
+        assert all(checksum(packet) == 0 for _, packet in fake_socket.sent)
+
+    def test_foreign_identifier_ignored(self, fake_socket, monkeypatch):
+        prober = MultiProber()
+        prober.ident = 1
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            # Reply carries another process's identifier
+            original_sendto(bytes(data[:4]) + struct.pack("!H", 2) + bytes(data[6:]), addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        with prober:
+            results = sweep(prober, ["10.0.0.1"], count=1, timeout=0.02, interval=0.001)
+        assert results == [[]]
+
+    def test_on_done_called_once_per_target(self, fake_socket):
+        done = []
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1", "10.0.0.9", "10.0.0.2"], count=2, timeout=0.02,
+                  interval=0.001, on_done=lambda i, outcome: done.append((i, len(outcome.rtts))))
+        assert sorted(done) == [(0, 2), (1, 0), (2, 2)]
+        # Answered targets finish before the lost one is written off
+        assert done[-1] == (1, 0)
+
+    def test_on_probe_reports_replies_and_losses(self, fake_socket):
+        events = []
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1", "10.0.0.9"], count=2, timeout=0.02, interval=0.001,
+                  on_probe=lambda i, seq, rtt: events.append((i, seq, rtt is None)))
+        assert sorted(events) == [(0, 0, False), (0, 1, False), (1, 0, True), (1, 1, True)]
+
+    def test_budget_aborts_unfinished_targets(self, fake_socket):
+        done = {}
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.0.1", "10.0.0.9"], count=5, timeout=1, interval=10,
+                            budget=0.05, on_done=done.__setitem__)
+        # Only the first slot (target 0, round 0) came up before the budget ran out;
+        # target 1's first slot is half an interval later
+        assert len(fake_socket.sent) == 1
+        assert [len(r) for r in results] == [1, 0]
+        assert done[0] == (results[0], 1, icmp_probe.ABORT_BUDGET, None)
+        assert done[1] == ([], 0, icmp_probe.ABORT_BUDGET, None)
+
+    def test_silent_target_aborted_after_max_losses(self, fake_socket):
+        done, events = {}, []
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1", "10.0.0.9"], count=10, timeout=0.01, interval=0.005,
+                  max_losses=3, on_done=done.__setitem__,
+                  on_probe=lambda i, seq, rtt: events.append(i))
+        assert done[0].sent == 10 and done[0].aborted is None
+        assert done[1].aborted == icmp_probe.ABORT_UNREACHABLE
+        assert done[1].sent < 10
+        # Skipped rounds are never sent nor reported as probes
+        assert events.count(1) == done[1].sent
+        assert sum(addr == "10.0.0.9" for addr, _ in fake_socket.sent) == done[1].sent
+
+    def test_target_that_replied_is_never_aborted(self, fake_socket, monkeypatch):
+        original_sendto = fake_socket.sendto
+        sent = []
+
+        def sendto(data, addr):
+            # Only the first probe is answered
+            sent.append(addr)
+            if len(sent) == 1:
+                original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        done = {}
+        with MultiProber() as prober:
+            sweep(prober, ["10.0.0.1"], count=6, timeout=0.01, interval=0.002,
+                  max_losses=2, on_done=done.__setitem__)
+        assert done[0] == (done[0].rtts, 6, None, None)
+        assert len(done[0].rtts) == 1
+
+    def test_send_error_loses_only_that_target(self, fake_socket, monkeypatch):
+        original_sendto = fake_socket.sendto
+
+        def sendto(data, addr):
+            if addr[0] == "255.255.255.255":
+                raise PermissionError(13, "Permission denied")
+            original_sendto(data, addr)
+
+        monkeypatch.setattr(fake_socket, "sendto", sendto)
+        done, events = {}, []
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.0.1", "255.255.255.255", "10.0.0.2"], count=3,
+                            timeout=0.05, interval=0.001, on_done=done.__setitem__,
+                            on_probe=lambda i, seq, rtt: events.append((i, rtt is None)))
+        assert [len(r) for r in results] == [3, 0, 3]
+        assert done[1] == ([], 0, None, "Permission denied")
+        assert done[0].error is None and done[2].error is None
+        assert events.count((1, True)) == 3
+
+    def test_missing_address_family_loses_only_its_targets(self, fake_socket, monkeypatch):
+        def open_socket(ipv6=False):
+            if ipv6:
+                raise OSError(97, "Address family not supported by protocol")
+            return fake_socket, SOCKET_RAW
+
+        monkeypatch.setattr(icmp_probe, "open_icmp_socket", open_socket)
+        done = {}
+        with MultiProber() as prober:
+            results = sweep(prober, ["10.0.0.1", "2001:db8::1"], count=2, timeout=0.05,
+                            interval=0.001, on_done=done.__setitem__)
+        assert [len(r) for r in results] == [2, 0]
+        assert done[1].sent == 0
+        assert done[1].error == "Address family not supported by protocol"
+
+    def test_raises_when_no_socket_opens(self, fake_socket, monkeypatch):
+        def open_socket(ipv6=False):
+            raise PermissionError(1, "Operation not permitted")
+
+        monkeypatch.setattr(icmp_probe, "open_icmp_socket", open_socket)
+        with MultiProber() as prober, pytest.raises(OSError):
+            sweep(prober, ["10.0.0.1"], count=1, timeout=0.05, interval=0.001)
+
+    def test_retired_target_skips_remaining_rounds(self, fake_socket):
+        done = {}
+        with MultiProber() as prober:
+            def on_round(round_no):
+                prober.retire(1)
+
+            sweep(prober, ["10.0.0.1", "10.0.0.2"], count=4, timeout=0.05, interval=0.001,
+                  on_done=done.__setitem__, on_round=on_round)
+        assert sum(addr == "10.0.0.2" for addr, _ in fake_socket.sent) == 1
+        assert done[1].aborted == icmp_probe.ABORT_RETIRED
+        # The probe already in flight still counts
+        assert (len(done[1].rtts), done[1].sent) == (1, 1)
+        assert (len(done[0].rtts), done[0].aborted) == (4, None)
+
+    def test_empty_target_list(self, fake_socket):
+        with MultiProber() as prober:
+            assert sweep(prober, [], count=3) == []
@@ -0,0 +1,103 @@
+"""
+Unit tests for pacer.py — per-prefix and global token buckets.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from pacer import Pacer, TokenBucket, address_prefix, get_pacer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def send_times(pacer, clock, ips):
+    """Time each send would go out at if the caller waits as told."""
+    return [round(clock.now + pacer.reserve(ip) - 1000.0, 6) for ip in ips]
+
+
+class TestTokenBucket:
+    def test_burst_then_steady_rate(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        times = []
+        for _ in range(5):
+            at = bucket.earliest(0.0)
+            bucket.take(at)
+            times.append(round(at, 6))
+        assert times == [0.0, 0.0, 0.0, 0.1, 0.2]
+
+    def test_refills_while_idle(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        for _ in range(2):
+            bucket.take(bucket.earliest(0.0))
+        assert bucket.earliest(0.0) > 0
+        assert bucket.earliest(1.0) == 1.0
+
+
+class TestPacer:
+    def test_same_prefix_shares_bucket(self):
+        clock = FakeClock()
+        pacer = Pacer(prefix_rate=10, prefix_burst=2, clock=clock)
+        times = send_times(pacer, clock, ["203.0.113.1", "203.0.113.2", "203.0.113.3"])
+        assert times == [0.0, 0.0, 0.1]
+
+    def test_other_prefixes_not_delayed(self):
+        clock = FakeClock()
+        pacer = Pacer(prefix_rate=10, prefix_burst=1, clock=clock)
+        times = send_times(pacer, clock, ["203.0.113.1", "198.51.100.1", "203.0.113.1"])
+        assert times == [0.0, 0.0, 0.1]
+
+    def test_ipv6_uses_48_prefix(self):
+        clock = FakeClock()
+        pacer = Pacer(prefix_rate=10, prefix_burst=1, clock=clock)
+        times = send_times(pacer, clock, ["2001:db8:1::1", "2001:db8:1:ff::1", "2001:db8:2::1"])
+        assert times == [0.0, 0.1, 0.0]
+
+    def test_global_cap_across_prefixes(self):
+        clock = FakeClock()
+        pacer = Pacer(rate=100, prefix_rate=1000, prefix_burst=1000, clock=clock)
+        ips = [f"10.{n}.0.1" for n in range(60)]
+        times = send_times(pacer, clock, ips)
+        # GLOBAL_BURST (50) go at once, the rest 10ms apart
+        assert times[49] == 0.0
+        assert times[50:53] == [0.01, 0.02, 0.03]
+
+    def test_set_rate_turns_cap_on_and_off(self):
+        pacer = Pacer()
+        assert pacer.rate is None
+        pacer.set_rate(250)
+        assert pacer.rate == 250
+        pacer.set_rate(None)
+        assert pacer.rate is None
+
+    def test_loopback_and_invalid_not_paced(self):
+        clock = FakeClock()
+        pacer = Pacer(prefix_rate=1, prefix_burst=1, clock=clock)
+        assert send_times(pacer, clock, ["127.0.0.1"] * 5) == [0.0] * 5
+        assert pacer.reserve("::1") == 0.0
+        assert pacer.reserve("not-an-ip") == 0.0
+
+    def test_waits_catch_up_as_time_passes(self):
+        clock = FakeClock()
+        pacer = Pacer(prefix_rate=10, prefix_burst=1, clock=clock)
+        pacer.reserve("203.0.113.1")
+        assert round(pacer.reserve("203.0.113.1"), 6) == 0.1
+        clock.now += 1.0
+        assert pacer.reserve("203.0.113.1") == 0.0
+
+    def test_shared_instance(self):
+        assert get_pacer() is get_pacer()
+
+
+class TestAddressPrefix:
+    def test_prefixes(self):
+        assert address_prefix("203.0.113.77") == "203.0.113.0/24"
+        assert address_prefix(" 2001:db8:1:2::5") == "2001:db8:1::/48"
+        assert address_prefix("not-an-ip") is None
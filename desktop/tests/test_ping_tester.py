@@ -5,17 +5,32 @@ No network calls are made; all tests use synthetic data.
 
 import sys
 import os
+import asyncio
+import copy
+import pickle
+import time
 import pytest
 
 # Add desktop/src to path so we can import without packaging
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
 
+import icmp_probe
+import ping_tester
+from circuit_breaker import CircuitBreaker
+from probe_log import ProbeLog, ProbeLogReader
+from result_cache import ResultCache
 from ping_tester import (
     validate_ip,
     calculate_jitter,
     get_best_server,
     get_connection_quality,
+    get_ping_backend,
+    ping_host,
+    parse_ping_line,
+    BACKEND_SUBPROCESS,
     PingResult,
+    RawTimes,
+    ResultSet,
 )
 
 
@@ -174,6 +189,76 @@ class TestGetBestServer:
         assert best.server_id == "s2"
 
 
+# ---------------------------------------------------------------------------
+# ResultSet
+# ---------------------------------------------------------------------------
+
+class TestResultSet:
+    def _set(self):
+        return ResultSet([
+            make_result(server_id="fra", location="Frankfurt", region="EU", ping_avg=35.0, jitter=4.0),
+            make_result(server_id="dead", location="Dallas", region="NA", ping_avg=0.0, packet_loss=100.0),
+            make_result(server_id="ams", location="amsterdam", region="EU", ping_avg=20.0, jitter=9.0),
+            make_result(server_id="nyc", location="New York", region="NA", ping_avg=90.0, packet_loss=3.0),
+        ])
+
+    def ids(self, results):
+        return [r.server_id for r in results]
+
+    def test_behaves_like_a_list(self):
+        results = self._set()
+        assert len(results) == 4
+        assert results[0].server_id == "fra"
+        assert self.ids(results[1:3]) == ["dead", "ams"]
+        assert results == list(results)
+        assert ResultSet() == []
+
+    def test_quality_computed_per_row(self):
+        assert self._set().quality == ["Good", "Bad", "Excellent", "Poor"]
+
+    def test_sorted_columns(self):
+        results = self._set()
+        assert self.ids(results.sorted("ping")) == ["ams", "fra", "nyc", "dead"]
+        assert self.ids(results.sorted("jitter")) == ["nyc", "fra", "ams", "dead"]
+        assert self.ids(results.sorted("location")) == ["ams", "fra", "nyc", "dead"]
+        assert self.ids(results.sorted("region")) == ["ams", "fra", "nyc", "dead"]
+        assert self.ids(results.sorted("bogus")) == self.ids(results.sorted("ping"))
+
+    def test_sorted_keeps_columns_aligned(self):
+        ordered = self._set().sorted("ping")
+        assert ordered.quality == ["Excellent", "Good", "Poor", "Bad"]
+        assert list(ordered.ping_avg) == [20.0, 35.0, 90.0, 0.0]
+
+    def test_orders_cached(self):
+        results = self._set()
+        assert results.order("jitter") is results.order("jitter")
+
+    def test_within_keeps_original_order(self):
+        results = self._set()
+        assert self.ids(results.within(40.0)) == ["fra", "ams"]
+        assert self.ids(results.within(35.0)) == ["fra", "ams"]
+        assert self.ids(results.within(10.0)) == []
+        assert self.ids(results.within(1000.0)) == ["fra", "ams", "nyc"]
+
+    def test_top(self):
+        assert self.ids(self._set().top(2)) == ["ams", "fra"]
+        assert self.ids(self._set().top(10, "loss")) == ["ams", "fra", "nyc", "dead"]
+
+    def test_by_region(self):
+        groups = self._set().by_region()
+        assert {region: self.ids(group) for region, group in groups.items()} == {
+            "EU": ["ams", "fra"], "NA": ["nyc", "dead"]}
+
+    def test_best_matches_get_best_server(self):
+        results = self._set()
+        assert results.best().server_id == "ams"
+        assert get_best_server(list(results)) is results.best()
+        assert ResultSet([make_result(packet_loss=100.0)]).best() is None
+
+    def test_reachable_count(self):
+        assert self._set().reachable_count == 3
+
+
 # ---------------------------------------------------------------------------
 # get_connection_quality
 # ---------------------------------------------------------------------------
@@ -223,3 +308,1070 @@ class TestGetConnectionQuality:
     def test_boundary_poor_bad(self):
         assert get_connection_quality(make_result(ping_avg=149.0, packet_loss=0.0)) == "Poor"
         assert get_connection_quality(make_result(ping_avg=150.0, packet_loss=0.0)) == "Bad"
+
+
+# ---------------------------------------------------------------------------
+# get_ping_backend / ping_host
+# ---------------------------------------------------------------------------
+
+class TestPingBackend:
+    @pytest.fixture(autouse=True)
+    def _reset_backend(self, monkeypatch):
+        # Keep the detected backend from leaking into other tests
+        monkeypatch.setattr(ping_tester, "_detected_backend", None)
+
+    def test_native_socket_preferred(self, monkeypatch):
+        monkeypatch.setattr(ping_tester.sys, "platform", "linux")
+        monkeypatch.setattr(icmp_probe, "detect_socket_kind", lambda: icmp_probe.SOCKET_DGRAM)
+        assert get_ping_backend(refresh=True) == icmp_probe.SOCKET_DGRAM
+
+    def test_falls_back_to_subprocess(self, monkeypatch):
+        monkeypatch.setattr(ping_tester.sys, "platform", "linux")
+        monkeypatch.setattr(icmp_probe, "detect_socket_kind", lambda: None)
+        assert get_ping_backend(refresh=True) == BACKEND_SUBPROCESS
+
+    def test_windows_uses_subprocess(self, monkeypatch):
+        monkeypatch.setattr(ping_tester.sys, "platform", "win32")
+        monkeypatch.setattr(icmp_probe, "detect_socket_kind", lambda: icmp_probe.SOCKET_RAW)
+        assert get_ping_backend(refresh=True) == BACKEND_SUBPROCESS
+
+    def test_ping_host_falls_back_on_socket_error(self, monkeypatch):
+        def fail(*args, **kwargs):
+            raise PermissionError("not permitted")
+
+        monkeypatch.setattr(icmp_probe, "ping_native", fail)
+        monkeypatch.setattr(ping_tester, "ping_server", lambda ip, count, timeout, **kwargs: {
+            "ping_times": [20.0], "packet_loss": 0.0, "packets_sent": 1,
+            "packets_received": 1, "error": None, "backend": BACKEND_SUBPROCESS,
+        })
+        result = ping_host("1.2.3.4", count=1, backend=icmp_probe.SOCKET_RAW)
+        assert result["backend"] == BACKEND_SUBPROCESS
+        assert result["ping_times"] == [20.0]
+
+    def test_ping_host_uses_native_backend(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "ping_native", lambda ip, count, timeout, **kwargs: {
+            "ping_times": [10.0], "packet_loss": 0.0, "packets_sent": 1,
+            "packets_received": 1, "error": None, "backend": icmp_probe.SOCKET_DGRAM,
+        })
+        result = ping_host("1.2.3.4", count=1, backend=icmp_probe.SOCKET_DGRAM)
+        assert result["backend"] == icmp_probe.SOCKET_DGRAM
+
+
+class FakeProber:
+    kind = icmp_probe.SOCKET_DGRAM
+
+    def __init__(self):
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    async def sweep(self, targets, count=10, timeout=1, interval=1.0, on_done=None,
+                    on_probe=None, budget=None, max_losses=None, on_round=None, rate=None):
+        self.calls.append(list(targets))
+        self.interval = interval
+        self.rate = rate
+        self.max_losses = max_losses
+        results = [[] if ip == "10.0.0.9" else [20.0] * count for ip in targets]
+        for i, times in enumerate(results):
+            if on_probe:
+                for seq in range(count):
+                    on_probe(i, seq, times[seq] if times else None)
+            on_done(i, icmp_probe.TargetResult(times, count))
+        return results
+
+
+class TestTestAllServersNative:
+    def _servers(self):
+        return [
+            {"id": "a", "location": "A", "ip": "10.0.0.1", "region": "EU"},
+            {"id": "b", "location": "B", "ip": "not-an-ip", "region": "EU"},
+            {"id": "c", "location": "C", "ip": "10.0.0.9", "region": "NA"},
+        ]
+
+    def test_single_sweep_for_all_servers(self, monkeypatch):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        results = ping_tester.test_all_servers(self._servers(), ping_count=4, backend=icmp_probe.SOCKET_DGRAM)
+
+        by_id = {r.server_id: r for r in results}
+        assert prober.calls == [["10.0.0.1", "10.0.0.9"]]
+        assert sorted(by_id) == ["a", "b", "c"]
+        assert by_id["a"].successful_pings == 4
+        assert by_id["a"].backend == icmp_probe.SOCKET_DGRAM
+        assert by_id["b"].error == "Invalid IP address"
+        assert by_id["c"].packet_loss == 100.0
+
+    def test_callback_reports_progress(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        seen = []
+        ping_tester.test_all_servers(self._servers(), ping_count=2, backend=icmp_probe.SOCKET_DGRAM,
+                         callback=lambda done, total, r: seen.append((done, total)))
+        assert seen == [(1, 3), (2, 3), (3, 3)]
+
+    def test_socket_error_falls_back_to_subprocess(self, monkeypatch):
+        def fail():
+            raise PermissionError("not permitted")
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            return {"ping_times": [30.0], "packet_loss": 0.0, "packets_sent": 1,
+                    "packets_received": 1, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", fail)
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        results = ping_tester.test_all_servers(self._servers()[:1] * 2, ping_count=1,
+                                               backend=icmp_probe.SOCKET_DGRAM)
+        assert [r.backend for r in results] == [BACKEND_SUBPROCESS] * 2
+        assert [r.ping_avg for r in results] == [30.0, 30.0]
+
+
+class TestAsyncApi:
+    def _servers(self, n):
+        return [{"id": f"s{i}", "location": f"S{i}", "ip": f"10.0.0.{i + 1}"} for i in range(n)]
+
+    def test_subprocess_backend_limits_concurrency(self, monkeypatch):
+        running = {"now": 0, "peak": 0}
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.05)
+            running["now"] -= 1
+            return {"ping_times": [10.0] * count, "packet_loss": 0.0, "packets_sent": count,
+                    "packets_received": count, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "MAX_CONCURRENT_PINGS", 4)
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        results = asyncio.run(ping_tester.test_all_servers_async(
+            self._servers(12), ping_count=2, interval_ms=20, backend=BACKEND_SUBPROCESS))
+        assert len(results) == 12
+        assert running["peak"] == 4
+
+    def test_subprocess_starts_are_staggered_across_interval(self, monkeypatch):
+        started = {}
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            started[ip] = time.perf_counter()
+            await asyncio.sleep(0.2)
+            return {"ping_times": [10.0] * count, "packet_loss": 0.0, "packets_sent": count,
+                    "packets_received": count, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        begin = time.perf_counter()
+        asyncio.run(ping_tester.test_all_servers_async(
+            self._servers(4), ping_count=2, interval_ms=200, backend=BACKEND_SUBPROCESS))
+        # All four run side by side, 50ms apart, instead of one after another
+        offsets = [started[f"10.0.0.{i + 1}"] - begin for i in range(4)]
+        assert offsets == sorted(offsets)
+        assert 0.12 <= offsets[-1] < 0.2
+
+    def test_rate_limits_parallel_processes(self, monkeypatch):
+        running = {"now": 0, "peak": 0}
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+            return {"ping_times": [10.0] * count, "packet_loss": 0.0, "packets_sent": count,
+                    "packets_received": count, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        asyncio.run(ping_tester.test_all_servers_async(
+            self._servers(6), ping_count=1, interval_ms=10, rate=200, backend=BACKEND_SUBPROCESS))
+        assert running["peak"] <= 2
+
+    def test_rate_reaches_native_sweep(self, monkeypatch):
+        probers = []
+
+        def make():
+            probers.append(FakeProber())
+            return probers[-1]
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", make)
+        ping_tester.test_all_servers(self._servers(3), ping_count=1, rate=500,
+                                     backend=icmp_probe.SOCKET_DGRAM)
+        assert probers[0].rate == 500
+
+    def test_iterator_yields_each_result(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+
+        async def collect():
+            return [r.server_id async for r in ping_tester.iter_results_async(
+                self._servers(3), ping_count=1, backend=icmp_probe.SOCKET_DGRAM)]
+
+        assert sorted(asyncio.run(collect())) == ["s0", "s1", "s2"]
+
+    def test_iterator_cancels_remaining_work(self, monkeypatch):
+        started = []
+
+        async def slow_ping(ip, count, timeout, on_probe=None, **kwargs):
+            started.append(ip)
+            await asyncio.sleep(0 if ip == "10.0.0.1" else 10)
+            return {"ping_times": [10.0], "packet_loss": 0.0, "packets_sent": 1,
+                    "packets_received": 1, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", slow_ping)
+
+        async def first():
+            async for result in ping_tester.iter_results_async(
+                    self._servers(3), ping_count=1, backend=BACKEND_SUBPROCESS):
+                return result
+
+        assert asyncio.run(asyncio.wait_for(first(), 2)).server_id == "s0"
+
+
+# ---------------------------------------------------------------------------
+# Target deduplication
+# ---------------------------------------------------------------------------
+
+class TestDedupe:
+    def _servers(self):
+        return [
+            {"id": "ams", "location": "Amsterdam", "ip": "10.0.0.1", "region": "EU", "game": "g1"},
+            {"id": "ams", "location": "Amsterdam", "ip": "10.0.0.1", "region": "EU", "game": "g2"},
+            {"id": "edge", "location": "Edge", "ip": "10.0.0.2", "region": "EU", "game": "g2"},
+            {"id": "dead", "location": "Dead", "ip": "10.0.0.9", "region": "NA", "game": "g1"},
+        ]
+
+    def test_target_key(self):
+        assert ping_tester.target_key(" 10.0.0.1") == "10.0.0.1"
+        assert ping_tester.target_key("2001:DB8::1") == "2001:db8::1"
+        assert ping_tester.target_key("10.0.0.1", ping_tester.DEDUPE_PREFIX) == "10.0.0.0/24"
+        assert ping_tester.target_key("not-an-ip", ping_tester.DEDUPE_PREFIX) == "not-an-ip"
+
+    def test_group_targets(self):
+        servers = self._servers()
+        assert [[s["id"] for s in g] for g in ping_tester.group_targets(servers)] == [
+            ["ams", "ams"], ["edge"], ["dead"]]
+        assert len(ping_tester.group_targets(servers, ping_tester.DEDUPE_PREFIX)) == 1
+        assert len(ping_tester.group_targets(servers, None)) == 4
+
+    def test_shared_address_probed_once(self, monkeypatch):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        stats = ping_tester.SweepStats()
+        seen = []
+        results = ping_tester.test_all_servers(self._servers(), ping_count=3, max_losses=None,
+                                               backend=icmp_probe.SOCKET_DGRAM, stats=stats,
+                                               callback=lambda done, total, r: seen.append(total))
+
+        assert prober.calls == [["10.0.0.1", "10.0.0.2", "10.0.0.9"]]
+        assert sorted((r.game, r.server_id) for r in results) == [
+            ("g1", "ams"), ("g1", "dead"), ("g2", "ams"), ("g2", "edge")]
+        ams = [r for r in results if r.server_id == "ams"]
+        assert [r.raw_times for r in ams] == [[20.0] * 3, [20.0] * 3]
+        assert seen == [4] * 4
+        assert (stats.servers, stats.shared, stats.probes_sent, stats.probes_saved) == (4, 1, 9, 3)
+
+    def test_probe_events_fanned_out(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        events = []
+        ping_tester.test_all_servers(self._servers()[:2], ping_count=2,
+                                     backend=icmp_probe.SOCKET_DGRAM, on_probe=events.append)
+        assert len(events) == 4
+        assert sorted({e.server_id for e in events}) == ["ams"]
+
+    def test_prefix_mode(self, monkeypatch):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        results = ping_tester.test_all_servers(self._servers(), ping_count=2, max_losses=None,
+                                               backend=icmp_probe.SOCKET_DGRAM,
+                                               dedupe=ping_tester.DEDUPE_PREFIX)
+        assert prober.calls == [["10.0.0.1"]]
+        by_ip = {r.ip_address: r for r in results}
+        assert len(results) == 4
+        # Every server keeps its own address but reports the shared measurement
+        assert by_ip["10.0.0.9"].packet_loss == 0.0
+
+    def test_dedupe_off(self, monkeypatch):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        ping_tester.test_all_servers(self._servers(), ping_count=1, backend=icmp_probe.SOCKET_DGRAM,
+                                     dedupe=None)
+        assert prober.calls == [["10.0.0.1", "10.0.0.1", "10.0.0.2", "10.0.0.9"]]
+
+    def test_two_phase_fans_out_both_passes(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        results = ping_tester.test_all_servers(self._servers(), ping_count=4, max_losses=None,
+                                               backend=icmp_probe.SOCKET_DGRAM, top_k=1)
+        phases = {(r.game, r.server_id): r.phase for r in results}
+        assert len(results) == 4
+        assert phases[("g1", "ams")] == phases[("g2", "ams")] == ping_tester.PHASE_DEEP
+
+
+# ---------------------------------------------------------------------------
+# Result cache
+# ---------------------------------------------------------------------------
+
+class TestResultCacheSweep:
+    def _servers(self):
+        return [
+            {"id": "a", "location": "A", "ip": "10.0.0.1", "region": "EU"},
+            {"id": "b", "location": "B", "ip": "10.0.0.2", "region": "EU"},
+        ]
+
+    def _sweep(self, monkeypatch, cache, servers=None, **kwargs):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        stats = ping_tester.SweepStats()
+        results = ping_tester.test_all_servers(servers or self._servers(), ping_count=3,
+                                               backend=icmp_probe.SOCKET_DGRAM, stats=stats,
+                                               cache=cache, **kwargs)
+        return {r.server_id: r for r in results}, prober.calls, stats
+
+    def test_fresh_results_served_from_cache(self, monkeypatch, tmp_path):
+        clock = [1000.0]
+        cache = ResultCache(tmp_path / "cache.db", max_age=60, clock=lambda: clock[0])
+        first, calls, _ = self._sweep(monkeypatch, cache)
+        assert calls == [["10.0.0.1", "10.0.0.2"]]
+
+        clock[0] += 20
+        servers = self._servers() + [{"id": "c", "location": "C", "ip": "10.0.0.3", "region": "NA"}]
+        by_id, calls, stats = self._sweep(monkeypatch, cache, servers)
+        assert calls == [["10.0.0.3"]]
+        assert (by_id["a"].age, by_id["c"].age) == (20.0, 0.0)
+        assert by_id["a"].raw_times == first["a"].raw_times
+        assert by_id["a"].ping_p95 == first["a"].ping_p95
+        assert (stats.cache_hits, stats.cache_misses) == (2, 1)
+        assert stats.probes_saved == 6
+
+    def test_stale_results_measured_again(self, monkeypatch, tmp_path):
+        clock = [1000.0]
+        cache = ResultCache(tmp_path / "cache.db", max_age=60, clock=lambda: clock[0])
+        self._sweep(monkeypatch, cache)
+        clock[0] += 61
+        _, calls, stats = self._sweep(monkeypatch, cache)
+        assert calls == [["10.0.0.1", "10.0.0.2"]]
+        assert (stats.cache_hits, stats.cache_misses) == (0, 2)
+
+    def test_saved_for_the_next_run(self, monkeypatch, tmp_path):
+        self._sweep(monkeypatch, ResultCache(tmp_path / "cache.db", max_age=0))
+        _, calls, _ = self._sweep(monkeypatch, ResultCache(tmp_path / "cache.db", max_age=60))
+        assert calls == []
+
+    def test_concurrent_runs_probe_each_target_once(self, monkeypatch, tmp_path):
+        calls = []
+
+        class SlowProber(FakeProber):
+            async def sweep(self, targets, **kwargs):
+                calls.append(list(targets))
+                await asyncio.sleep(0.05)
+                return await super().sweep(targets, **kwargs)
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", SlowProber)
+
+        async def run(cache):
+            return await ping_tester.test_all_servers_async(
+                self._servers(), ping_count=3, backend=icmp_probe.SOCKET_DGRAM, cache=cache)
+
+        async def both():
+            first = run(ResultCache(tmp_path / "cache.db", max_age=0))
+            second = run(ResultCache(tmp_path / "cache.db", max_age=0))
+            return await asyncio.gather(first, second)
+
+        first, second = asyncio.run(both())
+        assert calls == [["10.0.0.1", "10.0.0.2"]]
+        assert sorted(r.server_id for r in second) == ["a", "b"]
+        assert [r.raw_times for r in second] == [[20.0] * 3] * 2
+
+    def test_unreachable_target_released_before_the_run_ends(self, monkeypatch, tmp_path):
+        calls = []
+
+        class SlowProber(FakeProber):
+            async def sweep(self, targets, count=10, on_done=None, **kwargs):
+                calls.append(list(targets))
+                if len(targets) == 1:
+                    on_done(0, icmp_probe.TargetResult([20.0] * count, count))
+                    return
+                on_done(0, icmp_probe.TargetResult([], 1, icmp_probe.ABORT_UNREACHABLE))
+                await asyncio.sleep(0.3)
+                on_done(1, icmp_probe.TargetResult([20.0] * count, count))
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", SlowProber)
+
+        async def run(servers):
+            return await ping_tester.test_all_servers_async(
+                servers, ping_count=3, backend=icmp_probe.SOCKET_DGRAM,
+                cache=ResultCache(tmp_path / "cache.db", max_age=0))
+
+        async def both():
+            first = asyncio.ensure_future(run(self._servers()))
+            await asyncio.sleep(0.05)
+            second = await run(self._servers()[:1])
+            return first.done(), second, await first
+
+        first_done, second, _ = asyncio.run(both())
+        assert not first_done
+        assert calls == [["10.0.0.1", "10.0.0.2"], ["10.0.0.1"]]
+        assert second[0].successful_pings == 3
+
+    def test_abandoned_claim_taken_over(self, monkeypatch, tmp_path):
+        dead = ResultCache(tmp_path / "cache.db", claim_timeout=0.2)
+        dead.claim([ping_tester._cache_key("10.0.0.2", ping_tester._SweepPlan(3, 1, 1.0), "ip")])
+        by_id, calls, stats = self._sweep(monkeypatch, ResultCache(tmp_path / "cache.db", max_age=0))
+        assert calls == [["10.0.0.1"], ["10.0.0.2"]]
+        assert by_id["b"].successful_pings == 3
+        assert stats.cache_misses == 2
+
+    def test_different_schedule_not_reused(self, monkeypatch, tmp_path):
+        cache = ResultCache(tmp_path / "cache.db")
+        self._sweep(monkeypatch, cache, interval_ms=100)
+        _, calls, _ = self._sweep(monkeypatch, cache)
+        assert calls == [["10.0.0.1", "10.0.0.2"]]
+
+    def test_cut_short_results_not_cached(self, monkeypatch, tmp_path):
+        class AbortingProber(FakeProber):
+            async def sweep(self, targets, count=10, on_done=None, **kwargs):
+                on_done(0, icmp_probe.TargetResult([], 2, icmp_probe.ABORT_UNREACHABLE))
+                on_done(1, icmp_probe.TargetResult([20.0], 1, icmp_probe.ABORT_BUDGET))
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", AbortingProber)
+        cache = ResultCache(tmp_path / "cache.db")
+        ping_tester.test_all_servers(self._servers(), ping_count=3,
+                                     backend=icmp_probe.SOCKET_DGRAM, cache=cache)
+        assert len(cache) == 0
+
+
+# ---------------------------------------------------------------------------
+# Burst mode
+# ---------------------------------------------------------------------------
+
+class TestBurstMode:
+    def test_default_interval_is_one_second(self):
+        assert ping_tester.probe_interval(10) == 1.0
+
+    def test_explicit_interval(self):
+        assert ping_tester.probe_interval(10, interval_ms=50) == 0.05
+
+    def test_interval_has_floor(self):
+        assert ping_tester.probe_interval(10, interval_ms=0) == ping_tester.MIN_BURST_INTERVAL
+
+    def test_budget_spreads_probes_over_half(self):
+        assert ping_tester.probe_interval(10, budget=1.0) == 0.05
+
+    def test_large_budget_keeps_standard_interval(self):
+        assert ping_tester.probe_interval(10, budget=60) == 1.0
+
+    def test_command_passes_interval(self):
+        cmd = ping_tester._ping_command("1.2.3.4", 10, 1, "linux", 0.2)
+        assert cmd == ["ping", "-c", "10", "-W", "1", "-i", "0.2", "1.2.3.4"]
+
+    def test_command_default_interval_omitted(self):
+        assert "-i" not in ping_tester._ping_command("1.2.3.4", 10, 1, "linux")
+
+    def test_subprocess_interval_clamped(self):
+        assert ping_tester._subprocess_interval(0.02, "linux") == 0.2
+        assert ping_tester._subprocess_interval(0.02, "darwin") == 0.1
+        assert ping_tester._subprocess_interval(0.02, "windows") == 1.0
+
+    def test_native_sweep_uses_interval(self, monkeypatch):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        ping_tester.test_all_servers([{"id": "a", "location": "A", "ip": "10.0.0.1"}],
+                                     ping_count=2, backend=icmp_probe.SOCKET_DGRAM,
+                                     interval_ms=20)
+        assert prober.interval == 0.02
+
+    def test_spent_budget_skips_remaining_servers(self, monkeypatch):
+        async def slow_ping(ip, count, timeout, on_probe=None, **kwargs):
+            await asyncio.sleep(kwargs["budget"])
+            return {"ping_times": [], "packet_loss": 100.0, "packets_sent": count,
+                    "packets_received": 0, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", slow_ping)
+        servers = [{"id": f"s{i}", "location": f"S{i}", "ip": f"10.0.0.{i + 1}"} for i in range(3)]
+        results = ping_tester.test_all_servers(servers, ping_count=1, parallel=False,
+                                               backend=BACKEND_SUBPROCESS, budget=0.01)
+        assert [r.error for r in results] == [None, "Time budget exceeded", "Time budget exceeded"]
+
+
+# ---------------------------------------------------------------------------
+# Fast-fail and circuit breaker
+# ---------------------------------------------------------------------------
+
+class FakePingProcess:
+    """Stands in for a system ping process that prints `lines` and then hangs."""
+
+    def __init__(self, lines):
+        self.stdout = asyncio.StreamReader()
+        for line in lines:
+            self.stdout.feed_data(line.encode() + b"\n")
+        self.returncode = None
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+        self.returncode = -9
+
+    async def wait(self):
+        return self.returncode
+
+
+class TestFastFail:
+    def _ping(self, monkeypatch, lines, **kwargs):
+        procs = []
+
+        async def spawn(*cmd, **kw):
+            procs.append(FakePingProcess(lines))
+            return procs[-1]
+
+        monkeypatch.setattr(ping_tester.platform, "system", lambda: "Linux")
+        monkeypatch.setattr(ping_tester.asyncio, "create_subprocess_exec", spawn)
+        result = asyncio.run(ping_tester.ping_server_async("10.0.0.1", count=10, **kwargs))
+        return result, procs[0]
+
+    def test_subprocess_stops_after_consecutive_losses(self, monkeypatch):
+        lines = [f"no answer yet for icmp_seq={i}" for i in range(1, 4)]
+        result, proc = self._ping(monkeypatch, lines, max_losses=3)
+        assert result["error"] == ping_tester.UNREACHABLE_ERROR.format(3)
+        assert result["packets_sent"] == 3
+        assert result["packet_loss"] == 100.0
+        assert proc.killed
+
+    def test_subprocess_reply_disables_fast_fail(self, monkeypatch):
+        lines = ["64 bytes from 10.0.0.1: icmp_seq=1 ttl=57 time=20.0 ms"]
+        lines += [f"no answer yet for icmp_seq={i}" for i in range(2, 6)]
+        result, _ = self._ping(monkeypatch, lines, max_losses=3, budget=0.05, interval=0.2)
+        # Kept running until the budget ran out, with the partial stats kept
+        assert result["error"] == ping_tester.BUDGET_ERROR
+        assert result["ping_times"] == [20.0]
+        assert result["packets_sent"] == 5
+
+    def test_native_abort_reported_as_error(self, monkeypatch):
+        class AbortingProber(FakeProber):
+            async def sweep(self, targets, count=10, on_done=None, **kwargs):
+                on_done(0, icmp_probe.TargetResult([], 3, icmp_probe.ABORT_UNREACHABLE))
+                on_done(1, icmp_probe.TargetResult([20.0, 21.0], 2, icmp_probe.ABORT_BUDGET))
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", AbortingProber)
+        servers = [{"id": "a", "location": "A", "ip": "10.0.0.1"},
+                   {"id": "b", "location": "B", "ip": "10.0.0.2"}]
+        by_id = {r.server_id: r for r in ping_tester.test_all_servers(
+            servers, ping_count=10, backend=icmp_probe.SOCKET_DGRAM)}
+        assert by_id["a"].error == ping_tester.UNREACHABLE_ERROR.format(3)
+        assert by_id["a"].total_pings == 3
+        assert by_id["b"].error == ping_tester.BUDGET_ERROR
+        assert (by_id["b"].total_pings, by_id["b"].packet_loss, by_id["b"].ping_avg) == (2, 0.0, 20.5)
+
+    def test_native_send_error_reported_per_server(self, monkeypatch):
+        class FailingSendProber(FakeProber):
+            async def sweep(self, targets, count=10, on_done=None, **kwargs):
+                on_done(0, icmp_probe.TargetResult([20.0], 1))
+                on_done(1, icmp_probe.TargetResult([], 0, None, "Permission denied"))
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", FailingSendProber)
+        monkeypatch.setattr(ping_tester, "_produce_subprocess", None)  # no fallback
+        servers = [{"id": "a", "location": "A", "ip": "10.0.0.1"},
+                   {"id": "b", "location": "B", "ip": "255.255.255.255"}]
+        by_id = {r.server_id: r for r in ping_tester.test_all_servers(
+            servers, ping_count=1, backend=icmp_probe.SOCKET_DGRAM)}
+        assert by_id["a"].error is None and by_id["a"].ping_avg == 20.0
+        assert by_id["b"].error == ping_tester.SEND_ERROR.format("Permission denied")
+        assert by_id["b"].packet_loss == 100.0
+
+    def test_breaker_skips_dead_servers_and_records_outcomes(self, monkeypatch, tmp_path):
+        prober = FakeProber()
+        monkeypatch.setattr(icmp_probe, "MultiProber", lambda: prober)
+        breaker = CircuitBreaker(tmp_path / "dead.json")
+        breaker.record("10.0.0.2", reachable=False)
+        servers = [{"id": s, "location": s.upper(), "ip": ip}
+                   for s, ip in [("a", "10.0.0.1"), ("b", "10.0.0.2"), ("c", "10.0.0.9")]]
+
+        results = ping_tester.test_all_servers(servers, ping_count=2,
+                                               backend=icmp_probe.SOCKET_DGRAM, breaker=breaker)
+        by_id = {r.server_id: r for r in results}
+        assert prober.calls == [["10.0.0.1", "10.0.0.9"]]
+        assert by_id["b"].error.startswith("Unreachable in recent runs")
+        assert by_id["b"].total_pings == 0
+        assert breaker.allow("10.0.0.1")
+        assert not breaker.allow("10.0.0.9")
+        # State is persisted for the next run
+        assert not CircuitBreaker(tmp_path / "dead.json").allow("10.0.0.9")
+
+    def test_breaker_not_tripped_when_nothing_answers(self, monkeypatch, tmp_path):
+        class DeadProber(FakeProber):
+            async def sweep(self, targets, count=10, on_done=None, **kwargs):
+                for i in range(len(targets)):
+                    on_done(i, icmp_probe.TargetResult([], count))
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", DeadProber)
+        breaker = CircuitBreaker(tmp_path / "dead.json")
+        servers = [{"id": s, "location": s.upper(), "ip": ip}
+                   for s, ip in [("a", "10.0.0.1"), ("b", "10.0.0.2")]]
+        ping_tester.test_all_servers(servers, ping_count=2, backend=icmp_probe.SOCKET_DGRAM,
+                                     breaker=breaker)
+        # Every server failing at once is a local outage, not dead servers
+        assert breaker.allow("10.0.0.1") and breaker.allow("10.0.0.2")
+        assert breaker.failures("10.0.0.1") == 0
+
+
+# ---------------------------------------------------------------------------
+# Race mode
+# ---------------------------------------------------------------------------
+
+class RacingProber(FakeProber):
+    """Sends round by round, honouring retire() from the on_round callback."""
+    latency = {"10.0.0.1": 20.0, "10.0.0.2": 22.0, "10.0.0.3": 80.0, "10.0.0.4": 120.0}
+
+    async def sweep(self, targets, count=10, on_done=None, on_probe=None, on_round=None, **kwargs):
+        self.retired = set()
+        times = [[] for _ in targets]
+        sent = [0] * len(targets)
+        for round_no in range(count):
+            if round_no and on_round:
+                on_round(round_no)
+            for i, ip in enumerate(targets):
+                if i in self.retired:
+                    continue
+                rtt = self.latency[ip] + (round_no % 3)
+                sent[i] += 1
+                times[i].append(rtt)
+                if on_probe:
+                    on_probe(i, round_no, rtt)
+        for i in range(len(targets)):
+            aborted = icmp_probe.ABORT_RETIRED if i in self.retired else None
+            on_done(i, icmp_probe.TargetResult(times[i], sent[i], aborted))
+        return times
+
+    def retire(self, target):
+        self.retired.add(target)
+
+
+class TestRaceMode:
+    def _servers(self):
+        return [{"id": f"s{n}", "location": f"S{n}", "ip": f"10.0.0.{n}"} for n in range(1, 5)]
+
+    def test_clear_losers_dropped_after_a_few_probes(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", RacingProber)
+        stats = ping_tester.SweepStats()
+        results = ping_tester.test_all_servers(self._servers(), ping_count=10,
+                                               backend=icmp_probe.SOCKET_DGRAM,
+                                               race=True, stats=stats)
+        sent = {r.server_id: r.total_pings for r in results}
+        assert sent["s1"] == 10
+        assert sent["s3"] == sent["s4"] == ping_tester.RACE_MIN_PROBES
+        assert sorted(r.server_id for r in results if r.eliminated) == ["s3", "s4"]
+        assert all(r.partial == r.eliminated for r in results)
+        assert stats.eliminated == 2
+        assert stats.probes_saved == 2 * (10 - ping_tester.RACE_MIN_PROBES)
+
+    def test_same_best_server_as_full_test(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", RacingProber)
+        full = ping_tester.test_all_servers(self._servers(), ping_count=10,
+                                            backend=icmp_probe.SOCKET_DGRAM)
+        raced = ping_tester.test_all_servers(self._servers(), ping_count=10,
+                                             backend=icmp_probe.SOCKET_DGRAM, race=True)
+        assert get_best_server(raced).server_id == get_best_server(full).server_id == "s1"
+        assert get_best_server(raced).total_pings == 10
+
+    def test_stats_without_race(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        stats = ping_tester.SweepStats()
+        ping_tester.test_all_servers(self._servers()[:2], ping_count=5,
+                                     backend=icmp_probe.SOCKET_DGRAM, stats=stats)
+        assert (stats.servers, stats.probes_planned, stats.probes_sent) == (2, 10, 10)
+        assert stats.probes_saved == 0 and stats.eliminated == 0
+
+    def test_subprocess_loser_is_stopped(self, monkeypatch):
+        spawned = {}
+
+        async def spawn(*cmd, **kw):
+            ip = cmd[-1]
+            rtt = 20.0 if ip == "10.0.0.1" else 90.0
+            spawned[ip] = FakePingProcess(
+                [f"64 bytes from {ip}: icmp_seq={i} ttl=57 time={rtt + i % 2} ms" for i in range(1, 11)])
+            return spawned[ip]
+
+        monkeypatch.setattr(ping_tester.platform, "system", lambda: "Linux")
+        monkeypatch.setattr(ping_tester.asyncio, "create_subprocess_exec", spawn)
+        results = ping_tester.test_all_servers(self._servers()[:2], ping_count=10,
+                                               backend=BACKEND_SUBPROCESS, race=True)
+        by_id = {r.server_id: r for r in results}
+        assert by_id["s1"].total_pings == 10
+        assert by_id["s2"].total_pings == ping_tester.RACE_MIN_PROBES
+        assert by_id["s2"].packet_loss == 0.0
+        assert spawned["10.0.0.2"].killed
+
+    def test_race_bounds_need_minimum_probes(self):
+        race = ping_tester._Race()
+        race.record("a", 10.0)
+        race.record("b", 500.0)
+        assert race.losers(["b"]) == []
+
+    def test_lossy_server_cannot_lead(self):
+        race = ping_tester._Race()
+        for rtt in (10.0, 10.0, 10.0):
+            race.record("a", rtt)
+            race.record("b", rtt + 50)
+        race.record("a", None)
+        assert race.leader_bound() > 50
+        assert race.losers(["b"]) == []
+
+
+# ---------------------------------------------------------------------------
+# Two-phase sweep
+# ---------------------------------------------------------------------------
+
+class TestTwoPhase:
+    def _servers(self):
+        return [{"id": f"s{n}", "location": f"S{n}", "ip": f"10.0.0.{n}"} for n in range(1, 5)]
+
+    def _run(self, monkeypatch, **kwargs):
+        calls = []
+
+        class Prober(RacingProber):
+            async def sweep(self, targets, count=10, **kw):
+                calls.append((list(targets), count))
+                return await super().sweep(targets, count=count, **kw)
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", Prober)
+        results = ping_tester.test_all_servers(self._servers(), ping_count=10,
+                                               backend=icmp_probe.SOCKET_DGRAM, **kwargs)
+        return {r.server_id: r for r in results}, calls
+
+    def test_only_top_k_get_full_count(self, monkeypatch):
+        by_id, calls = self._run(monkeypatch, top_k=2)
+        assert calls == [(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"], 2),
+                         (["10.0.0.1", "10.0.0.2"], 10)]
+        assert {k: (r.phase, r.total_pings) for k, r in by_id.items()} == {
+            "s1": (ping_tester.PHASE_DEEP, 10),
+            "s2": (ping_tester.PHASE_DEEP, 10),
+            "s3": (ping_tester.PHASE_SCREEN, 2),
+            "s4": (ping_tester.PHASE_SCREEN, 2),
+        }
+        assert sorted(k for k, r in by_id.items() if r.partial) == ["s3", "s4"]
+
+    def test_one_result_per_server_and_progress(self, monkeypatch):
+        seen = []
+        by_id, _ = self._run(monkeypatch, top_k=1, screen_count=1,
+                             callback=lambda done, total, r: seen.append((done, total)))
+        assert sorted(by_id) == ["s1", "s2", "s3", "s4"]
+        assert seen == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+    def test_stats_count_both_passes(self, monkeypatch):
+        stats = ping_tester.SweepStats()
+        self._run(monkeypatch, top_k=1, stats=stats)
+        assert stats.probes_sent == 4 * 2 + 10
+        assert stats.probes_saved == 40 - 18
+
+    def test_single_pass_has_no_phase(self, monkeypatch):
+        by_id, _ = self._run(monkeypatch)
+        assert {r.phase for r in by_id.values()} == {""}
+
+
+# ---------------------------------------------------------------------------
+# Adaptive concurrency
+# ---------------------------------------------------------------------------
+
+class TestAdaptiveConcurrency:
+    def _servers(self, n):
+        return [{"id": f"s{i}", "location": f"S{i}", "ip": f"10.0.{i // 250}.{i % 250 + 1}"}
+                for i in range(n)]
+
+    def _run(self, monkeypatch, times, n=40, **kwargs):
+        running = {"now": 0, "peak": 0}
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kw):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.005)
+            running["now"] -= 1
+            return {"ping_times": list(times), "packet_loss": 0.0, "packets_sent": len(times),
+                    "packets_received": len(times), "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        stats = ping_tester.SweepStats()
+        ping_tester.test_all_servers(self._servers(n), ping_count=len(times), interval_ms=10,
+                                     backend=BACKEND_SUBPROCESS, stats=stats, **kwargs)
+        return running["peak"], stats
+
+    def test_grows_while_pings_stay_clean(self, monkeypatch):
+        peak, stats = self._run(monkeypatch, [20.0, 21.0, 20.5])
+        assert peak > ping_tester.INITIAL_CONCURRENCY
+        assert peak <= stats.concurrency <= peak + 1
+
+    def test_ceiling_caps_growth(self, monkeypatch):
+        peak, stats = self._run(monkeypatch, [20.0, 21.0, 20.5], max_concurrency=6)
+        assert peak == stats.concurrency == 6
+
+    def test_stays_low_when_pings_inflate(self, monkeypatch):
+        peak, stats = self._run(monkeypatch, [20.0, 80.0, 90.0])
+        assert peak <= ping_tester.INITIAL_CONCURRENCY
+        assert stats.concurrency == ping_tester.INITIAL_CONCURRENCY
+
+    def test_native_reports_group_size(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        stats = ping_tester.SweepStats()
+        ping_tester.test_all_servers(self._servers(5), ping_count=1,
+                                     backend=icmp_probe.SOCKET_DGRAM, stats=stats)
+        assert stats.concurrency == 5
+
+    def test_halves_once_per_window(self):
+        limit = ping_tester._Concurrency(ceiling=16, initial=2)
+
+        async def scenario():
+            first, second = await limit.acquire(), await limit.acquire()
+            limit.release(first, True)
+            limit.release(second, True)  # started before the decrease
+            assert limit.level == 1
+            limit.release(await limit.acquire(), False)
+            assert limit.level == 2
+            third, fourth = await limit.acquire(), await limit.acquire()
+            limit.release(third, True)
+            assert limit.level == 1
+            limit.release(fourth, True)  # same window as third
+            assert limit.level == 1
+
+        asyncio.run(scenario())
+
+    def test_grows_only_when_limit_is_full(self):
+        limit = ping_tester._Concurrency(ceiling=16, initial=4)
+
+        async def scenario():
+            limit.release(await limit.acquire(), False)
+            assert limit.level == 4
+
+        asyncio.run(scenario())
+
+    def test_waits_for_free_slot(self):
+        limit = ping_tester._Concurrency(ceiling=4, initial=1)
+
+        async def scenario():
+            first = await limit.acquire()
+            waiting = asyncio.ensure_future(limit.acquire())
+            await asyncio.sleep(0)
+            assert not waiting.done()
+            limit.release(first, None)
+            await asyncio.wait_for(waiting, 1)
+            assert (limit.active, limit.level) == (1, 1)
+
+        asyncio.run(scenario())
+
+    def test_congestion_signal(self):
+        congested = ping_tester._congested
+        assert congested({"ping_times": [], "packet_loss": 100.0}) is None
+        assert congested({"ping_times": [20.0, 21.0], "packet_loss": 0.0}) is False
+        assert congested({"ping_times": [20.0, 21.0], "packet_loss": 50.0}) is True
+        assert congested({"ping_times": [20.0, 45.0, 50.0], "packet_loss": 0.0}) is True
+        # Long-haul servers get proportionally more slack
+        assert congested({"ping_times": [200.0, 240.0, 250.0], "packet_loss": 0.0}) is False
+
+
+# ---------------------------------------------------------------------------
+# Streaming statistics
+# ---------------------------------------------------------------------------
+
+class TestResultStats:
+    def _servers(self):
+        return [{"id": "a", "location": "A", "ip": "10.0.0.1"},
+                {"id": "dead", "location": "Dead", "ip": "10.0.0.9"}]
+
+    def test_stats_fed_per_probe(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        results = ping_tester.test_all_servers(self._servers(), ping_count=4, max_losses=None,
+                                               backend=icmp_probe.SOCKET_DGRAM, retain_raw=False)
+        by_id = {r.server_id: r for r in results}
+        assert (by_id["a"].stats.received, by_id["a"].stats.mean) == (4, 20.0)
+        assert (by_id["dead"].stats.sent, by_id["dead"].stats.max_loss_run) == (4, 4)
+
+    def test_retain_raw_off_keeps_only_accumulator(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        results = ping_tester.test_all_servers(self._servers()[:1], ping_count=5, retain_raw=False,
+                                               backend=icmp_probe.SOCKET_DGRAM)
+        assert results[0].raw_times == []
+        assert results[0].stats.received == 5
+        assert (results[0].ping_avg, results[0].successful_pings) == (20.0, 5)
+
+    def test_accumulator_dropped_when_raw_retained(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        result = ping_tester.test_all_servers(self._servers()[:1], ping_count=5,
+                                              backend=icmp_probe.SOCKET_DGRAM)[0]
+        assert result.raw_times == [20.0] * 5 and result.stats is None
+        assert (result.ping_avg, result.ping_p50) == (20.0, 20.0)
+
+    def test_subprocess_unreported_replies_rebuilt(self, monkeypatch):
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            on_probe(0, 10.0)
+            return {"ping_times": [10.0, 30.0], "packet_loss": 33.33, "packets_sent": 3,
+                    "packets_received": 2, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        result = ping_tester.test_all_servers(self._servers()[:1], ping_count=3,
+                                              backend=BACKEND_SUBPROCESS, retain_raw=False)[0]
+        assert (result.stats.sent, result.stats.received) == (3, 2)
+        assert (result.ping_avg, result.jitter) == (20.0, 20.0)
+
+    def test_percentiles_from_replies(self, monkeypatch):
+        times = [float(t) for t in range(1, 101)]
+
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            for seq, rtt in enumerate(times):
+                on_probe(seq, rtt)
+            return {"ping_times": times, "packet_loss": 0.0, "packets_sent": 100,
+                    "packets_received": 100, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        result = ping_tester.test_all_servers(self._servers()[:1], ping_count=100,
+                                              backend=BACKEND_SUBPROCESS)[0]
+        assert result.ping_p50 == pytest.approx(50.0, rel=0.01)
+        assert result.ping_p95 == pytest.approx(95.0, rel=0.01)
+        assert result.ping_p99 == pytest.approx(99.0, rel=0.01)
+
+
+class TestCompactResult:
+    def test_raw_times_packed(self):
+        result = make_result(raw_times=[20.5, 21.25])
+        assert isinstance(result.raw_times, RawTimes)
+        assert result.raw_times.itemsize == 8
+        assert result.raw_times == [20.5, 21.25]
+        assert result.raw_times == (20.5, 21.25)
+        assert result.raw_times != [20.5]
+        assert make_result().raw_times == []
+
+    def test_raw_times_behave_like_a_list(self):
+        times = make_result(raw_times=[3.0, 1.0, 2.0]).raw_times
+        assert (len(times), sum(times), sorted(times), times[-1]) == (3, 6.0, [1.0, 2.0, 3.0], 2.0)
+        assert repr(times) == "[3.0, 1.0, 2.0]"
+        assert times.tolist() == [3.0, 1.0, 2.0]
+
+    def test_slotted(self):
+        result = make_result()
+        assert not hasattr(result, "__dict__")
+        with pytest.raises(AttributeError):
+            result.unknown = 1
+
+    def test_copy_and_pickle(self):
+        result = make_result(raw_times=[1.5, 2.5])
+        for clone in (copy.deepcopy(result), pickle.loads(pickle.dumps(result))):
+            assert clone == result
+            assert isinstance(clone.raw_times, RawTimes)
+
+
+# ---------------------------------------------------------------------------
+# Streaming ping output
+# ---------------------------------------------------------------------------
+
+class TestParsePingLine:
+    def test_linux_reply(self):
+        line = "64 bytes from 1.2.3.4: icmp_seq=3 ttl=57 time=25.3 ms"
+        assert parse_ping_line(line, "linux") == (2, 25.3)
+
+    def test_linux_no_answer(self):
+        assert parse_ping_line("no answer yet for icmp_seq=4", "linux") == (3, None)
+
+    def test_mac_reply_zero_based(self):
+        line = "64 bytes from 1.2.3.4: icmp_seq=0 ttl=57 time=11.024 ms"
+        assert parse_ping_line(line, "darwin") == (0, 11.024)
+
+    def test_mac_timeout(self):
+        assert parse_ping_line("Request timeout for icmp_seq 5", "darwin") == (5, None)
+
+    def test_windows_reply(self):
+        line = "Reply from 1.2.3.4: bytes=32 time=25ms TTL=57"
+        assert parse_ping_line(line, "windows") == (None, 25.0)
+
+    def test_windows_sub_millisecond(self):
+        line = "Reply from 1.2.3.4: bytes=32 time<1ms TTL=128"
+        assert parse_ping_line(line, "windows") == (None, 1.0)
+
+    def test_windows_timeout(self):
+        assert parse_ping_line("Request timed out.", "windows") == (None, None)
+
+    def test_windows_unreachable(self):
+        line = "Reply from 10.0.0.1: Destination host unreachable."
+        assert parse_ping_line(line, "windows") == (None, None)
+
+    def test_summary_lines_ignored(self):
+        assert parse_ping_line("--- 1.2.3.4 ping statistics ---", "linux") is None
+        assert parse_ping_line("PING 1.2.3.4 (1.2.3.4) 56(84) bytes of data.", "linux") is None
+        assert parse_ping_line("Pinging 1.2.3.4 with 32 bytes of data:", "windows") is None
+
+
+class TestReadPingStream:
+    def _run(self, lines, count, system="linux", eof=True, interval=1.0):
+        events = []
+
+        async def run():
+            stream = asyncio.StreamReader()
+            for line in lines:
+                stream.feed_data(line.encode() + b"\n")
+            if eof:
+                stream.feed_eof()
+            await ping_tester._read_ping_stream(stream, count, 1, system,
+                                                lambda seq, rtt: events.append((seq, rtt)),
+                                                interval)
+
+        asyncio.run(run())
+        return events
+
+    def test_event_per_reply(self):
+        events = self._run([
+            "64 bytes from 1.2.3.4: icmp_seq=1 ttl=57 time=20.0 ms",
+            "64 bytes from 1.2.3.4: icmp_seq=2 ttl=57 time=21.5 ms",
+        ], count=2)
+        assert events == [(0, 20.0), (1, 21.5)]
+
+    def test_unreported_probes_lost_at_exit(self):
+        events = self._run(["64 bytes from 1.2.3.4: icmp_seq=2 ttl=57 time=20.0 ms"], count=3)
+        assert events == [(1, 20.0), (0, None), (2, None)]
+
+    def test_silent_probe_lost_before_exit(self, monkeypatch):
+        # No output and no EOF: the probe is written off once its deadline passes
+        monkeypatch.setattr(ping_tester, "STREAM_GRACE", -0.99)
+        events = self._run([], count=2, eof=False, interval=0.0)
+        assert events == [(0, None), (1, None)]
+
+    def test_windows_counts_lines(self):
+        events = self._run([
+            "Reply from 1.2.3.4: bytes=32 time=25ms TTL=57",
+            "Request timed out.",
+            "Reply from 1.2.3.4: bytes=32 time=27ms TTL=57",
+        ], count=3, system="windows")
+        assert events == [(0, 25.0), (1, None), (2, 27.0)]
+
+
+class TestProbeEvents:
+    def test_native_backend_emits_every_probe(self, monkeypatch):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        events = []
+        servers = [{"id": "a", "location": "A", "ip": "10.0.0.1"},
+                   {"id": "c", "location": "C", "ip": "10.0.0.9"}]
+        ping_tester.test_all_servers(servers, ping_count=2, backend=icmp_probe.SOCKET_DGRAM,
+                                     on_probe=events.append)
+        assert [(e.server_id, e.seq, e.rtt) for e in events] == [
+            ("a", 0, 20.0), ("a", 1, 20.0), ("c", 0, None), ("c", 1, None),
+        ]
+
+    def test_probes_streamed_to_probe_log(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(icmp_probe, "MultiProber", FakeProber)
+        servers = [{"id": "a", "location": "A", "ip": "10.0.0.1", "game": "g1"},
+                   {"id": "a", "location": "A", "ip": "10.0.0.1", "game": "g2"},
+                   {"id": "c", "location": "C", "ip": "10.0.0.9"}]
+        with ProbeLog(tmp_path) as log:
+            ping_tester.test_all_servers(servers, ping_count=2, backend=icmp_probe.SOCKET_DGRAM,
+                                         max_losses=None, probe_log=log)
+        with ProbeLogReader(tmp_path) as reader:
+            targets = reader.targets()
+            logged = [(targets[r.target], r.seq, r.rtt_us, r.lost) for r in reader.records()]
+        # The shared address is logged once
+        assert logged == [("10.0.0.1", 0, 20000, False), ("10.0.0.1", 1, 20000, False),
+                          ("10.0.0.9", 0, 0, True), ("10.0.0.9", 1, 0, True)]
+
+    def test_subprocess_probes_streamed_to_probe_log(self, monkeypatch, tmp_path):
+        async def fake_ping(ip, count, timeout, on_probe=None, **kwargs):
+            for seq in range(count):
+                on_probe(seq, 15.5)
+            return {"ping_times": [15.5] * count, "packet_loss": 0.0, "packets_sent": count,
+                    "packets_received": count, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(ping_tester, "ping_server_async", fake_ping)
+        with ProbeLog(tmp_path) as log:
+            ping_tester.test_all_servers([{"id": "a", "location": "A", "ip": "10.0.0.1"}],
+                                         ping_count=3, backend=BACKEND_SUBPROCESS, probe_log=log)
+        with ProbeLogReader(tmp_path) as reader:
+            assert [(r.seq, r.rtt_us) for r in reader.records()] == [(0, 15500), (1, 15500),
+                                                                     (2, 15500)]
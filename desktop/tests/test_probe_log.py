@@ -0,0 +1,110 @@
+"""
+Unit tests for probe_log.py — the memory-mapped probe log.
+"""
+
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from probe_log import (ProbeLog, ProbeLogReader, ProbeRecord, FLAG_LOST, HEADER_SIZE, RECORD,
+                       RECORD_SIZE, TARGETS_FILE)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000_000
+
+    def __call__(self):
+        self.now += 1000
+        return self.now
+
+
+def make_log(tmp_path, records_per_segment=100, **kwargs):
+    return ProbeLog(tmp_path, segment_bytes=HEADER_SIZE + records_per_segment * RECORD_SIZE,
+                    clock=FakeClock(), **kwargs)
+
+
+class TestProbeLog:
+    def test_append_and_read_back(self, tmp_path):
+        with make_log(tmp_path) as log, ProbeLogReader(tmp_path) as reader:
+            target = log.target("10.0.0.1")
+            log.append(target, 0, 12.3456)
+            log.append(target, 1, None)
+            records = list(reader.records())
+        assert records[0] == ProbeRecord(1_000_002_000, 0, 0, 12346, 0)
+        assert not records[0].lost
+        assert records[1].lost and records[1].rtt_us == 0 and records[1].flags == FLAG_LOST
+
+    def test_targets_stable_across_writers(self, tmp_path):
+        with make_log(tmp_path) as first:
+            assert [first.target(ip) for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.1")] == [0, 1, 0]
+        with make_log(tmp_path) as second:
+            assert second.target("10.0.0.2") == 1
+            assert second.target("10.0.0.3") == 2
+        assert ProbeLogReader(tmp_path).targets() == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+    def test_same_address_added_by_two_writers(self, tmp_path):
+        first, second = make_log(tmp_path), make_log(tmp_path)
+        assert first.target("10.0.0.1") == 0
+        (tmp_path / TARGETS_FILE).write_text("10.0.0.1\n10.0.0.2\n10.0.0.2\n")
+        assert second.target("10.0.0.2") == 1
+        assert first.target("10.0.0.2") == 1
+
+    def test_rotates_and_keeps_newest_segments(self, tmp_path):
+        with make_log(tmp_path, records_per_segment=10, max_segments=3) as log:
+            for seq in range(45):
+                log.append(0, seq, 1.0)
+            reader = ProbeLogReader(tmp_path)
+            segments = reader.segments()
+            assert [reader.count(s) for s in segments] == [10, 10, 5]
+            assert [r.seq for r in reader.records()] == list(range(20, 45))
+            reader.close()
+
+    def test_closed_segments_shrink_to_their_records(self, tmp_path):
+        reader = ProbeLogReader(tmp_path)
+        with make_log(tmp_path, records_per_segment=10) as log:
+            for seq in range(13):
+                log.append(0, seq, 1.0)
+            assert log.segment.stat().st_size == HEADER_SIZE + 10 * RECORD_SIZE
+            assert reader.count(log.segment) == 3  # mapped before the writer closes
+        sizes = [s.stat().st_size for s in reader.segments()]
+        assert sizes == [HEADER_SIZE + 10 * RECORD_SIZE, HEADER_SIZE + 3 * RECORD_SIZE]
+        assert [r.seq for r in reader.records()] == list(range(13))
+        reader.close()
+
+    def test_reader_sees_records_as_they_are_written(self, tmp_path):
+        with make_log(tmp_path) as log, ProbeLogReader(tmp_path) as reader:
+            log.append(0, 0, 1.0)
+            segment = reader.segments()[0]
+            assert reader.count(segment) == 1
+            log.append(0, 1, 2.0)
+            assert reader.count(segment) == 2
+            with reader.view(segment) as view:
+                assert len(view) == 2 * RECORD_SIZE
+                assert RECORD.unpack_from(view, RECORD_SIZE)[3] == 2000
+
+    def test_foreign_files_ignored(self, tmp_path):
+        (tmp_path / "0-1.plog").write_bytes(b"not a probe log" * 10)
+        (tmp_path / "0-2.plog").write_bytes(b"")
+        with ProbeLogReader(tmp_path) as reader:
+            assert list(reader.records()) == []
+
+    @pytest.mark.skipif(np is None, reason="NumPy not installed")
+    def test_array_is_a_view_of_the_mapping(self, tmp_path):
+        with make_log(tmp_path) as log, ProbeLogReader(tmp_path) as reader:
+            for seq in range(5):
+                log.append(3, seq, 10.0 + seq)
+            segment = reader.segments()[0]
+            records = reader.array(segment)
+            assert not records.flags.owndata
+            assert records["rtt_us"].tolist() == [10000, 11000, 12000, 13000, 14000]
+            assert set(records["target"].tolist()) == {3}
+            del records
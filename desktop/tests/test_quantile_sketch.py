@@ -0,0 +1,72 @@
+"""
+Unit tests for quantile_sketch.py — DDSketch accuracy, merging and memory cap.
+"""
+
+import sys
+import os
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from quantile_sketch import DDSketch, RELATIVE_ACCURACY
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class TestDDSketch:
+    def test_empty(self):
+        assert DDSketch().quantile(0.5) is None
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(3)
+        values = [rng.lognormvariate(3.5, 0.6) for _ in range(5000)]
+        sketch = DDSketch()
+        for v in values:
+            sketch.add(v)
+        for q in (0.0, 0.5, 0.9, 0.95, 0.99, 1.0):
+            exact = exact_quantile(values, q)
+            assert abs(sketch.quantile(q) - exact) <= RELATIVE_ACCURACY * exact + 1e-9
+
+    def test_merge_equals_single_sketch(self):
+        rng = random.Random(5)
+        values = [rng.uniform(1, 300) for _ in range(1000)]
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for i, v in enumerate(values):
+            whole.add(v)
+            (left if i % 3 else right).add(v)
+        assert left.merge(right) == whole
+        assert left.count == 1000
+
+    def test_merge_rejects_different_accuracy(self):
+        with pytest.raises(ValueError):
+            DDSketch(0.01).merge(DDSketch(0.02))
+
+    def test_zero_values(self):
+        sketch = DDSketch()
+        for v in (0.0, 0.0, 0.0, 10.0):
+            sketch.add(v)
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(1.0) == pytest.approx(10.0, rel=RELATIVE_ACCURACY)
+
+    def test_memory_capped(self):
+        sketch = DDSketch(max_bins=32)
+        for i in range(1, 10000):
+            sketch.add(i * 0.37)
+        assert len(sketch.to_dict()["bins"]) == 32
+        assert sketch.count == 9999
+        # Only the low end loses accuracy
+        assert sketch.quantile(0.99) == pytest.approx(exact_quantile(
+            [i * 0.37 for i in range(1, 10000)], 0.99), rel=RELATIVE_ACCURACY)
+
+    def test_dict_round_trip(self):
+        sketch = DDSketch()
+        for v in (3.0, 0.0, 45.5, 45.6, 120.0):
+            sketch.add(v)
+        restored = DDSketch.from_dict(sketch.to_dict())
+        assert restored == sketch
+        assert restored.count == 5
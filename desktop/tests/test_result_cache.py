@@ -0,0 +1,150 @@
+"""
+Unit tests for result_cache.py — reusing recent measurements.
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from result_cache import ResultCache, RETAIN_AGE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmp_path, clock=None, **kwargs):
+    return ResultCache(tmp_path / "cache.db", clock=clock or FakeClock(), **kwargs)
+
+
+class TestResultCache:
+    def test_miss_then_hit(self, tmp_path):
+        clock = FakeClock()
+        cache = make_cache(tmp_path, clock, max_age=60)
+        assert cache.get("10.0.0.1|10|1") is None
+        cache.put("10.0.0.1|10|1", {"times": [20.0]})
+        clock.now += 15
+        entry, age = cache.get("10.0.0.1|10|1")
+        assert entry["times"] == [20.0]
+        assert age == 15
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_stale_entry_is_a_miss(self, tmp_path):
+        clock = FakeClock()
+        cache = make_cache(tmp_path, clock, max_age=60)
+        cache.put("k", {"times": []})
+        clock.now += 61
+        assert cache.get("k") is None
+        assert cache.misses == 1
+
+    def test_max_age_zero_stores_but_never_serves(self, tmp_path):
+        cache = make_cache(tmp_path, max_age=0)
+        cache.put("k", {"times": []})
+        assert cache.get("k") is None
+        assert len(cache) == 1
+        assert (cache.hits, cache.misses) == (0, 0)
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        cache = make_cache(tmp_path, max_entries=2)
+        cache.put("a", {})
+        cache.put("b", {})
+        cache.get("a")
+        cache.put("c", {})
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+
+    def test_persists_between_instances(self, tmp_path):
+        clock = FakeClock()
+        cache = make_cache(tmp_path, clock)
+        cache.put("k", {"times": [1.5]})
+        cache.save()
+
+        clock.now += 30
+        loaded = make_cache(tmp_path, clock, max_age=60)
+        entry, age = loaded.get("k")
+        assert entry["times"] == [1.5]
+        assert age == 30
+
+    def test_save_drops_expired_entries(self, tmp_path):
+        clock = FakeClock()
+        cache = make_cache(tmp_path, clock)
+        cache.put("old", {})
+        clock.now += RETAIN_AGE + 1
+        cache.put("new", {})
+        cache.save()
+        assert len(cache) == 1
+        assert cache.get("new") is not None
+
+    def test_corrupt_file_ignored(self, tmp_path):
+        (tmp_path / "cache.db").write_text("{not json")
+        cache = make_cache(tmp_path)
+        assert len(cache) == 0
+        cache.put("k", {})
+        assert len(cache) == 1
+
+
+class TestClaims:
+    def test_second_run_waits_for_the_first(self, tmp_path):
+        clock = FakeClock()
+        first = make_cache(tmp_path, clock)
+        second = make_cache(tmp_path, clock)
+        assert first.claim(["a", "b"]) == ["a", "b"]
+        assert second.claim(["b", "c"]) == ["c"]
+        assert second.settled("b") is None
+
+        clock.now += 2
+        first.put("b", {"times": [20.0]})
+        entry, age = second.settled("b")
+        assert entry["times"] == [20.0]
+        assert age == 0
+
+    def test_result_from_before_the_wait_not_settled(self, tmp_path):
+        clock = FakeClock()
+        first = make_cache(tmp_path, clock)
+        second = make_cache(tmp_path, clock)
+        first.put("a", {})
+        first.claim(["a"])
+        clock.now += 1
+        second.claim(["a"])
+        assert second.settled("a") is None
+
+    def test_released_claim_can_be_taken(self, tmp_path):
+        first = make_cache(tmp_path)
+        second = make_cache(tmp_path)
+        first.claim(["a"])
+        first.save()
+        assert second.claim(["a"]) == ["a"]
+
+    def test_claim_released_without_result(self, tmp_path):
+        first = make_cache(tmp_path)
+        second = make_cache(tmp_path)
+        first.claim(["a", "b"])
+        first.release(["a"])
+        assert second.claim(["a", "b"]) == ["a"]
+        assert second.settled("a") is None
+
+    def test_stale_claim_taken_over(self, tmp_path):
+        clock = FakeClock()
+        dead = make_cache(tmp_path, clock, claim_timeout=15)
+        alive = make_cache(tmp_path, clock)
+        dead.claim(["a"])
+        clock.now += 10
+        assert alive.claim(["a"]) == []
+        clock.now += 6
+        assert alive.claim(["a"]) == ["a"]
+
+    def test_renew_keeps_claims(self, tmp_path):
+        clock = FakeClock()
+        owner = make_cache(tmp_path, clock, claim_timeout=15)
+        other = make_cache(tmp_path, clock)
+        owner.claim(["a"])
+        clock.now += 10
+        owner.renew()
+        clock.now += 10
+        assert other.claim(["a"]) == []
@@ -0,0 +1,103 @@
+"""
+Unit tests for running_stats.py — streaming accumulators and merging.
+"""
+
+import sys
+import os
+import math
+import random
+import statistics
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from running_stats import RunningStats
+
+
+def feed(probes):
+    stats = RunningStats()
+    for rtt in probes:
+        stats.add(rtt)
+    return stats
+
+
+def random_probes(rng, n, loss=0.2):
+    return [None if rng.random() < loss else round(rng.uniform(5, 120), 2) for _ in range(n)]
+
+
+def assert_same(a, b):
+    for name in RunningStats.__slots__:
+        x, y = getattr(a, name), getattr(b, name)
+        if isinstance(x, float) and math.isfinite(x):
+            assert x == pytest.approx(y, abs=1e-9), name
+        else:
+            assert x == y, name
+
+
+class TestRunningStats:
+    def test_empty(self):
+        stats = RunningStats()
+        assert (stats.sent, stats.received, stats.packet_loss) == (0, 0, 100.0)
+        assert (stats.ping_min, stats.ping_max, stats.jitter, stats.variance) == (0.0, 0.0, 0.0, 0.0)
+
+    def test_matches_batch_statistics(self):
+        replies = [20.0, 25.5, 19.0, 40.25, 22.0]
+        stats = feed(replies)
+        assert stats.mean == pytest.approx(statistics.mean(replies))
+        assert stats.variance == pytest.approx(statistics.variance(replies))
+        assert (stats.ping_min, stats.ping_max) == (19.0, 40.25)
+        diffs = [abs(b - a) for a, b in zip(replies, replies[1:])]
+        assert stats.jitter == pytest.approx(statistics.mean(diffs))
+
+    def test_rfc3550_jitter(self):
+        stats = feed([10.0, 26.0, 10.0])
+        # J1 = 16/16 = 1, J2 = 1 + (16 - 1)/16
+        assert stats.rfc_jitter == pytest.approx(1 + 15 / 16)
+
+    def test_loss_runs(self):
+        stats = feed([None, None, 10.0, None, 11.0, None, None, None, 12.0, None])
+        assert (stats.sent, stats.received, stats.lost) == (10, 3, 7)
+        assert stats.packet_loss == 70.0
+        assert (stats.max_loss_run, stats.loss_bursts, stats.loss_run) == (3, 4, 1)
+
+    def test_from_times_appends_losses(self):
+        stats = RunningStats.from_times([10.0, 12.0], sent=5)
+        assert (stats.sent, stats.received, stats.loss_run) == (5, 2, 3)
+
+    def test_merge_equals_sequential(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            probes = random_probes(rng, rng.randint(0, 30), loss=rng.choice([0.0, 0.3, 0.9]))
+            cut = rng.randint(0, len(probes))
+            merged = feed(probes[:cut]).merge(feed(probes[cut:]))
+            assert_same(merged, feed(probes))
+
+    def test_merge_many_shards(self):
+        rng = random.Random(11)
+        probes = random_probes(rng, 500)
+        total = RunningStats()
+        for start in range(0, len(probes), 37):
+            total.merge(feed(probes[start:start + 37]))
+        assert_same(total, feed(probes))
+
+    def test_merge_does_not_alias(self):
+        other = feed([10.0, 20.0])
+        merged = RunningStats().merge(other)
+        merged.add(30.0)
+        assert other.received == 2
+
+    def test_quantiles_clamped_to_replies(self):
+        stats = feed([10.0, 20.0, None, 30.0])
+        assert stats.quantile(0.0) == 10.0
+        assert stats.quantile(1.0) == 30.0
+        assert stats.quantile(0.5) == pytest.approx(20.0, rel=0.01)
+        assert RunningStats().quantile(0.95) == 0.0
+
+    def test_dict_round_trip(self):
+        stats = feed([None, 10.0, 14.0, None])
+        assert_same(RunningStats.from_dict(stats.to_dict()), stats)
+        empty = RunningStats.from_dict(RunningStats().to_dict())
+        assert empty.ping_min == 0.0
+        empty.add(5.0)
+        assert empty.ping_min == 5.0
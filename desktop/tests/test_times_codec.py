@@ -0,0 +1,60 @@
+"""
+Unit tests for times_codec.py — the compact raw_times wire encoding.
+"""
+
+import base64
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from times_codec import decode_times, encode_times, pack_result
+
+
+class TestTimesCodec:
+    def test_round_trip(self):
+        times = [35.0, 40.0, 42.5, 38.25]
+        assert decode_times(encode_times(times)) == times
+
+    def test_matches_web_decoder_vectors(self):
+        # Shared with web/src/__tests__/raw-times.test.ts
+        assert encode_times([0.001, 9999.999]) == "A/3ZxAk="
+        assert encode_times([]) == ""
+        # Lost-probe tokens are never written, but are part of the format
+        assert decode_times("8aIEkU4AiSe0Qg==") == [35.0, 40.0, None, 42.5, 38.25]
+        assert decode_times("AA==") == [None]
+
+    def test_rounds_to_microseconds(self):
+        assert decode_times(encode_times([12.3456, 0.0004])) == [12.346, 0.0]
+
+    def test_rounds_negative_times_to_nearest(self):
+        # A clock step back can report a reply a hair before its send time
+        assert decode_times(encode_times([-0.0007, -0.0004, 1.0])) == [-0.001, 0.0, 1.0]
+
+    def test_random_round_trip(self):
+        rng = random.Random(7)
+        times = [round(rng.uniform(0, 10000), 3) for _ in range(1000)]
+        assert decode_times(encode_times(times)) == times
+
+    def test_steady_pings_take_two_bytes(self):
+        times = [30.0 + (i % 5) for i in range(100)]
+        encoded = base64.b64decode(encode_times(times))
+        assert len(encoded) <= 2 * len(times) + 2
+
+    def test_rejects_truncated_input(self):
+        with pytest.raises(ValueError):
+            decode_times(base64.b64encode(b"\x80").decode())
+
+    def test_rejects_invalid_base64(self):
+        with pytest.raises(ValueError):
+            decode_times("!!!!")
+
+    def test_pack_result(self):
+        result = {"server_id": "eu-1", "ping_avg": 36.0, "raw_times": [35.0, 37.0]}
+        packed = pack_result(result)
+        assert "raw_times" not in packed and packed["ping_avg"] == 36.0
+        assert decode_times(packed["raw_times_packed"]) == [35.0, 37.0]
+        assert "raw_times" in result  # input left alone
@@ -0,0 +1,354 @@
+"""
+Unit tests for upload_queue.py — the durable result upload queue and uploader.
+"""
+
+import gzip
+import json
+import sys
+import os
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from times_codec import decode_times
+from upload_queue import (UploadQueue, Uploader, backoff, BACKOFF_BASE, BACKOFF_MAX,
+                          MAX_BATCH_RUNS, UPLOAD_BURST)
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeServer:
+    """Answers each request with the next queued response (default 201)"""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def __call__(self, body, headers):
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.requests.append((json.loads(body), headers))
+        response = self.responses.pop(0) if self.responses else None
+        if isinstance(response, Exception):
+            raise response
+        if response is not None:
+            return response
+        data = json.loads(body)
+        runs = data.get("runs", [data])
+        saved = [{"id": f"id-{run['n']}", "url": f"/dashboard?result=id-{run['n']}", "count": 1}
+                 for run in runs]
+        return 201, ({"success": True, "runs": saved} if "runs" in data else saved[0]), None
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    q = UploadQueue(tmp_path / "upload_queue.db", clock=clock)
+    yield q
+    q.close()
+
+
+def make_uploader(queue, clock, server, **kwargs):
+    return Uploader(queue, server, clock=clock, **kwargs)
+
+
+def step(uploader, clock):
+    """One request, however long the token bucket would have it wait."""
+    while (wait := uploader.step()):
+        clock.now += wait
+
+
+# ---------------------------------------------------------------------------
+# UploadQueue
+# ---------------------------------------------------------------------------
+
+class TestUploadQueue:
+    def test_runs_survive_reopening(self, tmp_path, clock):
+        path = tmp_path / "upload_queue.db"
+        first = UploadQueue(path, clock=clock)
+        first.put({"n": 1})
+        first.put({"n": 2})
+        first.close()
+        second = UploadQueue(path, clock=clock)
+        assert [payload for _, _, payload in second.due()] == [{"n": 1}, {"n": 2}]
+        second.close()
+
+    def test_due_is_oldest_first_and_limited(self, queue):
+        for n in range(5):
+            queue.put({"n": n})
+        assert [payload["n"] for _, _, payload in queue.due(limit=3)] == [0, 1, 2]
+
+    def test_done_removes_runs(self, queue):
+        queue.put({"n": 1})
+        queue.put({"n": 2})
+        queue.done([queue.due()[0][0]])
+        assert len(queue) == 1
+        assert queue.due()[0][2] == {"n": 2}
+
+    def test_retry_holds_runs_back(self, queue, clock):
+        queue.put({"n": 1})
+        run_id = queue.due()[0][0]
+        queue.retry([run_id], delay=30)
+        assert queue.due() == []
+        assert queue.next_due() == clock.now + 30
+        clock.now += 30
+        assert len(queue.due()) == 1
+
+    def test_retry_backs_off_exponentially(self, queue, clock):
+        queue.put({"n": 1})
+        run_id = queue.due()[0][0]
+        for attempts in range(1, 4):
+            queue.retry([run_id])
+            wait = queue.next_due() - clock.now
+            assert BACKOFF_BASE * 2 ** (attempts - 1) / 2 <= wait <= BACKOFF_BASE * 2 ** (attempts - 1)
+
+    def test_oldest_dropped_over_max_queued(self, tmp_path, clock):
+        queue = UploadQueue(tmp_path / "q.db", clock=clock, max_queued=3)
+        dropped = sum(queue.put({"n": n}) for n in range(5))
+        assert dropped == 2
+        assert [payload["n"] for _, _, payload in queue.due()] == [2, 3, 4]
+        queue.close()
+
+    def test_runs_dropped_when_too_old(self, tmp_path, clock):
+        queue = UploadQueue(tmp_path / "q.db", clock=clock, max_age=3600)
+        queue.put({"n": 1})
+        clock.now += 3601
+        assert queue.put({"n": 2}) == 1
+        assert [payload["n"] for _, _, payload in queue.due()] == [2]
+        queue.close()
+
+
+class TestBackoff:
+    def test_doubles_and_is_capped(self):
+        for attempts in (1, 2, 5, 30):
+            expected = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+            assert expected / 2 <= backoff(attempts) <= expected
+
+
+# ---------------------------------------------------------------------------
+# Uploader
+# ---------------------------------------------------------------------------
+
+class TestUploader:
+    def test_batches_runs_in_one_gzip_request(self, queue, clock):
+        server = FakeServer()
+        uploaded = []
+        uploader = make_uploader(queue, clock, server, on_uploaded=uploaded.append)
+        for n in range(3):
+            uploader.submit({"n": n})
+        assert uploader.stats.queued == 3
+
+        assert uploader.step() == 0.0
+        body, headers = server.requests[0]
+        assert headers["Content-Encoding"] == "gzip"
+        assert [run["n"] for run in body["runs"]] == [0, 1, 2]
+        assert [run["id"] for run in uploaded] == ["id-0", "id-1", "id-2"]
+        assert len(queue) == 0
+        assert uploader.stats.uploaded == 3 and uploader.stats.queued == 0
+        assert uploader.stats.requests == 1 and uploader.stats.last_latency is not None
+        assert uploader.step() is None  # nothing left; wait for submit()
+
+    def test_batch_size_is_capped(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server)
+        for n in range(MAX_BATCH_RUNS + 2):
+            uploader.submit({"n": n})
+        uploader.step()
+        uploader.step()
+        assert [len(body["runs"]) for body, _ in server.requests] == [MAX_BATCH_RUNS, 2]
+
+    def test_paced_by_token_bucket(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server)
+        for n in range(UPLOAD_BURST):
+            uploader.submit({"n": n})
+            assert uploader.step() == 0.0
+        uploader.submit({"n": 99})
+        wait = uploader.step()
+        assert wait > 0
+        assert len(server.requests) == UPLOAD_BURST
+        clock.now += wait
+        assert uploader.step() == 0.0
+        assert len(server.requests) == UPLOAD_BURST + 1
+
+    def test_server_error_is_retried_with_backoff(self, queue, clock):
+        server = FakeServer()
+        server.responses = [(503, {}, None)]
+        uploader = make_uploader(queue, clock, server)
+        uploader.submit({"n": 1})
+        uploader.step()
+        assert len(queue) == 1
+        assert uploader.stats.failures == 1 and uploader.stats.last_error == "Server returned 503"
+        wait = uploader.step()
+        assert 0 < wait <= BACKOFF_BASE
+        clock.now += wait
+        uploader.step()
+        assert len(queue) == 0 and uploader.stats.uploaded == 1
+
+    def test_network_error_is_retried(self, queue, clock):
+        server = FakeServer()
+        server.responses = [ConnectionError("unreachable")]
+        uploader = make_uploader(queue, clock, server)
+        uploader.submit({"n": 1})
+        uploader.step()
+        assert len(queue) == 1
+        assert "unreachable" in uploader.stats.last_error
+
+    def test_429_pauses_all_uploads_for_retry_after(self, queue, clock):
+        server = FakeServer()
+        server.responses = [(429, {}, 60.0)]
+        uploader = make_uploader(queue, clock, server)
+        uploader.submit({"n": 1})
+        uploader.step()
+        uploader.submit({"n": 2})  # due at once, but the pause holds it too
+        assert uploader.step() == 60.0
+        assert len(server.requests) == 1
+        clock.now += 60
+        uploader.step()
+        assert [run["n"] for run in server.requests[1][0]["runs"]] == [1, 2]
+
+    def test_falls_back_to_single_runs_for_legacy_server(self, queue, clock):
+        server = FakeServer()
+        server.responses = [(415, {"error": "Unsupported Content-Encoding: gzip"}, None)]
+        uploaded = []
+        uploader = make_uploader(queue, clock, server, on_uploaded=uploaded.append)
+        uploader.submit({"n": 1})
+        uploader.submit({"n": 2})
+        uploader.step()
+        assert uploader.legacy and len(queue) == 2 and uploader.stats.failures == 0
+
+        uploader.step()
+        body, headers = server.requests[1]
+        assert body == {"n": 1}
+        assert "Content-Encoding" not in headers
+        assert uploaded == [{"id": "id-1", "url": "/dashboard?result=id-1", "count": 1}]
+        assert len(queue) == 1
+
+    def test_server_that_rejects_every_batch_found_out(self, queue, clock):
+        class OldServer(FakeServer):
+            def __call__(self, body, headers):
+                if headers.get("Content-Encoding") == "gzip":
+                    self.requests.append((None, headers))
+                    return 400, {"error": "Invalid request"}, None
+                return super().__call__(body, headers)
+
+        server = OldServer()
+        uploader = make_uploader(queue, clock, server)
+        for n in range(3):
+            uploader.submit({"n": n})
+        step(uploader, clock)  # batch of 3: split
+        step(uploader, clock)  # batch of 1: rejected too, so try it as plain JSON
+        assert not uploader.legacy and len(queue) == 3
+        step(uploader, clock)
+        assert uploader.legacy and len(queue) == 2 and uploader.stats.dropped == 0
+        step(uploader, clock)
+        step(uploader, clock)
+        assert len(queue) == 0 and uploader.stats.uploaded == 3
+
+    def test_bad_run_in_batch_dropped_alone(self, queue, clock):
+        class StrictServer(FakeServer):
+            def __call__(self, body, headers):
+                data = json.loads(gzip.decompress(body) if headers.get("Content-Encoding") else body)
+                if any(run.get("bad") for run in data.get("runs", [data])):
+                    self.requests.append((data, headers))
+                    return 400, {"error": "Invalid request data"}, None
+                return super().__call__(body, headers)
+
+        server = StrictServer()
+        uploader = make_uploader(queue, clock, server)
+        for n in range(4):
+            uploader.submit({"n": n, "bad": n == 1})
+        while len(queue):
+            step(uploader, clock)
+        assert len(queue) == 0 and not uploader.legacy
+        assert uploader.stats.dropped == 1 and uploader.stats.uploaded == 3
+        # Back to full batches once the bad run is gone
+        assert len(server.requests[-1][0]["runs"]) == 2
+
+    def test_rejected_runs_are_dropped(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server)
+        uploader.legacy = True
+        server.responses = [(400, {}, None)]
+        uploader.submit({"n": 1})
+        uploader.step()
+        assert len(queue) == 0
+        assert uploader.stats.dropped == 1 and uploader.stats.uploaded == 0
+
+    def test_nothing_sent_while_disabled(self, queue, clock):
+        server = FakeServer()
+        enabled = [False]
+        uploader = make_uploader(queue, clock, server, enabled=lambda: enabled[0])
+        uploader.submit({"n": 1})
+        assert uploader.step() is None
+        assert server.requests == [] and len(queue) == 1
+        enabled[0] = True
+        uploader.step()
+        assert len(queue) == 0
+
+    def test_background_thread_delivers(self, queue):
+        server = FakeServer()
+        uploaded = []
+        uploader = Uploader(queue, server, on_uploaded=uploaded.append)
+        uploader.start()
+        try:
+            uploader.submit({"n": 1})
+            for _ in range(200):
+                if uploaded:
+                    break
+                time.sleep(0.01)
+        finally:
+            uploader.stop()
+        assert [run["id"] for run in uploaded] == ["id-1"]
+
+    def test_packs_raw_times_once_server_accepts_them(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server, compact=lambda: True)
+        run = {"n": 1, "results": [{"server_id": "a", "raw_times": [35.0, 40.5]}]}
+        uploader.submit(run)
+        server.responses = [(201, {"runs": [], "raw_times_encodings": ["dv1"]}, None)]
+        uploader.step()
+        assert server.requests[0][0]["runs"][0] == run  # not negotiated yet
+        assert uploader.times_encoding == "dv1"
+
+        uploader.submit({**run, "n": 2})
+        uploader.step()
+        sent = server.requests[1][0]["runs"][0]["results"][0]
+        assert "raw_times" not in sent
+        assert decode_times(sent["raw_times_packed"]) == [35.0, 40.5]
+        assert queue.due() == []
+
+    def test_packing_dropped_when_rejected(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server, compact=lambda: True)
+        uploader.times_encoding = "dv1"
+        run = {"n": 1, "results": [{"server_id": "a", "raw_times": [35.0]}]}
+        uploader.submit(run)
+        server.responses = [(400, {}, None),
+                            (201, {"runs": [], "raw_times_encodings": ["dv1"]}, None)]
+        uploader.step()
+        assert uploader.times_encoding is None and not uploader.legacy and len(queue) == 1
+        uploader.step()
+        assert server.requests[1][0]["runs"][0] == run
+        assert uploader.times_encoding is None  # not taken up again this session
+
+    def test_not_packed_unless_enabled(self, queue, clock):
+        server = FakeServer()
+        uploader = make_uploader(queue, clock, server)
+        uploader.times_encoding = "dv1"
+        run = {"n": 1, "results": [{"server_id": "a", "raw_times": [35.0]}]}
+        uploader.submit(run)
+        uploader.step()
+        assert server.requests[0][0]["runs"][0] == run
@@ -0,0 +1,196 @@
+"""
+Unit tests for watch_session.py — continuous probing and rolling windows.
+No network calls; probes are faked.
+"""
+
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import icmp_probe
+import watch_session
+from ping_tester import BACKEND_SUBPROCESS, INVALID_IP_ERROR
+from probe_log import ProbeLog, ProbeLogReader
+from watch_session import ProbeHistory, WatchSession, WAITING_ERROR, window_label
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def servers(n):
+    return [{"id": f"s{i}", "location": f"S{i}", "ip": f"10.0.0.{i + 1}"} for i in range(n)]
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+class TestProbeHistory:
+    def test_window_counts_replies_and_losses(self):
+        history = ProbeHistory(keep=60)
+        for t, rtt in [(0, 10.0), (10, None), (20, 12.0), (30, 14.0)]:
+            history.add(t, rtt)
+        assert history.window(30, 15) == ([12.0, 14.0], 2)
+        assert history.window(30, 25) == ([12.0, 14.0], 3)
+        assert history.window(30, 60) == ([10.0, 12.0, 14.0], 4)
+
+    def test_since(self):
+        history = ProbeHistory(keep=60)
+        for t, rtt in [(0, 10.0), (10, None), (20, 12.0)]:
+            history.add(t, rtt)
+        assert history.since(1) == ([12.0], 2)
+        assert history.since(history.total) == ([], 0)
+
+    def test_drops_samples_older_than_longest_window(self):
+        history = ProbeHistory(keep=10)
+        for t in range(30):
+            history.add(t, 5.0)
+        assert len(history) == 11
+
+
+class TestWindowLabel:
+    def test_labels(self):
+        assert [window_label(w) for w in (30, 300, 3600, 90)] == ["30s", "5m", "1h", "90s"]
+
+
+class TestWatchSession:
+    def test_snapshot_per_window(self):
+        clock = FakeClock()
+        session = WatchSession(servers(2), windows=(30, 300), clock=clock)
+        session.record(0, 20.0)
+        clock.now += 100
+        session.record(0, None)
+        session.record(0, 30.0)
+
+        short, long = session.snapshot(30), session.snapshot(300)
+        assert (short[0].total_pings, short[0].successful_pings, short[0].ping_avg) == (2, 1, 30.0)
+        assert (long[0].total_pings, long[0].successful_pings, long[0].ping_avg) == (3, 2, 25.0)
+        assert short[1].total_pings == 0 and short[1].error == WAITING_ERROR
+
+    def test_shared_address_shares_history(self):
+        shared = servers(2) + [{"id": "dup", "location": "Dup", "ip": "10.0.0.1"}]
+        session = WatchSession(shared, clock=FakeClock())
+        session.record(0, 20.0)
+        results = session.snapshot(30)
+        assert [r.successful_pings for r in results] == [1, 0, 1]
+        assert results[2].server_id == "dup"
+
+    def test_take_settled_hands_out_each_probe_once(self):
+        clock = FakeClock()
+        shared = servers(2) + [{"id": "dup", "location": "Dup", "ip": "10.0.0.1"}]
+        session = WatchSession(shared, clock=clock)
+        session.record(0, 20.0)
+        session.record(0, None)
+        first = session.take_settled()
+        assert [(r.server_id, r.total_pings, r.successful_pings) for r in first] == [
+            ("s0", 2, 1), ("dup", 2, 1)]
+        assert session.take_settled() == []
+
+        clock.now += 1
+        session.record(0, 30.0)
+        session.record(1, 40.0)
+        again = {r.server_id: r for r in session.take_settled()}
+        assert {k: (r.total_pings, r.ping_avg) for k, r in again.items()} == {
+            "s0": (1, 30.0), "s1": (1, 40.0), "dup": (1, 30.0)}
+
+    def test_invalid_ip_reported(self):
+        session = WatchSession([{"id": "x", "location": "X", "ip": "not-an-ip"}])
+        assert session.snapshot(30)[0].error == INVALID_IP_ERROR
+
+    def test_subprocess_keeps_one_process_per_server(self, monkeypatch):
+        calls = []
+
+        async def fake_ping(ip, count, timeout, on_probe=None, interval=1.0, **kwargs):
+            calls.append((ip, count))
+            for seq in range(count):
+                on_probe(seq, 15.0 if seq % 2 else None)
+                await asyncio.sleep(interval)
+            return {"ping_times": [], "packet_loss": 0.0, "packets_sent": count,
+                    "packets_received": 0, "error": None, "backend": BACKEND_SUBPROCESS}
+
+        monkeypatch.setattr(watch_session, "ping_server_async", fake_ping)
+        with WatchSession(servers(3), interval=0.01, backend=BACKEND_SUBPROCESS) as session:
+            wait_for(lambda: all(r.total_pings >= 4 for r in session.snapshot(30)))
+        assert not session.running
+        assert sorted(ip for ip, _ in calls) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+        assert {count for _, count in calls} == {watch_session.SESSION_ROUNDS}
+        result = session.snapshot(30)[0]
+        assert result.backend == BACKEND_SUBPROCESS
+        assert 40.0 <= result.packet_loss <= 60.0
+
+    def test_native_sweeps_back_to_back(self, monkeypatch):
+        sweeps = []
+
+        class Prober:
+            kind = icmp_probe.SOCKET_DGRAM
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            async def sweep(self, targets, count=10, interval=1.0, on_probe=None, **kwargs):
+                sweeps.append(list(targets))
+                for seq in range(2):
+                    for i in range(len(targets)):
+                        on_probe(i, seq, 10.0)
+                    await asyncio.sleep(interval)
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", Prober)
+        session = WatchSession(servers(2) + [{"id": "x", "location": "X", "ip": "bad"}],
+                               interval=0.01, backend=icmp_probe.SOCKET_DGRAM)
+        session.start()
+        try:
+            wait_for(lambda: len(sweeps) >= 3)
+        finally:
+            session.stop()
+        assert sweeps[0] == ["10.0.0.1", "10.0.0.2"]
+        results = session.snapshot(30)
+        assert [r.backend for r in results[:2]] == [icmp_probe.SOCKET_DGRAM] * 2
+        assert results[0].successful_pings >= 5
+
+    def test_native_failure_falls_back_to_system_ping(self, monkeypatch):
+        def fail():
+            raise OSError("no ICMP socket")
+
+        async def fake_ping(ip, count, timeout, on_probe=None, interval=1.0, **kwargs):
+            while True:
+                on_probe(0, 12.0)
+                await asyncio.sleep(interval)
+
+        monkeypatch.setattr(icmp_probe, "MultiProber", fail)
+        monkeypatch.setattr(watch_session, "ping_server_async", fake_ping)
+        with WatchSession(servers(1), interval=0.01, backend=icmp_probe.SOCKET_DGRAM) as session:
+            wait_for(lambda: session.snapshot(30)[0].total_pings > 0)
+        assert session.backend == BACKEND_SUBPROCESS
+
+    def test_probes_streamed_to_probe_log(self, monkeypatch, tmp_path):
+        async def fake_ping(ip, count, timeout, on_probe=None, interval=1.0, **kwargs):
+            for seq in range(count):
+                on_probe(seq, 15.0 if ip.endswith(".1") else None)
+                await asyncio.sleep(interval)
+
+        monkeypatch.setattr(watch_session, "ping_server_async", fake_ping)
+        with ProbeLog(tmp_path) as log, ProbeLogReader(tmp_path) as reader:
+            with WatchSession(servers(2), interval=0.01, backend=BACKEND_SUBPROCESS,
+                              probe_log=log):
+                wait_for(lambda: log.written >= 6)
+            targets = reader.targets()
+            by_target = {}
+            for r in reader.records():
+                by_target.setdefault(targets[r.target], []).append((r.rtt_us, r.lost))
+        assert set(by_target) == {"10.0.0.1", "10.0.0.2"}
+        assert set(by_target["10.0.0.1"]) == {(15000, False)}
+        assert set(by_target["10.0.0.2"]) == {(0, True)}
@@ -104,6 +104,22 @@ describe('checkRateLimit', () => {
     expect(checkRateLimit('default-limit-test', ip)).toBe(false);
   });
 
+  it('uses up `cost` units per request', () => {
+    const { checkRateLimit } = loadModule();
+    const ip = '8.8.8.8';
+    expect(checkRateLimit('b', ip, 10, 60_000, 6)).toBe(true);
+    // 4 left: a cost of 5 is refused and uses nothing up
+    expect(checkRateLimit('b', ip, 10, 60_000, 5)).toBe(false);
+    expect(checkRateLimit('b', ip, 10, 60_000, 4)).toBe(true);
+    expect(checkRateLimit('b', ip, 10)).toBe(false);
+  });
+
+  it('refuses a cost above the limit in a fresh window', () => {
+    const { checkRateLimit } = loadModule();
+    expect(checkRateLimit('b', '9.9.9.9', 3, 60_000, 4)).toBe(false);
+    expect(checkRateLimit('b', '9.9.9.9', 3, 60_000, 3)).toBe(true);
+  });
+
   it('returns true after window resets (1ms past boundary)', () => {
     const { checkRateLimit } = loadModule();
     const limit = 1;
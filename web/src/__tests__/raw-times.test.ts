@@ -0,0 +1,41 @@
+/**
+ * Unit tests for src/lib/raw-times.ts
+ *
+ * Encoded values come from desktop/src/times_codec.py, so these also check
+ * that the two sides agree on the format.
+ */
+
+import { decodeRawTimes } from '@/lib/raw-times';
+
+describe('decodeRawTimes', () => {
+  it('decodes replies and lost probes', () => {
+    // encode_times([35.0, 40.0, 42.5, 38.25]) with a lost-probe token (0x00) after
+    // the second reply; the desktop client writes none, but the format allows them
+    expect(decodeRawTimes('8aIEkU4AiSe0Qg==')).toEqual([35, 40, null, 42.5, 38.25]);
+  });
+
+  it('decodes an empty string to no probes', () => {
+    expect(decodeRawTimes('')).toEqual([]);
+  });
+
+  it('decodes a single lost probe', () => {
+    expect(decodeRawTimes('AA==')).toEqual([null]);
+  });
+
+  it('keeps microsecond precision across large deltas', () => {
+    // encode_times([0.001, 9999.999])
+    expect(decodeRawTimes('A/3ZxAk=')).toEqual([0.001, 9999.999]);
+  });
+
+  it('rejects text that is not base64', () => {
+    expect(() => decodeRawTimes('!!!!')).toThrow('not valid base64');
+  });
+
+  it('rejects input that ends mid-varint', () => {
+    expect(() => decodeRawTimes('gA==')).toThrow('mid-varint');
+  });
+
+  it('rejects an oversized varint', () => {
+    expect(() => decodeRawTimes('//////8B')).toThrow('oversized varint');
+  });
+});
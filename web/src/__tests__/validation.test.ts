@@ -4,7 +4,7 @@
  * Tests the Zod schemas used to validate API requests before they hit the DB.
  */
 
-import { PingResultSchema, SubmitRequestSchema } from '@/lib/validation';
+import { BatchSubmitRequestSchema, PingResultSchema, SubmitRequestSchema } from '@/lib/validation';
 
 // ---------------------------------------------------------------------------
 // Helpers
@@ -23,6 +23,13 @@ function validPingResult() {
   };
 }
 
+/** A valid ping result sending raw_times_packed instead of raw_times. */
+function packedPingResult(raw_times_packed: string) {
+  const data: Record<string, unknown> = { ...validPingResult(), raw_times_packed };
+  delete data.raw_times;
+  return data;
+}
+
 function validSubmitRequest() {
   return {
     game: 'overwatch-2',
@@ -110,6 +117,36 @@ describe('PingResultSchema', () => {
     const data = { ...validPingResult(), raw_times: [10001] };
     expect(PingResultSchema.safeParse(data).success).toBe(false);
   });
+
+  it('rejects a result with neither raw_times nor raw_times_packed', () => {
+    const data: Record<string, unknown> = validPingResult();
+    delete data.raw_times;
+    expect(PingResultSchema.safeParse(data).success).toBe(false);
+  });
+
+  it('decodes raw_times_packed into raw_times and a loss count', () => {
+    const result = PingResultSchema.safeParse(packedPingResult('8aIEkU4AiSe0Qg=='));
+    expect(result.success).toBe(true);
+    if (result.success) {
+      expect(result.data.raw_times).toEqual([35, 40, 42.5, 38.25]);
+      expect(result.data.raw_times_lost).toBe(1);
+      expect(result.data).not.toHaveProperty('raw_times_packed');
+    }
+  });
+
+  it('rejects both raw_times and raw_times_packed', () => {
+    const data = { ...validPingResult(), raw_times_packed: 'AA==' };
+    expect(PingResultSchema.safeParse(data).success).toBe(false);
+  });
+
+  it('rejects malformed raw_times_packed', () => {
+    expect(PingResultSchema.safeParse(packedPingResult('gA==')).success).toBe(false);
+  });
+
+  it('rejects raw_times_packed with more than 100 probes', () => {
+    const packed = Buffer.alloc(101).toString('base64'); // 101 lost probes
+    expect(PingResultSchema.safeParse(packedPingResult(packed)).success).toBe(false);
+  });
 });
 
 // ---------------------------------------------------------------------------
@@ -198,3 +235,37 @@ describe('SubmitRequestSchema', () => {
     }
   });
 });
+
+// ---------------------------------------------------------------------------
+// BatchSubmitRequestSchema
+// ---------------------------------------------------------------------------
+
+describe('BatchSubmitRequestSchema', () => {
+  it('accepts a batch of valid runs', () => {
+    const data = { runs: [validSubmitRequest(), { ...validSubmitRequest(), tested_at: 1700000000.5 }] };
+    const result = BatchSubmitRequestSchema.safeParse(data);
+    expect(result.success).toBe(true);
+    if (result.success) {
+      expect(result.data.runs[1].tested_at).toBe(1700000000.5);
+    }
+  });
+
+  it('rejects an empty batch', () => {
+    expect(BatchSubmitRequestSchema.safeParse({ runs: [] }).success).toBe(false);
+  });
+
+  it('rejects more than 10 runs', () => {
+    const data = { runs: Array.from({ length: 11 }, validSubmitRequest) };
+    expect(BatchSubmitRequestSchema.safeParse(data).success).toBe(false);
+  });
+
+  it('rejects a batch containing an invalid run', () => {
+    const data = { runs: [validSubmitRequest(), { ...validSubmitRequest(), results: [] }] };
+    expect(BatchSubmitRequestSchema.safeParse(data).success).toBe(false);
+  });
+
+  it('rejects a negative tested_at', () => {
+    const data = { runs: [{ ...validSubmitRequest(), tested_at: -1 }] };
+    expect(BatchSubmitRequestSchema.safeParse(data).success).toBe(false);
+  });
+});
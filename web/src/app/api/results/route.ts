@@ -1,25 +1,57 @@
+import { gunzipSync } from 'zlib';
 import { NextRequest, NextResponse } from 'next/server';
 import { supabase } from '@/lib/supabase';
 import { checkRateLimit, getClientIP } from '@/lib/rate-limit';
-import { PingResultSchema, SubmitRequestSchema } from '@/lib/validation';
+import { RAW_TIMES_ENCODINGS } from '@/lib/raw-times';
+import { BatchSubmitRequestSchema, SubmitRequest, SubmitRequestSchema } from '@/lib/validation';
+
+// Largest request body accepted once decompressed (a full batch is ~1 MB)
+const MAX_BODY_BYTES = 2 * 1024 * 1024;
+// Runs a client may submit per minute, whether one per request or batched
+const RESULTS_PER_MINUTE = 30;
+
+/**
+ * Parse the JSON body, gunzipping it when sent with Content-Encoding: gzip
+ * (the desktop client compresses batched uploads).
+ */
+async function readBody(request: NextRequest): Promise<unknown> {
+  const encoding = (request.headers.get('content-encoding') || 'identity').toLowerCase();
+  if (encoding === 'identity') {
+    return request.json();
+  }
+  if (encoding !== 'gzip') {
+    throw new UnsupportedEncodingError(encoding);
+  }
+  const compressed = Buffer.from(await request.arrayBuffer());
+  return JSON.parse(gunzipSync(compressed, { maxOutputLength: MAX_BODY_BYTES }).toString('utf8'));
+}
 
+class UnsupportedEncodingError extends Error {}
+
+
+function rateLimited() {
+  return NextResponse.json(
+    { error: 'Rate limit exceeded. Please try again later.' },
+    { status: 429, headers: { 'Retry-After': '60' } }
+  );
+}
 
 export async function POST(request: NextRequest) {
   const clientIP = getClientIP(request);
 
-  // Rate limiting
-  if (!checkRateLimit("results", clientIP)) {
-    return NextResponse.json(
-      { error: 'Rate limit exceeded. Please try again later.' },
-      { status: 429 }
-    );
+  // Rate limiting: one unit for the request now, the rest of a batch's runs once it is read
+  if (!checkRateLimit("results", clientIP, RESULTS_PER_MINUTE)) {
+    return rateLimited();
   }
 
   try {
-    const rawBody = await request.json();
+    const rawBody = await readBody(request);
 
-    // Validate input
-    const parseResult = SubmitRequestSchema.safeParse(rawBody);
+    // Validate input: a single run, or a batch of runs from the desktop upload queue
+    const isBatch = typeof rawBody === 'object' && rawBody !== null && 'runs' in rawBody;
+    const parseResult = isBatch
+      ? BatchSubmitRequestSchema.safeParse(rawBody)
+      : SubmitRequestSchema.safeParse(rawBody);
     if (!parseResult.success) {
       return NextResponse.json(
         { error: 'Invalid request data', details: parseResult.error.issues },
@@ -27,59 +59,74 @@ export async function POST(request: NextRequest) {
       );
     }
 
-    const body = parseResult.data;
+    const runs: SubmitRequest[] = 'runs' in parseResult.data
+      ? parseResult.data.runs
+      : [parseResult.data];
+    if (runs.length > 1 && !checkRateLimit("results", clientIP, RESULTS_PER_MINUTE, 60_000, runs.length - 1)) {
+      return rateLimited();
+    }
 
-    // Get game by slug
-    const { data: game, error: gameError } = await supabase
+    // Get games by slug
+    const slugs = Array.from(new Set(runs.map(run => run.game)));
+    const { data: games, error: gameError } = await supabase
       .from('games')
-      .select('id')
-      .eq('slug', body.game)
-      .single();
+      .select('id, slug')
+      .in('slug', slugs);
 
-    if (gameError || !game) {
-      console.error('Game not found:', body.game);
+    const gameIds = new Map<string, string>();
+    games?.forEach(game => {
+      gameIds.set(game.slug, game.id);
+    });
+    const missing = slugs.filter(slug => !gameIds.has(slug));
+    if (gameError || missing.length) {
+      console.error('Game not found:', missing.join(', '));
       return NextResponse.json(
         { error: 'Game not found' },
         { status: 404 }
       );
     }
 
-    // Get all servers for this game to map string IDs to UUIDs
+    // Get all servers for these games to map string IDs to UUIDs
     const { data: servers } = await supabase
       .from('game_servers')
-      .select('id, location')
-      .eq('game_id', game.id);
+      .select('id, game_id, location')
+      .in('game_id', Array.from(gameIds.values()));
 
-    // Create a map of location to server UUID
+    // Create a map of game and location to server UUID
     const serverMap = new Map<string, string>();
     servers?.forEach(server => {
-      serverMap.set(server.location.toLowerCase(), server.id);
+      serverMap.set(`${server.game_id}:${server.location.toLowerCase()}`, server.id);
     });
 
-    // Insert all test results
-    const resultsToInsert = body.results.map(result => {
-      const serverUuid = serverMap.get(result.server_location.toLowerCase());
-
-      return {
-        game_id: game.id,
-        server_id: serverUuid || null,
-        ping_avg: result.ping_avg,
-        ping_min: result.ping_min,
-        ping_max: result.ping_max,
-        jitter: result.jitter,
-        packet_loss: result.packet_loss,
-        isp: body.isp,
-        country: body.country,
-        city: body.city,
-        ip_hash: body.ip_hash,
-        client_version: body.client_version,
-        raw_data: {
-          raw_times: result.raw_times,
-          anonymous_id: body.anonymous_id,
-          server_string_id: result.server_id,
-          server_location: result.server_location,
-        },
-      };
+    // Insert the test results of every run in one go
+    const resultsToInsert = runs.flatMap(body => {
+      const gameId = gameIds.get(body.game)!;
+      return body.results.map(result => {
+        const serverUuid = serverMap.get(`${gameId}:${result.server_location.toLowerCase()}`);
+
+        return {
+          game_id: gameId,
+          server_id: serverUuid || null,
+          ping_avg: result.ping_avg,
+          ping_min: result.ping_min,
+          ping_max: result.ping_max,
+          jitter: result.jitter,
+          packet_loss: result.packet_loss,
+          isp: body.isp,
+          country: body.country,
+          city: body.city,
+          ip_hash: body.ip_hash,
+          client_version: body.client_version,
+          raw_data: {
+            raw_times: result.raw_times,
+            ...(result.raw_times_lost > 0 && { raw_times_lost: result.raw_times_lost }),
+            anonymous_id: body.anonymous_id,
+            server_string_id: result.server_id,
+            server_location: result.server_location,
+            ...(body.tested_at !== undefined && { tested_at: body.tested_at }),
+          },
+        };
+      });
     });
 
     const { data: insertedResults, error: insertError } = await supabase
@@ -95,15 +142,39 @@ export async function POST(request: NextRequest) {
       );
     }
 
-    const resultId = insertedResults?.[0]?.id;
+    // Rows come back in insertion order; each run's first row identifies it
+    let offset = 0;
+    const saved = runs.map(run => {
+      const resultId = insertedResults?.[offset]?.id;
+      offset += run.results.length;
+      return {
+        id: resultId,
+        url: `/dashboard?result=${resultId}`,
+        count: run.results.length,
+      };
+    });
 
+    if (!isBatch) {
+      return NextResponse.json({
+        success: true,
+        ...saved[0],
+        count: insertedResults?.length || 0,
+        raw_times_encodings: RAW_TIMES_ENCODINGS,
+      });
+    }
     return NextResponse.json({
       success: true,
-      id: resultId,
-      url: `/dashboard?result=${resultId}`,
+      runs: saved,
       count: insertedResults?.length || 0,
+      raw_times_encodings: RAW_TIMES_ENCODINGS,
     });
   } catch (error) {
+    if (error instanceof UnsupportedEncodingError) {
+      return NextResponse.json(
+        { error: `Unsupported Content-Encoding: ${error.message}` },
+        { status: 415 }
+      );
+    }
     console.error('Request error:', error);
     return NextResponse.json(
       { error: 'Invalid request' },
@@ -19,13 +19,15 @@ const stores = new Map<string, Map<string, RateLimitRecord>>();
  * @param ip      - Client IP address
  * @param limit   - Max requests allowed per window (default 30)
  * @param windowMs - Window duration in milliseconds (default 60 000)
- * @returns true if the request is allowed, false if rate-limited
+ * @param cost    - Units this request uses up, e.g. the runs in a batch (default 1)
+ * @returns true if the request is allowed, false if rate-limited (nothing is used up then)
  */
 export function checkRateLimit(
   bucket: string,
   ip: string,
   limit = 30,
-  windowMs = 60_000
+  windowMs = 60_000,
+  cost = 1
 ): boolean {
   if (!stores.has(bucket)) {
     stores.set(bucket, new Map());
@@ -36,15 +38,18 @@ export function checkRateLimit(
   const record = store.get(ip);
 
   if (!record || now > record.resetTime) {
-    store.set(ip, { count: 1, resetTime: now + windowMs });
+    if (cost > limit) {
+      return false;
+    }
+    store.set(ip, { count: cost, resetTime: now + windowMs });
     return true;
   }
 
-  if (record.count >= limit) {
+  if (record.count + cost > limit) {
     return false;
   }
 
-  record.count++;
+  record.count += cost;
   return true;
 }
 
@@ -0,0 +1,59 @@
+/**
+ * Compact wire encoding for raw_times ("dv1"), sent by the desktop client
+ * as raw_times_packed instead of a JSON number array.
+ *
+ * Base64 of unsigned LEB128 varints, one per probe. 0 is a lost probe;
+ * anything else is zigzag(delta) + 1, where delta is the reply time in
+ * whole microseconds minus the previous reply's. Mirrors
+ * desktop/src/times_codec.py.
+ */
+
+// Encodings accepted for raw_times_packed, advertised in POST /api/results responses
+export const RAW_TIMES_ENCODINGS = ['dv1'];
+
+// Longest varint accepted: 5 bytes covers every delta within the 10 s reply limit
+const MAX_VARINT_BYTES = 5;
+
+/**
+ * Decode raw_times_packed into reply times in ms, with null for lost probes.
+ *
+ * @throws Error if the text is not valid base64 or ends mid-varint
+ */
+export function decodeRawTimes(packed: string): (number | null)[] {
+  if (!/^[A-Za-z0-9+/]*={0,2}$/.test(packed) || packed.length % 4 !== 0) {
+    throw new Error('raw_times_packed is not valid base64');
+  }
+  const bytes = Buffer.from(packed, 'base64');
+  const times: (number | null)[] = [];
+  let prev = 0;
+  let token = 0;
+  let scale = 1;
+  let length = 0;
+
+  for (const byte of bytes) {
+    // Arithmetic rather than bit operators, which would truncate to 32 bits
+    token += (byte & 0x7f) * scale;
+    length++;
+    if (byte & 0x80) {
+      if (length >= MAX_VARINT_BYTES) {
+        throw new Error('raw_times_packed has an oversized varint');
+      }
+      scale *= 128;
+      continue;
+    }
+    if (token === 0) {
+      times.push(null);
+    } else {
+      const zigzag = token - 1;
+      prev += zigzag % 2 === 0 ? zigzag / 2 : -(zigzag + 1) / 2;
+      times.push(prev / 1000);
+    }
+    token = 0;
+    scale = 1;
+    length = 0;
+  }
+  if (length) {
+    throw new Error('raw_times_packed ends mid-varint');
+  }
+  return times;
+}
@@ -1,4 +1,7 @@
 import { z } from 'zod';
+import { decodeRawTimes } from './raw-times';
+
+const RawTimesSchema = z.array(z.number().min(0).max(10000)).max(100);
 
 export const PingResultSchema = z.object({
   server_id: z.string().min(1).max(100),
@@ -8,7 +11,44 @@ export const PingResultSchema = z.object({
   ping_max: z.number().min(0).max(10000),
   jitter: z.number().min(0).max(1000),
   packet_loss: z.number().min(0).max(100),
-  raw_times: z.array(z.number().min(0).max(10000)).max(100),
+  raw_times: RawTimesSchema.optional(),
+  // raw_times in the compact encoding (lib/raw-times.ts), sent instead of raw_times
+  raw_times_packed: z.string().max(1000).optional(),
+}).transform(({ raw_times_packed, ...result }, ctx) => {
+  if (raw_times_packed === undefined) {
+    if (result.raw_times === undefined) {
+      ctx.addIssue({ code: 'custom', message: 'raw_times is required', path: ['raw_times'] });
+      return z.NEVER;
+    }
+    return { ...result, raw_times: result.raw_times, raw_times_lost: 0 };
+  }
+  if (result.raw_times !== undefined) {
+    ctx.addIssue({
+      code: 'custom',
+      message: 'Send raw_times or raw_times_packed, not both',
+      path: ['raw_times_packed'],
+    });
+    return z.NEVER;
+  }
+
+  let decoded: (number | null)[];
+  try {
+    decoded = decodeRawTimes(raw_times_packed);
+  } catch (error) {
+    ctx.addIssue({ code: 'custom', message: (error as Error).message, path: ['raw_times_packed'] });
+    return z.NEVER;
+  }
+  const times = decoded.filter((rtt): rtt is number => rtt !== null);
+  const checked = RawTimesSchema.safeParse(times);
+  if (!checked.success || decoded.length > 100) {
+    ctx.addIssue({
+      code: 'custom',
+      message: 'raw_times_packed holds more than 100 probes or a time outside 0-10000 ms',
+      path: ['raw_times_packed'],
+    });
+    return z.NEVER;
+  }
+  return { ...result, raw_times: times, raw_times_lost: decoded.length - times.length };
 });
 
 export const SubmitRequestSchema = z.object({
@@ -20,7 +60,15 @@ export const SubmitRequestSchema = z.object({
   ip_hash: z.string().max(64).default(''),
   client_version: z.string().max(20).default('unknown'),
   anonymous_id: z.string().max(100).default('anonymous'),
+  // Unix time the run was measured; queued uploads can arrive much later
+  tested_at: z.number().min(0).optional(),
+});
+
+// Several queued runs uploaded in one request by the desktop client
+export const BatchSubmitRequestSchema = z.object({
+  runs: z.array(SubmitRequestSchema).min(1).max(10),
 });
 
 export type PingResult = z.infer<typeof PingResultSchema>;
 export type SubmitRequest = z.infer<typeof SubmitRequestSchema>;
+export type BatchSubmitRequest = z.infer<typeof BatchSubmitRequestSchema>;